@@ -0,0 +1,222 @@
+// Benchmark for the compressed animation format and its sampler. Each case selects
+// keyframes for a clip (synthetic, or a CSV file or clip given with --clips), writes the
+// reduced clip with CompressedAnimationWriter, reads it back and records:
+//
+//   - the compression ratio, against the poses as float32
+//   - decode throughput: curve values per second from CurveSampler, at every frame in
+//     order and at shuffled fractional times
+//   - reconstruction error against the source poses at every frame (largest and RMS),
+//     and how much of it is quantization: the largest difference from the same cubics
+//     evaluated without quantization
+//
+// The results are written as JSON. Each case's file is written to --scratch (by default in
+// the working directory) and removed at the end.
+//
+// Usage: compressionBenchmark [--preset quick|full] [--clips a.csv,b.spclip,...]
+//                             [--keyframes fraction] [--output path] [--scratch path]
+//                             [--seed n] [--threads n]
+
+#include <math.h>
+#include <algorithm>
+#include <chrono>
+#include <iostream>
+#include <map>
+#include <random>
+#include <sstream>
+#include <string>
+#include <vector>
+
+#include "../src/AnimationProxy.hpp"
+#include "../src/CompressedAnimation.hpp"
+#include "../src/Interpolator.hpp"
+#include "../src/SelectionManager.hpp"
+#include "../src/common.hpp"
+#include "SyntheticMotion.hpp"
+
+// Keyframes are selected with line error in a banded table, which is quick for any length
+#define SELECTION_MAX_SPAN 100
+
+// Each throughput is measured over at least this long
+#define DECODE_SECONDS 0.25
+
+typedef std::chrono::steady_clock Clock;
+
+static double secondsSince(Clock::time_point start) {
+	return std::chrono::duration<double>(Clock::now() - start).count();
+}
+
+// The value of a fitted cubic at a time, in double precision and without quantization:
+// the parameter is found by bisection, as the cubic's time is increasing
+static double exactValue(const HighDimCubic& cubic, double time) {
+	double lo = 0.0, hi = 1.0;
+	for (int i = 0; i < 60; i++) {
+		double u = 0.5 * (lo + hi);
+		double oneSubU = 1.0 - u;
+		double x = cubic.p1[0] * oneSubU * oneSubU * oneSubU + 3.0 * cubic.p2[0] * oneSubU * oneSubU * u + 3.0 * cubic.p3[0] * oneSubU * u * u + cubic.p4[0] * u * u * u;
+		if (x < time) { lo = u; } else { hi = u; }
+	}
+	double u = 0.5 * (lo + hi);
+	double oneSubU = 1.0 - u;
+	return cubic.p1[1] * oneSubU * oneSubU * oneSubU + 3.0 * cubic.p2[1] * oneSubU * oneSubU * u + 3.0 * cubic.p3[1] * oneSubU * u * u + cubic.p4[1] * u * u * u;
+}
+
+// Curve values decoded per second, sampling every curve at the given times
+static double samplesPerSecond(const CompressedClip& clip, const std::vector<float>& times, std::vector<float>& values) {
+	long long nSamples = 0;
+	Clock::time_point start = Clock::now();
+	double seconds = 0.0;
+	while (seconds < DECODE_SECONDS) {
+		CurveSampler::sample(clip, times.data(), static_cast<int>(times.size()), values.data());
+		nSamples += static_cast<long long>(times.size()) * clip.nCurves;
+		seconds = secondsSince(start);
+	}
+	return nSamples / seconds;
+}
+
+static JSONObject run(std::string name, const Eigen::MatrixXf& poses, double keyframeFraction, unsigned int seed, int nThreads, std::string path) {
+	int nFrames = static_cast<int>(poses.cols());
+	int nCurves = static_cast<int>(poses.rows()) - 1;
+	int nKeyframes = std::max(2, static_cast<int>(nFrames * keyframeFraction));
+
+	Clock::time_point start = Clock::now();
+	SelectionManager manager("line", AnimationProxy(poses), std::vector<int>(), SELECTION_MAX_SPAN, NULL, nThreads);
+	manager.incrementUntilNKeyframes(nKeyframes);
+	SelectionProxy selections = manager.getFinalSelectionProxy();
+	std::vector<int> keyframes = selections.getSelectionByNKeyframes(std::min(std::max(nKeyframes, selections.getMinKeyframes()), selections.getMaxKeyframes()));
+	double selectSeconds = secondsSince(start);
+
+	start = Clock::now();
+	std::vector<HighDimCubic> cubics = Interpolate::optimalForEachCurve(poses, keyframes, nThreads);
+	double fitSeconds = secondsSince(start);
+
+	start = Clock::now();
+	{
+		CompressedAnimationWriter writer(path);
+		writer.addEncoded(name, CompressedClip::encode(poses, keyframes, cubics));
+		writer.close();
+	}
+	double encodeSeconds = secondsSince(start);
+
+	CompressedAnimation compressed(path);
+	JSONObject result;
+	result.set("name", name);
+	result.set("frames", nFrames);
+	result.set("curves", nCurves);
+	result.set("keyframes", static_cast<int>(keyframes.size()));
+	if (!compressed.isOpen() || compressed.nClips() != 1) {
+		result.set("failed", "the compressed clip could not be read back");
+		return result;
+	}
+	const CompressedClip& clip = compressed.clip(0);
+
+	// Every frame in order, as for playback, and fractional times in any order, as for
+	// blending and retiming
+	std::vector<float> frames(nFrames);
+	for (int f = 0; f < nFrames; f++) { frames[f] = poses(0, f); }
+	std::vector<float> shuffled(nFrames);
+	std::mt19937 rng(seed);
+	std::uniform_real_distribution<float> between(poses(0, 0), poses(0, nFrames - 1));
+	for (int f = 0; f < nFrames; f++) { shuffled[f] = between(rng); }
+	std::vector<float> values(static_cast<size_t>(nFrames) * nCurves);
+	double randomRate = samplesPerSecond(clip, shuffled, values);
+	double sequentialRate = samplesPerSecond(clip, frames, values);
+
+	// The last pass sampled every frame, which is compared with the source and with the
+	// unquantized cubics
+	int nSpans = static_cast<int>(keyframes.size()) - 1;
+	double maxError = 0.0, sumSquared = 0.0, maxQuantization = 0.0;
+	for (int c = 0; c < nCurves; c++) {
+		int s = 0;
+		for (int f = 0; f < nFrames; f++) {
+			while (s < nSpans - 1 && f > keyframes[s + 1]) { s++; }
+			double value = values[static_cast<size_t>(f) * nCurves + c];
+			double error = fabs(value - poses(c + 1, f));
+			maxError = std::max(maxError, error);
+			sumSquared += error * error;
+			maxQuantization = std::max(maxQuantization, fabs(value - exactValue(cubics[c * nSpans + s], frames[f])));
+		}
+	}
+
+	size_t sourceBytes = poses.size() * sizeof(float);
+	result.set("sourceBytes", static_cast<long long>(sourceBytes));
+	result.set("compressedBytes", static_cast<long long>(compressed.size()));
+	result.set("ratio", sourceBytes / double(compressed.size()));
+	result.set("selectSeconds", selectSeconds);
+	result.set("fitSeconds", fitSeconds);
+	result.set("encodeSeconds", encodeSeconds);
+	result.set("sequentialSamplesPerSecond", sequentialRate);
+	result.set("randomSamplesPerSecond", randomRate);
+	result.set("maxError", maxError);
+	result.set("rmsError", sqrt(sumSquared / std::max<size_t>(values.size(), 1)));
+	result.set("quantizationMaxError", maxQuantization);
+	return result;
+}
+
+int main(int argc, const char* argv[]) {
+	std::map<std::string, std::string> options;
+	for (int i = 1; i + 1 < argc; i += 2) {
+		std::string arg = argv[i];
+		if (arg.compare(0, 2, "--") != 0) {
+			std::cerr << "Unexpected argument `" << arg << "`" << std::endl;
+			std::cerr << "Usage: compressionBenchmark [--preset quick|full] [--clips path,...] [--keyframes fraction] [--output path] [--scratch path] [--seed n] [--threads n]" << std::endl;
+			return 1;
+		}
+		options[arg.substr(2)] = argv[i + 1];
+	}
+	std::string preset = options.count("preset") ? options["preset"] : "quick";
+	std::string output = options.count("output") ? options["output"] : "";
+	double keyframeFraction = options.count("keyframes") ? std::stod(options["keyframes"]) : 0.1;
+	unsigned int seed = options.count("seed") ? static_cast<unsigned int>(std::stoul(options["seed"])) : 1;
+	int nThreads = options.count("threads") ? std::stoi(options["threads"]) : 0;
+	std::string path = options.count("scratch") ? options["scratch"] : std::string("compressionBenchmark") + COMPRESSED_EXTENSION;
+
+	// Clips given on the command line, or synthetic ones of the preset's sizes
+	std::vector<std::string> names;
+	std::vector<Eigen::MatrixXf> clips;
+	if (options.count("clips")) {
+		std::istringstream clipList(options["clips"]);
+		std::string clipPath;
+		while (std::getline(clipList, clipPath, ',')) {
+			AnimationProxy anim = AnimationProxy::load(clipPath);
+			if (anim.getNFrames() < 2) { return 1; }
+			names.push_back(clipPath);
+			clips.push_back(anim.data);
+		}
+	} else {
+		int sizes[][2] = { { 500, 12 }, { 2000, 48 }, { 5000, 48 }, { 20000, 48 }, { 2000, 600 } };
+		int nSizes = preset == "full" ? 5 : 2;
+		for (int i = 0; i < nSizes; i++) {
+			std::ostringstream os;
+			os << "synthetic-" << sizes[i][0] << "f-" << sizes[i][1] << "d";
+			names.push_back(os.str());
+			clips.push_back(SyntheticMotion::generate(sizes[i][0], sizes[i][1], seed));
+		}
+	}
+
+	std::vector<JSONObject> results;
+	for (size_t i = 0; i < clips.size(); i++) {
+		std::cerr << "[" << (i + 1) << "/" << clips.size() << "] " << names[i] << "... " << std::flush;
+		JSONObject result = run(names[i], clips[i], keyframeFraction, seed, nThreads, path);
+		std::cerr << result.str() << std::endl;
+		results.push_back(result);
+	}
+	remove(path.c_str());
+
+	JSONObject report;
+	report.set("suite", "compression");
+	report.set("preset", preset);
+	report.set("seed", static_cast<int>(seed));
+	report.set("threads", nThreads);
+	report.set("keyframeFraction", keyframeFraction);
+	report.setRaw("cases", JSONObject::array(results));
+
+	if (output.length() > 0) {
+		if (File::writeStringToFile(output, report.str() + "\n") != 0) {
+			std::cerr << "Failed to write the results to `" << output << "`" << std::endl;
+			return 1;
+		}
+	} else {
+		std::cout << report.str() << std::endl;
+	}
+	return 0;
+}
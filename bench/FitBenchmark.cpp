@@ -0,0 +1,69 @@
+// Micro-benchmark for the cubic fitting kernel: fits per second by dimensionality,
+// for the reference fit (as used by Interpolate) and the warm-started fit (as used to
+// fill curve error tables).
+//
+// Usage: fitBenchmark [seconds per case, default 0.5]
+
+#include <chrono>
+#include <iostream>
+#include <iomanip>
+#include <stdlib.h>
+
+#include "../src/CubicFitter.hpp"
+#include "SyntheticMotion.hpp"
+
+#define N_FRAMES 600
+
+typedef std::chrono::steady_clock Clock;
+
+static double secondsSince(Clock::time_point start) {
+	return std::chrono::duration<double>(Clock::now() - start).count();
+}
+
+static double referenceFitsPerSecond(const Eigen::MatrixXf& data, double budget) {
+	CubicFitter fitter(static_cast<int>(data.rows()));
+	long nFits = 0;
+	float sink = 0.0f;
+	Clock::time_point start = Clock::now();
+	while (secondsSince(start) < budget) {
+		for (int span = 5; span < 80; span += 5) {
+			int from = static_cast<int>(nFits % (N_FRAMES - span));
+			sink += fitter.fit(data, from, from + span).p2[0];
+			nFits++;
+		}
+	}
+	if (sink == 12345.0f) { std::cout << ""; }
+	return nFits / secondsSince(start);
+}
+
+static double warmFitsPerSecond(const Eigen::MatrixXf& data, double budget) {
+	CubicFitter fitter(static_cast<int>(data.rows()));
+	long nFits = 0;
+	float sink = 0.0f;
+	Clock::time_point start = Clock::now();
+	while (secondsSince(start) < budget) {
+		int from = static_cast<int>(nFits % (N_FRAMES - 100));
+		for (int to = from + 4; to < from + 100; to++) {
+			bool coldStart = to == from + 4;
+			fitter.fitSpan(data, from, to, coldStart ? FITTING_ITERATIONS : 2, coldStart);
+			sink += fitter.spanError(from, to).second;
+			nFits++;
+		}
+	}
+	if (sink == 12345.0f) { std::cout << ""; }
+	return nFits / secondsSince(start);
+}
+
+int main(int argc, const char* argv[]) {
+	double budget = argc > 1 ? atof(argv[1]) : 0.5;
+	int dims[] = { 2, 3, 12, 48, 192, 600 };
+
+	std::cout << std::setw(8) << "dims" << std::setw(20) << "reference fits/s" << std::setw(20) << "warm fits/s" << std::endl;
+	for (int i = 0; i < 6; i++) {
+		Eigen::MatrixXf data = SyntheticMotion::generate(N_FRAMES, dims[i], 7);
+		std::cout << std::setw(8) << dims[i];
+		std::cout << std::setw(20) << std::fixed << std::setprecision(0) << referenceFitsPerSecond(data, budget);
+		std::cout << std::setw(20) << std::fixed << std::setprecision(0) << warmFitsPerSecond(data, budget) << std::endl;
+	}
+	return 0;
+}
@@ -0,0 +1,220 @@
+// Benchmark suite for the selection and reduction core. Each case generates a synthetic
+// clip, then times the three phases of a selection: building the error tables (the
+// SelectionManager constructor), selecting keyframes, and fitting every curve between
+// the selected keyframes. The results are written as JSON, for bench/compare.py.
+//
+// With --decimate, each case is also selected coarse to fine (MultiresolutionSelector) at
+// each of the given decimation factors, recording the time taken and how far the errors
+// of its selections are above the exact ones, as fractions of the exact errors: the
+// largest and mean gap over every number of keyframes, and the gap at the number used to
+// time the fits.
+//
+// Usage: selectionBenchmark [--preset quick|full] [--output path] [--seed n] [--threads n]
+//                           [--decimate factor,factor,...]
+//
+// Cases run from smallest to largest, so each case's peak memory (the process's high-water
+// mark when it finishes) is close to what that case needed on its own.
+
+#include <algorithm>
+#include <chrono>
+#include <iostream>
+#include <map>
+#include <sstream>
+#include <string>
+#include <vector>
+
+#include "../src/AnimationProxy.hpp"
+#include "../src/Interpolator.hpp"
+#include "../src/MultiresolutionSelector.hpp"
+#include "../src/SelectionManager.hpp"
+#include "../src/common.hpp"
+#include "SyntheticMotion.hpp"
+
+// Clips longer than this use a banded error table, as a dense one would not fit in memory
+#define BANDED_FROM_FRAMES 2000
+#define BANDED_MAX_SPAN 300
+
+typedef std::chrono::steady_clock Clock;
+
+static double secondsSince(Clock::time_point start) {
+	return std::chrono::duration<double>(Clock::now() - start).count();
+}
+
+class BenchmarkCase {
+public:
+	BenchmarkCase(int nFrames, int nDims, std::string errorType, bool withFixed) :
+		nFrames(nFrames), nDims(nDims), errorType(errorType), withFixed(withFixed) {}
+
+	std::string name() const {
+		std::ostringstream os;
+		os << errorType << "-" << nFrames << "f-" << nDims << "d" << (withFixed ? "-fixed" : "");
+		return os.str();
+	}
+
+	int nFrames;
+	int nDims;
+	std::string errorType;
+	bool withFixed;
+};
+
+// The quick preset is small enough to run on every change; the full preset covers
+// 500 to 20,000 frames and 3 to 600 dimensions. Curve error on long, wide clips is left
+// out of both, as each such case would take many minutes.
+static std::vector<BenchmarkCase> casesFor(std::string preset) {
+	std::vector<int> frames, dims;
+	if (preset == "full") {
+		int f[] = { 500, 2000, 5000, 20000 }; frames.assign(f, f + 4);
+		int d[] = { 3, 48, 600 }; dims.assign(d, d + 3);
+	} else {
+		int f[] = { 500, 2000 }; frames.assign(f, f + 2);
+		int d[] = { 3, 12 }; dims.assign(d, d + 2);
+	}
+
+	std::vector<BenchmarkCase> cases;
+	for (size_t fi = 0; fi < frames.size(); fi++) {
+		for (size_t di = 0; di < dims.size(); di++) {
+			const char* errorTypes[] = { "line", "curve" };
+			for (int e = 0; e < 2; e++) {
+				if (e == 1 && frames[fi] * static_cast<double>(dims[di]) > 5000.0 * 48.0) { continue; }
+				cases.push_back(BenchmarkCase(frames[fi], dims[di], errorTypes[e], false));
+				cases.push_back(BenchmarkCase(frames[fi], dims[di], errorTypes[e], true));
+			}
+		}
+	}
+	return cases;
+}
+
+// How far the coarse-to-fine selections' errors are above the exact ones
+static JSONObject runMultiresolution(const BenchmarkCase& c, AnimationProxy anim, std::vector<int> fixedKeyframes, int maxSpan, int nKeyframes, int nThreads, SelectionProxy& exact, double exactSeconds, int factor) {
+	Clock::time_point start = Clock::now();
+	MultiresolutionSelector multiresolution(c.errorType, anim, fixedKeyframes, factor, 0, maxSpan, NULL, nThreads);
+	SelectionProxy selections = multiresolution.select(nKeyframes);
+	double seconds = secondsSince(start);
+
+	double maxGap = 0.0, sumGap = 0.0, finalGap = 0.0;
+	int nCompared = 0;
+	int from = std::max(exact.getMinKeyframes(), selections.getMinKeyframes());
+	int to = std::min(exact.getMaxKeyframes(), selections.getMaxKeyframes());
+	for (int n = from; n <= to; n++) {
+		double exactError = exact.getErrorByNKeyframes(n);
+		if (exactError <= 0.0) { continue; }
+		double gap = (selections.getErrorByNKeyframes(n) - exactError) / exactError;
+		maxGap = std::max(maxGap, gap);
+		sumGap += gap;
+		nCompared += 1;
+		if (n == nKeyframes) { finalGap = gap; }
+	}
+
+	JSONObject result = multiresolution.toJSON();
+	result.set("seconds", seconds);
+	result.set("speedup", seconds > 0.0 ? exactSeconds / seconds : 0.0);
+	result.set("compared", nCompared);
+	result.set("maxGap", maxGap);
+	result.set("meanGap", nCompared > 0 ? sumGap / nCompared : 0.0);
+	result.set("finalGap", finalGap);
+	return result;
+}
+
+static JSONObject run(const BenchmarkCase& c, unsigned int seed, int nThreads, const std::vector<int>& factors) {
+	AnimationProxy anim(SyntheticMotion::generate(c.nFrames, c.nDims, seed));
+	int maxSpan = c.nFrames > BANDED_FROM_FRAMES ? BANDED_MAX_SPAN : 0;
+	int nKeyframes = std::max(10, c.nFrames / 50);
+
+	// Five evenly spaced fixed keyframes split the clip into six segments
+	std::vector<int> fixedKeyframes;
+	if (c.withFixed) {
+		for (int k = 1; k <= 5; k++) { fixedKeyframes.push_back(k * (c.nFrames - 1) / 6); }
+	}
+
+	Clock::time_point start = Clock::now();
+	SelectionManager manager(c.errorType, anim, fixedKeyframes, maxSpan, NULL, nThreads);
+	double tableSeconds = secondsSince(start);
+
+	start = Clock::now();
+	manager.incrementUntilNKeyframes(nKeyframes);
+	double selectSeconds = secondsSince(start);
+
+	SelectionProxy selections = manager.getFinalSelectionProxy();
+	std::vector<int> keyframes = selections.getSelectionByNKeyframes(std::max(nKeyframes, selections.getMinKeyframes()));
+
+	start = Clock::now();
+	std::vector<HighDimCubic> cubics = Interpolate::optimalForEachCurve(anim.data, keyframes, nThreads);
+	double interpolateSeconds = secondsSince(start);
+
+	JSONObject result;
+	result.set("name", c.name());
+	result.set("frames", c.nFrames);
+	result.set("dims", c.nDims);
+	result.set("errorType", c.errorType);
+	result.set("fixedKeyframes", static_cast<int>(fixedKeyframes.size()));
+	result.set("maxSpan", maxSpan);
+	result.set("keyframes", static_cast<int>(keyframes.size()));
+	result.set("cubics", static_cast<int>(cubics.size()));
+	result.set("finalError", static_cast<double>(selections.getErrorByNKeyframes(static_cast<int>(keyframes.size()))));
+	result.set("tableSeconds", tableSeconds);
+	result.set("selectSeconds", selectSeconds);
+	result.set("interpolateSeconds", interpolateSeconds);
+	result.set("peakMemoryMB", OS::peakMemoryBytes() / (1024.0 * 1024.0));
+
+	// After the peak memory is taken, so the exact selection's figures are not affected
+	if (!factors.empty()) {
+		std::vector<JSONObject> multiresolution;
+		for (size_t f = 0; f < factors.size(); f++) {
+			multiresolution.push_back(runMultiresolution(c, anim, fixedKeyframes, maxSpan, nKeyframes, nThreads, selections, tableSeconds + selectSeconds, factors[f]));
+		}
+		result.setRaw("multiresolution", JSONObject::array(multiresolution));
+	}
+	return result;
+}
+
+int main(int argc, const char* argv[]) {
+	std::map<std::string, std::string> options;
+	for (int i = 1; i + 1 < argc; i += 2) {
+		std::string arg = argv[i];
+		if (arg.compare(0, 2, "--") != 0) {
+			std::cerr << "Unexpected argument `" << arg << "`" << std::endl;
+			std::cerr << "Usage: selectionBenchmark [--preset quick|full] [--output path] [--seed n] [--threads n] [--decimate factor,...]" << std::endl;
+			return 1;
+		}
+		options[arg.substr(2)] = argv[i + 1];
+	}
+	std::string preset = options.count("preset") ? options["preset"] : "quick";
+	std::string output = options.count("output") ? options["output"] : "";
+	unsigned int seed = options.count("seed") ? static_cast<unsigned int>(std::stoul(options["seed"])) : 1;
+	int nThreads = options.count("threads") ? std::stoi(options["threads"]) : 0;
+	std::vector<int> factors;
+	if (options.count("decimate")) {
+		std::istringstream factorList(options["decimate"]);
+		std::string factor;
+		while (std::getline(factorList, factor, ',')) {
+			if (!factor.empty()) { factors.push_back(std::stoi(factor)); }
+		}
+	}
+
+	std::vector<BenchmarkCase> cases = casesFor(preset);
+	std::vector<JSONObject> results;
+	for (size_t i = 0; i < cases.size(); i++) {
+		std::cerr << "[" << (i + 1) << "/" << cases.size() << "] " << cases[i].name() << "... " << std::flush;
+		JSONObject result = run(cases[i], seed, nThreads, factors);
+		std::cerr << result.str() << std::endl;
+		results.push_back(result);
+	}
+
+	JSONObject report;
+	report.set("suite", "selection");
+	report.set("preset", preset);
+	report.set("seed", static_cast<int>(seed));
+	report.set("threads", nThreads);
+	report.setRaw("decimate", JSONObject::array(factors));
+	report.setRaw("cases", JSONObject::array(results));
+
+	if (output.length() > 0) {
+		if (File::writeStringToFile(output, report.str() + "\n") != 0) {
+			std::cerr << "Failed to write the results to `" << output << "`" << std::endl;
+			return 1;
+		}
+	} else {
+		std::cout << report.str() << std::endl;
+	}
+	return 0;
+}
@@ -0,0 +1,36 @@
+#pragma once
+
+#include <math.h>
+#include <random>
+
+#include "../eigen-git-mirror/Eigen/Dense"
+
+// Motion-capture-like test data: each dimension is a sum of a few sinusoids with
+// random amplitudes, frequencies and phases, plus a little sensor noise. The first
+// dimension is the frame number, as it is for data sampled by the plug-in.
+class SyntheticMotion {
+public:
+	static Eigen::MatrixXf generate(int nFrames, int nDims, unsigned int seed) {
+		std::mt19937 rng(seed);
+		std::uniform_real_distribution<float> unit(0.0f, 1.0f);
+		std::normal_distribution<float> noise(0.0f, 0.02f);
+
+		Eigen::MatrixXf data(nDims, nFrames);
+		for (int f = 0; f < nFrames; f++) { data(0, f) = static_cast<float>(f); }
+
+		for (int d = 1; d < nDims; d++) {
+			float amplitudes[3], frequencies[3], phases[3];
+			for (int h = 0; h < 3; h++) {
+				amplitudes[h] = 10.0f * unit(rng) / (h + 1);
+				frequencies[h] = (0.01f + 0.08f * unit(rng)) * (h + 1);
+				phases[h] = 6.2831853f * unit(rng);
+			}
+			for (int f = 0; f < nFrames; f++) {
+				float v = 0.0f;
+				for (int h = 0; h < 3; h++) { v += amplitudes[h] * sinf(frequencies[h] * f + phases[h]); }
+				data(d, f) = v + noise(rng);
+			}
+		}
+		return data;
+	}
+};
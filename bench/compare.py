@@ -0,0 +1,80 @@
+"""
+Compare two runs of selectionBenchmark and flag regressions.
+
+    python compare.py baseline.json current.json [--threshold 0.15] [--min-seconds 0.05]
+
+A case regresses when one of its phases takes longer than the baseline by more
+than the threshold (as a fraction), or its peak memory grows by more than the
+threshold. Phases faster than --min-seconds in both runs are ignored, as their
+timings are mostly noise. Exits with 1 when anything regressed.
+"""
+
+import argparse
+import json
+import sys
+
+
+PHASES = ["tableSeconds", "selectSeconds", "interpolateSeconds"]
+
+
+def load_cases(path):
+    with open(path) as f:
+        report = json.load(f)
+    return dict((case["name"], case) for case in report["cases"])
+
+
+def compare(baseline, current, threshold, min_seconds):
+    regressions = []
+    rows = []
+    for name in sorted(current):
+        if name not in baseline:
+            rows.append((name, "new case", ""))
+            continue
+        before = baseline[name]
+        after = current[name]
+
+        for phase in PHASES:
+            old, new = before[phase], after[phase]
+            if max(old, new) < min_seconds:
+                continue
+            change = (new - old) / old if old > 0 else float("inf")
+            flag = "REGRESSION" if change > threshold else ""
+            rows.append((name, "%s %.3fs -> %.3fs (%+.0f%%)" % (phase, old, new, change * 100), flag))
+            if flag:
+                regressions.append((name, phase))
+
+        old, new = before["peakMemoryMB"], after["peakMemoryMB"]
+        change = (new - old) / old if old > 0 else 0.0
+        flag = "REGRESSION" if change > threshold else ""
+        rows.append((name, "peakMemoryMB %.1f -> %.1f (%+.0f%%)" % (old, new, change * 100), flag))
+        if flag:
+            regressions.append((name, "peakMemoryMB"))
+
+    for name in sorted(set(baseline) - set(current)):
+        rows.append((name, "missing from the current run", ""))
+
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flag regressions between two selectionBenchmark runs")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    parser.add_argument("--min-seconds", type=float, default=0.05)
+    args = parser.parse_args()
+
+    rows, regressions = compare(load_cases(args.baseline), load_cases(args.current), args.threshold, args.min_seconds)
+    width = max([len(row[0]) for row in rows] + [0])
+    for name, detail, flag in rows:
+        print("%s  %s  %s" % (name.ljust(width), detail, flag))
+
+    if regressions:
+        print("\n%d regression(s) beyond %.0f%%" % (len(regressions), args.threshold * 100))
+        return 1
+    print("\nNo regressions beyond %.0f%%" % (args.threshold * 100))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
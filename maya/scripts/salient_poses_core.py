@@ -0,0 +1,555 @@
+"""
+Salient Poses' keyframe selection in NumPy, for pipelines and tests that run
+without Maya or the plug-in.
+
+This mirrors the plug-in's core: ErrorTable.usingLineBasedError and
+usingCurveBasedError (the same engines, fits and warm starts), the Selector's
+dynamic programme, SelectionManager's split at the fixed keyframes and its
+sharing of keyframes between the segments, and Interpolate::optimal. Poses are
+given as a frames x dims array, each led by its frame number as salientSample
+returns them (or as the first column of the command-line tool's CSV files), and
+select() returns the {n_keyframes: {"selection": [...], "error": e}} form the
+GUI works with.
+
+The work is vectorised over blocks of spans; the only Python loops are over
+blocks, over tiles of the poses inside long spans, over the positions of a
+warm-start chain, over sample indices of a curve, and over numbers of
+keyframes. Errors are computed in double precision
+and kept as float32, as the plug-in keeps them, so selections match the
+plug-in's except where two spans' errors differ in the last bit.
+"""
+
+import heapq
+
+import numpy as np
+
+
+SAMPLES_PER_CURVE = 10
+FITTING_ITERATIONS = 4
+FITTING_RESOLUTION = 100
+COARSE_STEPS = 16
+NEWTON_STEPS = 8
+CURVE_WARM_START_SPANS = 32
+CURVE_COLD_ITERATIONS = FITTING_ITERATIONS
+CURVE_WARM_ITERATIONS = 2
+CURVE_WARM_MARGIN = 1.25
+
+# Each scratch array is kept to about this many elements, by working in blocks of spans
+# (and, for the line-based error, tiles of the poses inside them)
+BLOCK_ELEMENTS = 1 << 22
+
+SAMPLE_PARAMETERS = np.arange(SAMPLES_PER_CURVE) / float(SAMPLES_PER_CURVE - 1)
+SAMPLE_POWERS = np.stack([SAMPLE_PARAMETERS ** p for p in range(4)])
+
+
+def bernstein(u):
+    """
+    The cubic Bernstein weights at each parameter in u, along a new last axis
+    """
+    one_sub_u = 1.0 - u
+    return np.stack([
+        one_sub_u * one_sub_u * one_sub_u,
+        3.0 * one_sub_u * one_sub_u * u,
+        3.0 * one_sub_u * u * u,
+        u * u * u
+    ], axis=-1)
+
+
+GRID_BASIS = bernstein(np.arange(FITTING_RESOLUTION) / float(FITTING_RESOLUTION - 1))
+
+
+class SpanFits(object):
+    """
+    Cubics fitted to a batch of spans (from, to) of one animation at once,
+    mirroring CubicFitter: every array has the batch as its first axis
+    """
+    def __init__(self, poses, starts, ends):
+        self.poses = poses
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.origin = poses[self.starts]
+        self.targets = self.sample_at(self.starts[:, None] + (self.ends - self.starts)[:, None] * SAMPLE_PARAMETERS[None, :])
+        self.parameters = np.tile(SAMPLE_PARAMETERS, (len(self.starts), 1))
+        self.control = None
+
+    def sample_at(self, x):
+        """
+        The poses at (fractional) frames x, interpolated linearly, relative to
+        each span's first pose
+        """
+        left = np.floor(x).astype(np.int64)
+        right = np.ceil(x).astype(np.int64)
+        t = (x - left)[..., None]
+        return self.poses[left] * (1.0 - t) + self.poses[right] * t - self.origin[:, None, :]
+
+    def solve_control_points(self):
+        samples = self.sample_at(self.starts[:, None] + (self.ends - self.starts)[:, None] * self.parameters)
+        c0 = samples[:, 0]
+        c3 = samples[:, -1]
+
+        # Least-squares solve for the inner control points via the 2x2 normal equations
+        weights = bernstein(self.parameters)
+        n00 = np.zeros(len(self.starts))
+        n01 = np.zeros(len(self.starts))
+        n11 = np.zeros(len(self.starts))
+        rhs0 = np.zeros_like(c0)
+        rhs1 = np.zeros_like(c0)
+        for s in range(SAMPLES_PER_CURVE):
+            b0, b1, b2, b3 = [weights[:, s, k] for k in range(4)]
+            n00 += b1 * b1
+            n01 += b1 * b2
+            n11 += b2 * b2
+            rest = samples[:, s] - b0[:, None] * c0 - b3[:, None] * c3
+            rhs0 += b1[:, None] * rest
+            rhs1 += b2[:, None] * rest
+
+        det = n00 * n11 - n01 * n01
+        solvable = np.abs(det) > 1e-12
+        safe = np.where(solvable, det, 1.0)
+        a, b, c = n11 / safe, -n01 / safe, n00 / safe
+        c1 = a[:, None] * rhs0 + b[:, None] * rhs1
+        c2 = b[:, None] * rhs0 + c[:, None] * rhs1
+        c1 = np.where(solvable[:, None], c1, c0 + (c3 - c0) / 3.0)
+        c2 = np.where(solvable[:, None], c2, c0 + (c3 - c0) * (2.0 / 3.0))
+        self.control = np.stack([c0, c1, c2, c3], axis=1)
+
+    def coefficients(self):
+        c0, c1, c2, c3 = [self.control[:, k] for k in range(4)]
+        return np.stack([
+            c0,
+            3.0 * (c1 - c0),
+            3.0 * (c0 - 2.0 * c1 + c2),
+            c3 - c0 + 3.0 * (c1 - c2)
+        ], axis=1)
+
+    def fit(self):
+        """
+        The reference fit (CubicFitter::fit): each sample moves to the closest
+        step of the reparameterisation grid
+        """
+        for _ in range(FITTING_ITERATIONS):
+            self.solve_control_points()
+            grid = np.einsum("gk,bkd->bgd", GRID_BASIS, self.control)
+            distances = ((grid[:, None, :, :] - self.targets[:, :, None, :]) ** 2).sum(axis=-1)
+            self.parameters = np.argmin(distances, axis=-1) / float(FITTING_RESOLUTION - 1)
+
+    def fit_spans(self, iterations, cold_start):
+        """
+        The fast fit (CubicFitter::fitSpan): each sample moves by Newton's
+        method, starting from the best of a coarse grid on a cold start
+        """
+        if cold_start:
+            self.parameters = np.tile(SAMPLE_PARAMETERS, (len(self.starts), 1))
+
+        for _ in range(iterations):
+            self.solve_control_points()
+            k = self.coefficients()
+            gram = np.einsum("bid,bjd->bij", k, k)
+            projections = np.einsum("bid,bsd->bsi", k, self.targets)
+            u = self.parameters
+
+            if cold_start:
+                best = distance_term(gram, projections, u)
+                for step in range(COARSE_STEPS):
+                    candidate = step / (COARSE_STEPS - 1.0)
+                    value = distance_term(gram, projections, np.full_like(u, candidate))
+                    better = value < best
+                    best = np.where(better, value, best)
+                    u = np.where(better, candidate, u)
+
+            active = np.ones(u.shape, dtype=bool)
+            for _ in range(NEWTON_STEPS):
+                d1, d2 = distance_derivatives(gram, projections, u)
+                step = active & (d2 > 1e-12)
+                following = np.clip(u - d1 / np.where(step, d2, 1.0), 0.0, 1.0)
+                converged = np.abs(following - u) < 1e-9
+                u = np.where(step, following, u)
+                active = step & ~converged
+            self.parameters = u
+
+    def fit_spans_guarded(self, warm_iterations, cold_iterations, margin):
+        """
+        The warm-started fit with a safeguard (CubicFitter::fitSpanGuarded):
+        spans whose warm fit has more than margin times the error of the cubic
+        through the evenly spaced samples are refitted cold, keeping the better
+        fit. Returns span_errors() of the fits kept
+        """
+        self.fit_spans(warm_iterations, False)
+        frames, values = self.span_errors()
+        warm_control = self.control
+        warm_parameters = self.parameters
+
+        self.parameters = np.tile(SAMPLE_PARAMETERS, (len(self.starts), 1))
+        self.solve_control_points()
+        even = self.span_errors()[1]
+        self.control = warm_control
+        self.parameters = warm_parameters
+
+        poor = np.flatnonzero(values.astype(np.float64) > margin * even.astype(np.float64))
+        if len(poor) == 0:
+            return frames, values
+        cold = SpanFits(self.poses, self.starts[poor], self.ends[poor])
+        cold.fit_spans(cold_iterations, True)
+        cold_frames, cold_values = cold.span_errors()
+        taken = cold_values <= values[poor]
+        better = poor[taken]
+        self.control[better] = cold.control[taken]
+        self.parameters[better] = cold.parameters[taken]
+        frames[better] = cold_frames[taken]
+        values[better] = cold_values[taken]
+        return frames, values
+
+    def span_errors(self):
+        """
+        The sum of squared distances between each cubic and its span's evenly
+        spaced samples, and the frame closest to the furthest sample
+        """
+        fitted = np.einsum("bkd,ks->bsd", self.coefficients(), SAMPLE_POWERS) - self.targets
+        distances = (fitted ** 2).sum(axis=-1)
+        total = np.zeros(len(self.starts))
+        for s in range(SAMPLES_PER_CURVE):
+            total += distances[:, s]
+        furthest = np.argmax(distances, axis=-1)
+        frames = np.floor(self.starts + (self.ends - self.starts) * SAMPLE_PARAMETERS[furthest] + 0.5).astype(np.int32)
+        frames = np.where(distances.max(axis=-1) > 0.0, frames, -1)
+        return frames, total.astype(np.float32)
+
+    def cubics(self):
+        """
+        The fitted control points, one (4, dims) array per span
+        """
+        return list((self.control + self.origin[:, None, :]).astype(np.float32))
+
+
+def distance_term(gram, projections, u):
+    p = np.stack([np.ones_like(u), u, u * u, u * u * u], axis=-1)
+    gp = np.einsum("bij,bsj->bsi", gram, p)
+    return (p * gp).sum(axis=-1) - 2.0 * (projections * p).sum(axis=-1)
+
+
+def distance_derivatives(gram, projections, u):
+    zeros = np.zeros_like(u)
+    p = np.stack([np.ones_like(u), u, u * u, u * u * u], axis=-1)
+    dp = np.stack([zeros, np.ones_like(u), 2.0 * u, 3.0 * u * u], axis=-1)
+    ddp = np.stack([zeros, zeros, np.full_like(u, 2.0), 6.0 * u], axis=-1)
+    gp = np.einsum("bij,bsj->bsi", gram, p)
+    gdp = np.einsum("bij,bsj->bsi", gram, dp)
+    d1 = (dp * gp).sum(axis=-1) - (projections * dp).sum(axis=-1)
+    d2 = (dp * gdp).sum(axis=-1) + (ddp * gp).sum(axis=-1) - (projections * ddp).sum(axis=-1)
+    return d1, d2
+
+
+class ErrorTable(object):
+    """
+    Errors for the spans (i, j) of an animation no longer than max_span frames
+    (every span when max_span is 0), stored by start frame: values[i, o - 1]
+    and indices[i, o - 1] hold the error of the span (i, i + o) and the frame
+    it is worst at. Spans outside the band have an infinite error.
+    """
+    def __init__(self, n_frames, max_span=0):
+        self.n_frames = n_frames
+        self.max_span = max_span if 0 < max_span < n_frames - 1 else max(n_frames - 1, 0)
+        width = max(self.max_span, 1)
+        self.values = np.full((max(n_frames, 1), width), np.inf, dtype=np.float32)
+        self.indices = np.full((max(n_frames, 1), width), -1, dtype=np.int32)
+
+    def error_value(self, i, j):
+        if i < j and j - i <= self.max_span:
+            return self.values[i, j - i - 1]
+        return np.float32(np.inf)
+
+    @staticmethod
+    def using_line_based_error(poses, max_span=0):
+        """
+        For each span, the distance of the pose furthest from the straight line
+        joining the span's end poses
+        """
+        poses = np.asarray(poses, dtype=np.float64)
+        n_frames = len(poses)
+        table = ErrorTable(n_frames, max_span)
+        m = table.max_span
+        if n_frames < 2:
+            return table
+
+        # Blocks hold whole rows of spans, and the poses inside the spans are visited in
+        # tiles, so that a block's span-by-pose arrays stay within BLOCK_ELEMENTS
+        # however long the spans are
+        offsets_range = np.arange(m)
+        n_rows = max(1, BLOCK_ELEMENTS // (m * max(m, poses.shape[1])))
+        n_inner = max(1, min(m, BLOCK_ELEMENTS // (n_rows * m)))
+        for i0 in range(0, n_frames - 1, n_rows):
+            rows = np.arange(i0, min(i0 + n_rows, n_frames - 1))
+            later = np.minimum(rows[:, None] + 1 + offsets_range[None, :], n_frames - 1)
+            offsets = poses[later] - poses[rows][:, None, :]
+            norms = (offsets ** 2).sum(axis=-1)
+            lengths = np.sqrt(norms)
+            directions = offsets / np.where(lengths > 0.0, lengths, 1.0)[..., None]
+
+            # Each span's remaining distance for every pose after its first, keeping only
+            # the poses inside the span (those before its last). A tile of poses only
+            # matters to the spans that end after it, and ties keep the earliest pose
+            furthest = np.zeros((len(rows), m), dtype=np.int64)
+            largest = np.full((len(rows), m), -1.0)
+            for k0 in range(0, m - 1, n_inner):
+                k1 = min(k0 + n_inner, m)
+                distances = np.matmul(directions[:, k0 + 1:], offsets[:, k0:k1].transpose(0, 2, 1))
+                np.multiply(distances, distances, out=distances)
+                np.subtract(norms[:, None, k0:k1], distances, out=distances)
+                np.maximum(distances, 0.0, out=distances)
+                outside = offsets_range[k0:k1][None, :] >= offsets_range[k0 + 1:][:, None]
+                np.copyto(distances, -1.0, where=outside[None, :, :])
+                tile_furthest = np.argmax(distances, axis=-1)
+                tile_largest = np.take_along_axis(distances, tile_furthest[..., None], axis=-1)[..., 0]
+                better = tile_largest > largest[:, k0 + 1:]
+                furthest[:, k0 + 1:] = np.where(better, k0 + tile_furthest, furthest[:, k0 + 1:])
+                largest[:, k0 + 1:] = np.where(better, tile_largest, largest[:, k0 + 1:])
+
+            valid = rows[:, None] + 1 + offsets_range[None, :] <= n_frames - 1
+            found = largest > 0.0
+            table.values[rows] = np.where(valid, np.sqrt(np.maximum(largest, 0.0)), np.inf).astype(np.float32)
+            table.indices[rows] = np.where(valid & found, rows[:, None] + 1 + furthest, -1)
+        return table
+
+    @staticmethod
+    def using_curve_based_error(poses, max_span=0):
+        """
+        For each span, the sum of squared distances between the poses and a
+        cubic fitted to them, at evenly spaced samples. Along each row, fits are
+        warm-started from the previous span's, in chains that restart every
+        CURVE_WARM_START_SPANS spans, as the plug-in's are
+        """
+        poses = np.asarray(poses, dtype=np.float64)
+        n_frames = len(poses)
+        table = ErrorTable(n_frames, max_span)
+        m = table.max_span
+        if n_frames < 2:
+            return table
+
+        # Spans of up to four frames are always fitted exactly
+        rows = np.arange(n_frames - 1)
+        for o in range(1, min(m, 3) + 1):
+            valid = rows + o <= n_frames - 1
+            table.values[rows[valid], o - 1] = 0.0
+            table.indices[rows[valid], o - 1] = rows[valid] if o == 1 else rows[valid] + 1
+
+        # Chains start at spans of four frames and at every multiple of the chain length,
+        # and all chains advance together, one span length at a time
+        chain_starts = np.arange(0, m + 1, CURVE_WARM_START_SPANS)
+        per_span = SAMPLES_PER_CURVE * (FITTING_RESOLUTION // 10 + poses.shape[1])
+        n_rows = max(1, BLOCK_ELEMENTS // (per_span * len(chain_starts)))
+        for i0 in range(0, n_frames - 1, n_rows):
+            block = np.arange(i0, min(i0 + n_rows, n_frames - 1))
+            starts = np.repeat(block, len(chain_starts))
+            bases = np.tile(chain_starts, len(block))
+            parameters = np.tile(SAMPLE_PARAMETERS, (len(starts), 1))
+            for position in range(CURVE_WARM_START_SPANS):
+                spans = bases + position
+                valid = (spans >= 4) & (spans <= m) & (starts + spans <= n_frames - 1)
+                if not valid.any():
+                    continue
+                spans_now = spans[valid]
+                cold = (spans_now == 4) | (spans_now % CURVE_WARM_START_SPANS == 0)
+                for is_cold in (True, False):
+                    group = np.flatnonzero(valid)[cold == is_cold]
+                    if len(group) == 0:
+                        continue
+                    fits = SpanFits(poses, starts[group], starts[group] + spans[group])
+                    fits.parameters = parameters[group]
+                    if is_cold:
+                        fits.fit_spans(CURVE_COLD_ITERATIONS, True)
+                        frames, values = fits.span_errors()
+                    else:
+                        frames, values = fits.fit_spans_guarded(CURVE_WARM_ITERATIONS, CURVE_COLD_ITERATIONS, CURVE_WARM_MARGIN)
+                    parameters[group] = fits.parameters
+                    table.values[starts[group], spans[group] - 1] = values
+                    table.indices[starts[group], spans[group] - 1] = frames
+        return table
+
+    @staticmethod
+    def using_error_type(poses, error_type, max_span=0):
+        if error_type == "line":
+            return ErrorTable.using_line_based_error(poses, max_span)
+        if error_type == "curve":
+            return ErrorTable.using_curve_based_error(poses, max_span)
+        raise ValueError("The error type `%s` is not understood, must be either `line` or `curve`" % error_type)
+
+
+class Selector(object):
+    """
+    Finds the selection of n keyframes with the smallest maximum error, for
+    increasing n, as the plug-in's Selector does: each level of the dynamic
+    programme is one vectorised pass over every end frame
+    """
+    def __init__(self, table):
+        self.table = table
+        self.n_frames = table.n_frames
+        self.n_keyframes = 2
+        n = self.n_frames
+        width = max(table.max_span, 1)
+
+        # For each end frame, its possible previous keyframes in increasing order, and
+        # the error of the span from each
+        ends = np.arange(max(n, 1))
+        self.previous = ends[:, None] - width + np.arange(width)[None, :]
+        in_band = self.previous >= 0
+        safe = np.where(in_band, self.previous, 0)
+        self.span_errors = np.where(in_band, table.values[safe, np.clip(ends[:, None] - safe - 1, 0, width - 1)], np.inf).astype(np.float32)
+
+        self.current = np.zeros(max(n, 1), dtype=np.float32)
+        if n > 1:
+            # With two keyframes, the error of reaching each end frame is that of its span from 0
+            self.current[1:] = np.inf
+            reach = min(table.max_span, n - 1)
+            self.current[1:reach + 1] = table.values[0, :reach]
+        self.errors = {2: self.current[n - 1] if n > 1 else np.float32(0.0)}
+        self.back_pointers = {}
+
+        while self.n_keyframes < self.minimum_keyframes():
+            self.next()
+
+    def minimum_keyframes(self):
+        if self.n_frames < 2:
+            return 2
+        max_span = self.table.max_span
+        return max(2, (self.n_frames - 1 + max_span - 1) // max_span + 1)
+
+    def maximum_keyframes(self):
+        return self.n_frames
+
+    def next(self):
+        if self.n_keyframes >= self.n_frames:
+            return
+        self.n_keyframes += 1
+        level = self.n_keyframes
+        previous_errors = self.current
+
+        first_end = level - 1
+        candidates = self.previous[first_end:]
+        allowed = candidates >= max(level - 2, 0)
+        values = np.maximum(previous_errors[np.where(allowed, candidates, 0)], self.span_errors[first_end:])
+        values = np.where(allowed, values, np.inf)
+        best = np.argmin(values, axis=1)
+        best_values = values[np.arange(len(best)), best]
+
+        self.current = previous_errors.copy()
+        self.current[first_end:] = best_values
+        self.back_pointers[level] = np.where(np.isfinite(best_values), candidates[np.arange(len(best)), best], -1)
+        self.errors[level] = self.current[self.n_frames - 1]
+
+    def error_by_n_keyframes(self, n):
+        while self.n_keyframes < n and self.n_keyframes < self.n_frames:
+            self.next()
+        if n < 2 or n > self.n_keyframes:
+            return np.float32(0.0)
+        return self.errors[n]
+
+    def selection_by_n_keyframes(self, n):
+        while self.n_keyframes < n and self.n_keyframes < self.n_frames:
+            self.next()
+        if n < self.minimum_keyframes() or n > self.n_keyframes:
+            return []
+
+        # Walk the back-pointers from the last frame to the first
+        selection = [0] * n
+        e = self.n_frames - 1
+        selection[n - 1] = e
+        for level in range(n, 2, -1):
+            e = int(self.back_pointers[level][e - (level - 1)])
+            selection[level - 2] = e
+        selection[0] = 0
+        return selection
+
+
+class SelectionManager(object):
+    """
+    Splits an animation at its fixed keyframes and shares keyframes between the
+    segments, each added keyframe going to the segment whose error it would
+    reduce the most (ties going to the later segment)
+    """
+    def __init__(self, error_type, poses, fixed_keyframes=(), max_span=0):
+        poses = np.asarray(poses, dtype=np.float64)
+        n_frames = len(poses)
+        fixed = sorted(set(int(k) for k in fixed_keyframes))
+        if not fixed or fixed[0] != 0:
+            fixed.insert(0, 0)
+        if fixed[-1] != n_frames - 1:
+            fixed.append(n_frames - 1)
+
+        self.segment_starts = fixed[:-1]
+        self.selectors = [
+            Selector(ErrorTable.using_error_type(poses[s:e + 1], error_type, max_span))
+            for (s, e) in zip(fixed[:-1], fixed[1:])
+        ]
+        self.keyframes = [selector.minimum_keyframes() for selector in self.selectors]
+        self.segment_errors = [np.float32(0.0)] * len(self.selectors)
+        self.segment_selections = [[] for _ in self.selectors]
+        self.reductions = []
+        for i in range(len(self.selectors)):
+            self.update_segment(i)
+
+        self.selections = {}
+        self.errors = {}
+        self.record()
+
+    def update_segment(self, i):
+        selector = self.selectors[i]
+        n = self.keyframes[i]
+        selection = selector.selection_by_n_keyframes(n)
+        self.segment_errors[i] = selector.error_by_n_keyframes(n)
+
+        # The last keyframe of all but the last segment is the next segment's first
+        if i < len(self.selectors) - 1:
+            selection = selection[:-1]
+        self.segment_selections[i] = [self.segment_starts[i] + k for k in selection]
+
+        if n < selector.maximum_keyframes():
+            reduction = np.float32(self.segment_errors[i] - selector.error_by_n_keyframes(n + 1))
+            heapq.heappush(self.reductions, (-reduction, -i))
+
+    def record(self):
+        selection = [k for piece in self.segment_selections for k in piece]
+        self.selections[len(selection)] = selection
+        self.errors[len(selection)] = max([np.float32(0.0)] + list(self.segment_errors))
+        return len(selection)
+
+    def increment_until_n_keyframes(self, n_keyframes):
+        n = max(self.selections)
+        while n <= n_keyframes and self.reductions:
+            _, i = heapq.heappop(self.reductions)
+            self.keyframes[-i] += 1
+            self.update_segment(-i)
+            self.record()
+            n += 1
+
+
+def interpolate_optimal(curve, keyframes):
+    """
+    Fit a cubic to the curve (a frames x dims array) between each pair of
+    consecutive keyframes, as Interpolate::optimal does, returning the control
+    points of each as a (4, dims) array
+    """
+    curve = np.asarray(curve, dtype=np.float64)
+    start = keyframes[0]
+    starts = [k - start for k in keyframes[:-1]]
+    ends = [k - start for k in keyframes[1:]]
+    if not starts:
+        return []
+    fits = SpanFits(curve, starts, ends)
+    fits.fit()
+    return fits.cubics()
+
+
+def select(poses, error_type, max_keyframes, fixed_keyframes=(), max_span=0, start=0):
+    """
+    Select keyframes from poses (a frames x dims array, each pose led by its
+    frame number), returning {n_keyframes: {"selection": [...], "error": e}}
+    with the keyframes as frame numbers counted from start
+    """
+    if error_type not in ("line", "curve"):
+        raise ValueError("The error type `%s` is not understood, must be either `line` or `curve`" % error_type)
+    manager = SelectionManager(error_type, poses, fixed_keyframes, max_span)
+    manager.increment_until_n_keyframes(max_keyframes)
+    return dict(
+        (n, {"selection" : [k + start for k in selection], "error" : float(manager.errors[n])})
+        for (n, selection) in manager.selections.items()
+    )
@@ -1,6 +1,7 @@
 import json
-import math 
+import os
 import re
+import tempfile
 
 import maya
 
@@ -11,16 +12,73 @@ import altmaya
 from altmaya import tools
 
 
-class Cubic:
-    def __init__(self, p1x, p1y, p2x, p2y, p3x, p3y, p4x, p4y):
-        self.p1x = p1x; self.p1y = p1y
-        self.p2x = p2x; self.p2y = p2y
-        self.p3x = p3x; self.p3y = p3y
-        self.p4x = p4x; self.p4y = p4y
-    def angleLeft(self): xd = self.p2x - self.p1x; yd = self.p2y - self.p1y; return math.atan2(yd, xd)
-    def angleRight(self): xd = self.p4x - self.p3x; yd = self.p4y - self.p3y; return math.atan2(yd, xd)
-    def weightLeft(self): xd = self.p2x - self.p1x; yd = self.p2y - self.p1y; return math.sqrt(yd * yd + xd * xd)
-    def weightRight(self): xd = self.p4x - self.p3x; yd = self.p4y - self.p3y; return math.sqrt(yd * yd + xd * xd)
+class TemporaryFiles(object):
+    """
+    Scratch files for passing binary data to and from the plug-in, removed on exit
+    """
+    def __init__(self, *suffixes):
+        self.suffixes = suffixes
+        self.paths = []
+
+    def __enter__(self):
+        for suffix in self.suffixes:
+            handle, path = tempfile.mkstemp(prefix="salient_poses_", suffix=suffix)
+            os.close(handle)
+            self.paths.append(path)
+        return self.paths
+
+    def __exit__(self, *args):
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# How often a running selection is polled, in milliseconds
+JOB_POLL_INTERVAL = 100
+
+# Megabytes of error tables the plug-in keeps between selections, so moving the
+# fixed keyframes or reselecting only recomputes the segments that changed
+ERROR_TABLE_CACHE_MEGABYTES = 256
+
+# What each stage of a selection job is called on the progress bar
+JOB_STAGE_NAMES = {
+    "errorTables" : "Computing error tables",
+    "selecting" : "Selecting"
+}
+
+
+def describe_cache_stats(stats):
+    """
+    Summarise the error table cache counts returned by `salientSelect`
+    """
+    if not stats:
+        return ""
+    reused = stats["memoryHits"] + stats["diskHits"]
+    return " (%d of %d error tables reused)" % (reused, reused + stats["misses"])
+
+
+def describe_profile(profile):
+    """
+    Summarise the phase timings returned by `-instrument` for the status bar
+    """
+    if not profile:
+        return ""
+    phases = ", ".join(
+        "%s %.2fs" % (phase["name"], phase["wallSeconds"])
+        for phase in profile["phases"] if phase["depth"] == 0
+    )
+    return " [%s; peak %.0f MB]" % (phases, profile["peakMemoryMB"])
+
+
+def describe_projection(projection):
+    """
+    Summarise the principal components `salientSelect` selected with, if any
+    """
+    if not projection:
+        return ""
+    return " (using %d of %d dimensions, errors within %.3g)" % (
+        projection["components"], projection["dims"] - 1, projection["errorBound"]
+    )
 
 
 class QtDivider(QtWidgets.QFrame):
@@ -38,6 +96,10 @@ class SalientPosesGUI(altmaya.StandardMayaWindow):
         self.extreme_selections = {}
         self.breakdown_selections = {}
         self.current_selection = []
+        self.last_cache_stats = None
+        self.last_profile = None
+        self.last_projection = None
+        self.job = None
         self.extreme_attr_gui = tools.AttributeSelector("Choose Attributes for Selection", [], parent=self)
         self.breakdown_attr_gui = tools.AttributeSelector("Choose Attributes for Selection", [], parent=self)
         self.reduce_attr_gui = tools.AttributeSelector("Choose Attributes for Reduction", [], parent=self)
@@ -71,6 +133,16 @@ class SalientPosesGUI(altmaya.StandardMayaWindow):
         self.fixed_keyframes_button_export = QtWidgets.QPushButton("Export")
         self.fixed_keyframes_button_import = QtWidgets.QPushButton("Import")
         
+        # Pose space (the variance to keep when selecting with principal components)
+        self.variance_spinbox = QtWidgets.QDoubleSpinBox()
+        self.variance_spinbox.setRange(0.0, 100.0)
+        self.variance_spinbox.setDecimals(1)
+        self.variance_spinbox.setSuffix("%")
+        self.variance_spinbox.setSpecialValueText("All Attributes")
+        self.variance_spinbox.setToolTip(
+            "Select using the fewest principal components of the chosen attributes that explain this much of their variance"
+        )
+
         # Extreme section
         self.choose_extreme_attr_button = QtWidgets.QPushButton("Choose Extreme Attributes")
         self.select_extremes_button = QtWidgets.QPushButton("Select Extremes")
@@ -86,12 +158,23 @@ class SalientPosesGUI(altmaya.StandardMayaWindow):
         self.n_breakdown_keyframes_edit = QtWidgets.QLineEdit(str(self.n_breakdown_keyframes_slider.value()))
         self.n_breakdown_keyframes_edit.setEnabled(False)
         
+        # Selection progress (selections run in the background and are polled)
+        self.job_progress_bar = QtWidgets.QProgressBar()
+        self.job_progress_bar.setRange(0, 100)
+        self.job_progress_bar.setValue(0)
+        self.job_progress_bar.setFormat("Idle")
+        self.cancel_job_button = QtWidgets.QPushButton("Cancel")
+        self.cancel_job_button.setEnabled(False)
+        self.job_timer = QtCore.QTimer(self)
+        self.job_timer.setInterval(JOB_POLL_INTERVAL)
+        
         # Reduce section
         self.choose_reduce_attr_button = QtWidgets.QPushButton("Choose Attributes")
         self.extreme_reduce_button = QtWidgets.QPushButton("Reduce (Extremes Only)")
         self.breakdown_reduce_button = QtWidgets.QPushButton("Reduce (Extremes+Breakdowns)")
         
         # Other
+        self.profile_checkbox = QtWidgets.QCheckBox("Show Timings")
         self.close_button = QtWidgets.QPushButton("Close")
         
     def create_layouts(self):
@@ -122,6 +205,12 @@ class SalientPosesGUI(altmaya.StandardMayaWindow):
         
         main.addWidget(QtWidgets.QLabel("Keyframe Selection"))
         
+        # Select - pose space
+        l = QtWidgets.QHBoxLayout()
+        l.addWidget(QtWidgets.QLabel("Pose Variance"))
+        l.addWidget(self.variance_spinbox)
+        main.addLayout(l)
+        
         # Select - extremes
         main.addWidget(self.choose_extreme_attr_button)
         main.addWidget(self.select_extremes_button)
@@ -143,6 +232,12 @@ class SalientPosesGUI(altmaya.StandardMayaWindow):
         l.addWidget(self.n_breakdown_keyframes_edit)
         main.addLayout(l)
         
+        # Select - progress
+        l = QtWidgets.QHBoxLayout()
+        l.addWidget(self.job_progress_bar)
+        l.addWidget(self.cancel_job_button)
+        main.addLayout(l)
+        
         # --------------------------- Divider
         main.addWidget(QtDivider())
         
@@ -160,6 +255,7 @@ class SalientPosesGUI(altmaya.StandardMayaWindow):
         
         # Other
         l = QtWidgets.QHBoxLayout()
+        l.addWidget(self.profile_checkbox)
         l.addWidget(self.close_button)
         main.addLayout(l)
             
@@ -182,6 +278,8 @@ class SalientPosesGUI(altmaya.StandardMayaWindow):
         self.select_breakdowns_button.clicked.connect(self.select_breakdowns)
         self.n_extreme_keyframes_slider.valueChanged.connect(self.handle_extreme_slider_moved)
         self.n_breakdown_keyframes_slider.valueChanged.connect(self.handle_breakdown_slider_moved)
+        self.cancel_job_button.clicked.connect(self.cancel_job)
+        self.job_timer.timeout.connect(self.poll_job)
         
         # Reduce section
         self.choose_reduce_attr_button.clicked.connect(self.open_choose_for_reduction_dialog)
@@ -191,6 +289,13 @@ class SalientPosesGUI(altmaya.StandardMayaWindow):
         # Other
         self.close_button.clicked.connect(self.close)
 
+    def closeEvent(self, event):
+        if self.job is not None:
+            self.job_timer.stop()
+            maya.cmds.salientSelectJob(self.job["id"], release=True)
+            self.job = None
+        super(SalientPosesGUI, self).closeEvent(event)
+
     def set_status(self, message, color_as_hex):
         font_hex = "%02x%02x%02x" % (55, 55, 55)
         self.status_bar.setText("> " + message)
@@ -330,37 +435,105 @@ class SalientPosesGUI(altmaya.StandardMayaWindow):
         self.n_breakdown_keyframes_slider.setEnabled(True)
         # self.n_breakdown_keyframes_edit.setEnabled(True)
         
-         
-    def select(self, attr_indices, error_type, fixed_keyframes):
+
+    def start_job(self, attr_indices, error_type, fixed_keyframes, on_update, on_finish):
+        """
+        Start selecting in the background. As the selections arrive (fewest
+        keyframes first), on_update is given all of them so far, in the
+        {n_keyframes: {"selection": [...], "error": e}} form, and on_finish is
+        given the job's final state and how many selections it made
+        """
+        if self.job is not None:
+            self.report_error("A selection is already running, wait for it or cancel it first")
+            return
+            
         start = fixed_keyframes[0]
         end = fixed_keyframes[-1]
         
-        data = []
-        f = start
-        while f <= end:
-            data.append(f)
-            for ai in attr_indices:
-                data.append(ai.read_at_time(f))
-            f += 1.0
-
         n_frames = end - start + 1
         max_keyframes = int(n_frames * 0.2) #int(self.max_keyframes_edit.text())
         fixed_keyframes = [v - start for v in fixed_keyframes]
-        result = maya.cmds.salientSelect(error_type, start, end, max_keyframes, fixed_keyframes, data)
-        
-        selections = {}
-        for line in result.split("\n"):
-            if line != "":
-                errorString, selectionString = line.split("|")
-                error = float(errorString)
-                selection = [int(v) for v in selectionString.split(",")]
-                n_keyframes = len(selection)
-                selections[n_keyframes] = { 
-                    "selection" : [v + start for v in selection],
-                    "error" : error
-                }
-        
-        return selections
+        
+        # The poses travel through a binary file, which the command reads before
+        # returning the job's id
+        with TemporaryFiles(".bin") as (data_path,):
+            plugs = ["%s.%s" % (ai.obj, ai.attr) for ai in attr_indices]
+            maya.cmds.salientSample(start, end, 1, plugs, file=data_path)
+            job_id = maya.cmds.salientSelect(
+                error_type, start, end, max_keyframes, fixed_keyframes,
+                dataFile=data_path, background=True,
+                cache=ERROR_TABLE_CACHE_MEGABYTES,
+                instrument=self.profile_checkbox.isChecked(),
+                variance=self.variance_spinbox.value() / 100.0
+            )
+        
+        self.job = {
+            "id" : job_id,
+            "start" : start,
+            "since" : 0,
+            "selections" : {},
+            "on_update" : on_update,
+            "on_finish" : on_finish
+        }
+        self.select_extremes_button.setEnabled(False)
+        self.select_breakdowns_button.setEnabled(False)
+        self.cancel_job_button.setEnabled(True)
+        self.job_progress_bar.setValue(0)
+        self.job_progress_bar.setFormat(JOB_STAGE_NAMES["errorTables"] + " %p%")
+        self.job_timer.start()
+        
+    def poll_job(self):
+        job = self.job
+        if job is None:
+            self.job_timer.stop()
+            return
+            
+        state = json.loads(maya.cmds.salientSelectJob(job["id"], since=job["since"]))
+        for entry in state["selections"]:
+            job["selections"][entry["keyframes"]] = {
+                "selection" : [v + job["start"] for v in entry["selection"]],
+                "error" : entry["error"]
+            }
+        self.job_progress_bar.setFormat(JOB_STAGE_NAMES.get(state["stage"], state["stage"]) + " %p%")
+        self.job_progress_bar.setValue(int(100 * state["progress"]))
+        if state["selections"]:
+            job["since"] = state["maxKeyframes"]
+            job["on_update"](job["selections"])
+        
+        if state["status"] == "running":
+            return
+            
+        # The job has stopped, so everything it selected has been read
+        self.job_timer.stop()
+        maya.cmds.salientSelectJob(job["id"], release=True)
+        self.job = None
+        self.select_extremes_button.setEnabled(True)
+        self.select_breakdowns_button.setEnabled(True)
+        self.cancel_job_button.setEnabled(False)
+        self.job_progress_bar.setFormat("Idle" if state["status"] == "finished" else state["status"].capitalize())
+        
+        self.last_cache_stats = state.get("cache")
+        self.last_profile = state.get("profile")
+        self.last_projection = state.get("details", {}).get("projection")
+        job["on_finish"](state, len(job["selections"]))
+        
+    def cancel_job(self):
+        if self.job is None:
+            return
+        maya.cmds.salientSelectJob(self.job["id"], cancel=True)
+        self.cancel_job_button.setEnabled(False)
+        self.report_todo("Cancelling selection...")
+        
+    def describe_job_end(self, state, n_selections, what):
+        if state["status"] == "failed":
+            self.report_error("Failed selecting %s: %s" % (what, state.get("message", "unknown error")))
+        elif state["status"] == "cancelled":
+            self.report_warning("Cancelled selecting %s (kept %d selections)" % (what, n_selections))
+        else:
+            self.report_message(
+                "Finished selecting %s!" % what + describe_projection(self.last_projection) +
+                describe_cache_stats(self.last_cache_stats) + describe_profile(self.last_profile)
+            )
         
     def select_extremes(self):
         attr_indices = self.extreme_attr_gui.read_values_as_indices()
@@ -368,20 +541,31 @@ class SalientPosesGUI(altmaya.StandardMayaWindow):
             self.report_error("You must choose at least one attributes for selection")
             return
             
-        ret = self.select(attr_indices, "line", self.read_fixed_keyframes())
-        if ret is None: self.report_error("Something went very wrong! Please post an issue at https://github.com/richard-roberts/SalientPosesMaya/issues")
+        self.extreme_selections = {}
+        self.lock_extreme_slider()
+        self.start_job(
+            attr_indices, "line", self.read_fixed_keyframes(),
+            self.update_extremes, lambda state, n: self.describe_job_end(state, n, "extremes")
+        )
         
-        self.extreme_selections = ret
+    def update_extremes(self, selections):
+        """
+        Take the extreme selections made so far, widening the slider's range as
+        more arrive (and showing the first as soon as there is one)
+        """
+        first = len(self.extreme_selections) == 0
+        self.extreme_selections = selections
         self.n_extreme_keyframes_slider.setMinimum(min(self.extreme_selections.keys()))
         self.n_extreme_keyframes_slider.setMaximum(max(self.extreme_selections.keys()))
+        if not first:
+            return
+            
         n = min(self.extreme_selections.keys())
         self.n_extreme_keyframes_slider.setValue(n)
         self.n_extreme_keyframes_edit.setText(str(n))
         selection = self.extreme_selections[n]["selection"]
         altmaya.Animation.ghost_keyframes(selection)
-        
         self.unlock_extreme_slider()
-        self.report_message("Finished selecting extremes!")
         
     def select_breakdowns(self):
         attr_indices = self.breakdown_attr_gui.read_values_as_indices()
@@ -389,23 +573,37 @@ class SalientPosesGUI(altmaya.StandardMayaWindow):
             self.report_error("You must choose at least one attributes for selection")
             return    
         n_e = int(self.n_extreme_keyframes_slider.value())
+        if n_e not in self.extreme_selections.keys():
+            self.report_error("Please run the extreme selection before selecting breakdowns")
+            return
         extremes = sorted(self.extreme_selections[n_e]["selection"])
         
-        ret = self.select(attr_indices, "curve", extremes)
-        if ret is None: self.report_error("Something went very wrong! Please post an issue at https://github.com/richard-roberts/SalientPosesMaya/issues")
+        self.breakdown_selections = {}
+        self.lock_breakdown_slider()
+        self.start_job(
+            attr_indices, "curve", extremes,
+            lambda selections: self.update_breakdowns(selections, n_e),
+            lambda state, n: self.describe_job_end(state, n, "breakdowns")
+        )
         
-        self.breakdown_selections = ret
+    def update_breakdowns(self, selections, n_e):
+        """
+        Take the breakdown selections made so far (on top of n_e extremes),
+        widening the slider's range as more arrive
+        """
+        first = len(self.breakdown_selections) == 0
+        self.breakdown_selections = selections
         n = min(self.breakdown_selections.keys())
-        
-        self.n_breakdown_keyframes_slider.setMinimum(min(self.breakdown_selections.keys()) - n_e)
+        self.n_breakdown_keyframes_slider.setMinimum(n - n_e)
         self.n_breakdown_keyframes_slider.setMaximum(max(self.breakdown_selections.keys()) - n_e)
+        if not first:
+            return
+            
         self.n_breakdown_keyframes_slider.setValue(n - n_e)
         self.n_breakdown_keyframes_edit.setText(str(n - n_e))        
         selection = self.breakdown_selections[n]["selection"]
         altmaya.Animation.ghost_keyframes(selection)
-        
         self.unlock_breakdown_slider()
-        self.report_message("Finished selecting breakdowns!")
         
     def lock_extremes(self):
         if self.n_extreme_keyframes_slider.isEnabled():
@@ -468,9 +666,8 @@ class SalientPosesGUI(altmaya.StandardMayaWindow):
         
     def reduce(self, keyframes, breakdowns):
         """
-        Warning: 
-            don't shift keyframes to start from zero except for the actual call,
-            otherwise this incorrectly offsets the read, cut, and rekeying steps
+        Refit the chosen attributes between the given keyframes (frame numbers,
+        not shifted to start from zero) and rekey them, marking the breakdowns
         """
 
         attr_indices = self.reduce_attr_gui.read_values_as_indices()
@@ -484,53 +681,34 @@ class SalientPosesGUI(altmaya.StandardMayaWindow):
             return
         
         n_keyframes = len(keyframes)
-        start = keyframes[0]
-        end = keyframes[-1]
         
         altmaya.History.start_undo_block()
         
         try:
-                                
-            for ai in attr_indices:
-                
-                data = []
-                f = start
-                while f <= end:
-                    data.append(f)
-                    data.append(ai.read_at_time(f))
-                    f += 1.0
-                    
-                result = maya.cmds.salientReduce(
-                    ai.obj,
-                    ai.attr, 
-                    [v - keyframes[0] for v in keyframes], # only 
-                    data
-                )
-
-                if len(result) % 8 != 0:
-                    self.report_error("Invalid result given by reduction command for %s?" % AttributeIndex(ai.obj, ai.attr))
-                    return 
-              
-                n_cubics = len(result) / 8
-                cubics = [Cubic(*result[((i+0)*8):((i+1)*8)]) for i in range(n_cubics)]
-                
-                # Delete old keyframes
-                altmaya.Animation.clear_range(ai, start, end)
-
-                # Set new keyframe values
-                for i in range(n_keyframes - 1):
-                    is_breakdown = keyframes[i] not in breakdowns
-                    altmaya.Animation.add_keyframe(ai, keyframes[i], cubics[i].p1y, is_breakdown)
-                altmaya.Animation.add_keyframe(ai, keyframes[-1], cubics[-1].p4y, False)
-                
-                # Configure keyframes based on fitted cubics
-                altmaya.Animation.convert_to_free_splines(ai)
-                for i in range(n_cubics):
-                    cubic = cubics[i]
-                    s = keyframes[i]
-                    e = keyframes[i+1]
-                    altmaya.Animation.set_keyframe_ingoing_tangent(ai, s, cubic.weightLeft(), cubic.angleLeft() * 180.0 / math.pi)
-                    altmaya.Animation.set_keyframe_outgoing_tangent(ai, e, cubic.weightRight(), cubic.angleRight() * 180.0 / math.pi)
+            
+            # Every attribute is sampled and fitted in one call, which returns
+            # eight values per cubic, attribute by attribute (so when timing, the
+            # profile comes back through a trace file instead)
+            plugs = ["%s.%s" % (ai.obj, ai.attr) for ai in attr_indices]
+            self.last_profile = None
+            if self.profile_checkbox.isChecked():
+                with TemporaryFiles(".json") as (trace_path,):
+                    result = maya.cmds.salientReduceBatch(keyframes, plugs, traceFile=trace_path)
+                    with open(trace_path) as f:
+                        self.last_profile = json.load(f)
+            else:
+                result = maya.cmds.salientReduceBatch(keyframes, plugs)
+            
+            n_cubics = n_keyframes - 1
+            if len(result) != len(attr_indices) * n_cubics * 8:
+                self.report_error("Invalid result given by the reduction command?")
+                return
+            
+            # Replace the keys over the range on every curve in one undoable
+            # step, with the tangents shaped by the fitted cubics
+            maya.cmds.salientApplyReduction(keyframes, breakdowns, plugs, result)
+            if self.last_profile:
+                self.report_message("Finished reducing!" + describe_profile(self.last_profile))
         
         except RuntimeError as e:
             self.report_error("Failed reduce: " + str(e))
@@ -0,0 +1,107 @@
+"""
+Regenerates fixtures/golden.json, the command-line tool's selections and
+errors for the cases test_salient_poses_core.py checks salient_poses_core
+against.
+
+Usage: python make_golden.py path/to/salientPoses
+
+The selections at every number of keyframes come from the tool's output for
+one clip, and the errors from its batch mode, which reports them as JSON.
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Clip, error type, number of keyframes, fixed keyframes and maximum span
+CASES = [
+    ("walk.csv", "line", 12, [], 0),
+    ("walk.csv", "curve", 12, [], 0),
+    ("walk.csv", "line", 10, [40, 75], 0),
+    ("walk.csv", "curve", 10, [40, 75], 0),
+    ("reach.csv", "line", 12, [], 15),
+    ("reach.csv", "curve", 10, [], 20),
+    ("reach.csv", "curve", 9, [30], 25),
+    ("rough.csv", "curve", 12, [], 0),
+    ("rough.csv", "curve", 10, [50], 40),
+]
+
+SELECTION_LINE = re.compile(r"^\s+(\d+): \[([\d, ]*)\]$")
+
+
+def selections_from_tool(tool, clip, error_type, n_keyframes, fixed, max_span):
+    fixed_arg = ",".join(str(k) for k in fixed) if fixed else "x"
+    output = subprocess.check_output(
+        [tool, clip, error_type, str(n_keyframes), fixed_arg, "--max-span", str(max_span), "--threads", "1"]
+    ).decode()
+
+    lines = output.splitlines()
+    start = lines.index("Final selections:") + 1
+    selections = {}
+    for line in lines[start:]:
+        match = SELECTION_LINE.match(line)
+        if not match:
+            break
+        selections[match.group(1)] = [int(k) for k in match.group(2).split(",")]
+    return selections
+
+
+def errors_from_batch(tool, clip, error_type, n_keyframes, fixed, max_span):
+    scratch = tempfile.mkdtemp(prefix="salient_poses_golden_")
+    try:
+        manifest = os.path.join(scratch, "manifest.txt")
+        results = os.path.join(scratch, "results.jsonl")
+        with open(manifest, "w") as handle:
+            handle.write(clip)
+            if fixed:
+                handle.write("\t" + ",".join(str(k) for k in fixed))
+            handle.write("\n")
+        with open(os.devnull, "w") as devnull:
+            subprocess.check_call(
+                [tool, "--batch", manifest, "--output", results, "--error-type", error_type,
+                 "--keyframes", str(n_keyframes), "--max-span", str(max_span), "--jobs", "1"],
+                stdout=devnull, stderr=devnull
+            )
+        with open(results) as handle:
+            result = json.loads(handle.readline())
+    finally:
+        shutil.rmtree(scratch)
+
+    return dict(
+        (str(result["minKeyframes"] + i), e) for (i, e) in enumerate(result["errors"])
+    )
+
+
+def main(tool):
+    cases = []
+    for (name, error_type, n_keyframes, fixed, max_span) in CASES:
+        clip = os.path.join(FIXTURES, name)
+        selections = selections_from_tool(tool, clip, error_type, n_keyframes, fixed, max_span)
+        errors = errors_from_batch(tool, clip, error_type, n_keyframes, fixed, max_span)
+        cases.append({
+            "clip" : name,
+            "errorType" : error_type,
+            "maxKeyframes" : n_keyframes,
+            "fixedKeyframes" : fixed,
+            "maxSpan" : max_span,
+            "selections" : selections,
+            "errors" : dict((n, errors[n]) for n in selections)
+        })
+
+    with open(os.path.join(FIXTURES, "golden.json"), "w") as handle:
+        json.dump({"cases" : cases}, handle, indent=1, sort_keys=True)
+        handle.write("\n")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.stderr.write("Usage: python make_golden.py path/to/salientPoses\n")
+        sys.exit(1)
+    main(sys.argv[1])
@@ -0,0 +1,65 @@
+"""
+Checks salient_poses_core against the command-line tool: for each case in
+fixtures/golden.json (made by make_golden.py), select() must make the tool's
+selection at every number of keyframes, with the same errors.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import salient_poses_core
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Line errors are computed the same way as the plug-in's, to rounding, but curve
+# errors depend on the fits, whose Newton steps run in double precision here
+LINE_TOLERANCE = 1e-5
+CURVE_TOLERANCE = 1e-3
+
+with open(os.path.join(FIXTURES, "golden.json")) as handle:
+    CASES = json.load(handle)["cases"]
+
+
+def case_id(case):
+    fixed = ",".join(str(k) for k in case["fixedKeyframes"]) or "none"
+    return "%s-%s-fixed:%s-maxSpan:%d" % (case["clip"], case["errorType"], fixed, case["maxSpan"])
+
+
+def load_poses(name):
+    return np.loadtxt(os.path.join(FIXTURES, name), delimiter=",", skiprows=1, dtype=np.float32)
+
+
+@pytest.mark.parametrize("case", CASES, ids=[case_id(case) for case in CASES])
+def test_select_matches_command_line_tool(case):
+    poses = load_poses(case["clip"])
+    result = salient_poses_core.select(
+        poses, case["errorType"], case["maxKeyframes"],
+        fixed_keyframes=case["fixedKeyframes"], max_span=case["maxSpan"]
+    )
+
+    expected = dict((int(n), selection) for (n, selection) in case["selections"].items())
+    assert sorted(n for n in result if n <= case["maxKeyframes"]) == sorted(expected)
+
+    tolerance = CURVE_TOLERANCE if case["errorType"] == "curve" else LINE_TOLERANCE
+    for (n, selection) in expected.items():
+        assert result[n]["selection"] == selection, "selection of %d keyframes" % n
+        assert result[n]["error"] == pytest.approx(case["errors"][str(n)], rel=tolerance, abs=1e-6), "error of %d keyframes" % n
+
+
+def test_select_counts_from_start():
+    case = CASES[0]
+    poses = load_poses(case["clip"])
+    result = salient_poses_core.select(poses, case["errorType"], 4, start=100)
+    assert result[4]["selection"] == [k + 100 for k in case["selections"]["4"]]
+
+
+def test_select_rejects_unknown_error_type():
+    with pytest.raises(ValueError):
+        salient_poses_core.select(load_poses("reach.csv"), "spline", 4)
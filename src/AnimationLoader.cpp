@@ -0,0 +1,221 @@
+#include <stdlib.h>
+#include <string.h>
+#include <algorithm>
+#include <fstream>
+#include <iostream>
+#include <sstream>
+
+#include "AnimationLoader.hpp"
+#include "common.hpp"
+
+// Fields longer than this, or with more significant digits than fit exactly in a
+// double, are handed to strtod instead of the fast path
+#define MAX_FIELD_LENGTH 64
+#define MAX_EXACT_DIGITS 15
+
+static const double powersOfTen[] = {
+	1e0, 1e1, 1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10, 1e11,
+	1e12, 1e13, 1e14, 1e15, 1e16, 1e17, 1e18, 1e19, 1e20, 1e21, 1e22
+};
+
+// Parses the number in [begin, end), which is not null-terminated. Short decimals are
+// read as an integer mantissa and a power of ten that are both exact in a double, so
+// the result is correctly rounded; anything else is copied out and given to strtod.
+static bool parseFloat(const char* begin, const char* end, float& value) {
+	while (begin < end && (*begin == ' ' || *begin == '\t')) { begin++; }
+	while (end > begin && (end[-1] == ' ' || end[-1] == '\t' || end[-1] == '\r')) { end--; }
+	if (begin == end) {
+		value = 0.0f;
+		return true;
+	}
+
+	const char* p = begin;
+	bool negative = *p == '-';
+	if (*p == '-' || *p == '+') { p++; }
+
+	unsigned long long mantissa = 0;
+	int nDigits = 0;
+	int scale = 0;
+	bool seenDigit = false;
+	while (p < end && *p >= '0' && *p <= '9') {
+		if (mantissa != 0 || *p != '0') { nDigits++; }
+		mantissa = mantissa * 10 + (*p - '0');
+		seenDigit = true;
+		p++;
+	}
+	if (p < end && *p == '.') {
+		p++;
+		while (p < end && *p >= '0' && *p <= '9') {
+			if (mantissa != 0 || *p != '0') { nDigits++; }
+			mantissa = mantissa * 10 + (*p - '0');
+			scale--;
+			seenDigit = true;
+			p++;
+		}
+	}
+	if (p < end && (*p == 'e' || *p == 'E')) {
+		p++;
+		bool negativeExponent = p < end && *p == '-';
+		if (p < end && (*p == '-' || *p == '+')) { p++; }
+		int exponent = 0;
+		bool seenExponent = false;
+		while (p < end && *p >= '0' && *p <= '9') {
+			exponent = std::min(exponent * 10 + (*p - '0'), 100000);
+			seenExponent = true;
+			p++;
+		}
+		if (!seenExponent) { seenDigit = false; }
+		scale += negativeExponent ? -exponent : exponent;
+	}
+
+	if (seenDigit && p == end && nDigits <= MAX_EXACT_DIGITS && scale >= -22 && scale <= 22) {
+		double v = static_cast<double>(mantissa);
+		v = scale < 0 ? v / powersOfTen[-scale] : v * powersOfTen[scale];
+		value = static_cast<float>(negative ? -v : v);
+		return true;
+	}
+
+	// Long fields, special values (inf, nan) and anything malformed
+	if (end - begin >= MAX_FIELD_LENGTH) { return false; }
+	char field[MAX_FIELD_LENGTH];
+	memcpy(field, begin, end - begin);
+	field[end - begin] = '\0';
+	char* stop = NULL;
+	double v = strtod(field, &stop);
+	if (stop != field + (end - begin)) { return false; }
+	value = static_cast<float>(v);
+	return true;
+}
+
+// Whether a line holds nothing but whitespace
+static bool isBlank(const char* begin, const char* end) {
+	for (const char* p = begin; p < end; p++) {
+		if (*p != ' ' && *p != '\t' && *p != '\r') { return false; }
+	}
+	return true;
+}
+
+Eigen::MatrixXf AnimationLoader::readCSV(std::string path) {
+	MappedFile file(path);
+	if (!file.isOpen()) {
+		std::cerr << "Could not open the animation " << path << std::endl;
+		return Eigen::MatrixXf();
+	}
+	const char* data = file.data();
+	const char* fileEnd = data + file.size();
+
+	// The header's fields give the number of dimensions
+	const char* headerEnd = static_cast<const char*>(memchr(data, '\n', file.size()));
+	if (headerEnd == NULL) { headerEnd = fileEnd; }
+	int nDims = static_cast<int>(std::count(data, headerEnd, ',')) + 1;
+
+	// Every line after the header is at most one frame
+	int nLines = 0;
+	for (const char* p = headerEnd; p < fileEnd; p++) {
+		p = static_cast<const char*>(memchr(p, '\n', fileEnd - p));
+		if (p == NULL) { break; }
+		nLines++;
+	}
+	if (fileEnd > data && fileEnd[-1] != '\n') { nLines++; }
+
+	Eigen::MatrixXf poses(nDims, std::max(nLines, 0));
+	int nFrames = 0;
+	int lineNumber = 1;
+	const char* line = headerEnd < fileEnd ? headerEnd + 1 : fileEnd;
+	while (line < fileEnd) {
+		const char* lineEnd = static_cast<const char*>(memchr(line, '\n', fileEnd - line));
+		if (lineEnd == NULL) { lineEnd = fileEnd; }
+		lineNumber++;
+
+		if (!isBlank(line, lineEnd)) {
+			float* pose = poses.data() + static_cast<size_t>(nFrames) * nDims;
+			const char* field = line;
+			for (int d = 0; d < nDims; d++) {
+				const char* fieldEnd = d < nDims - 1 ? static_cast<const char*>(memchr(field, ',', lineEnd - field)) : lineEnd;
+				if (fieldEnd == NULL || (d == nDims - 1 && memchr(field, ',', lineEnd - field) != NULL)) {
+					std::cerr << "Line " << lineNumber << " of " << path << " does not have " << nDims << " fields" << std::endl;
+					return Eigen::MatrixXf();
+				}
+				if (!parseFloat(field, fieldEnd, pose[d])) {
+					std::cerr << "Could not read `" << std::string(field, fieldEnd) << "` on line " << lineNumber << " of " << path << " as a number" << std::endl;
+					return Eigen::MatrixXf();
+				}
+				field = fieldEnd + 1;
+			}
+			nFrames++;
+		}
+
+		line = lineEnd + 1;
+	}
+
+	// Blank lines took no frame
+	if (nFrames < poses.cols()) {
+		poses.conservativeResize(nDims, nFrames);
+	}
+	return poses;
+}
+
+Eigen::MatrixXf AnimationLoader::readClip(std::string path) {
+	MappedFile file(path);
+	int header[4];
+	if (!file.isOpen() || file.size() < sizeof(header)) {
+		std::cerr << "Could not open the clip " << path << std::endl;
+		return Eigen::MatrixXf();
+	}
+
+	memcpy(header, file.data(), sizeof(header));
+	if (memcmp(header, "SPCL", 4) != 0 || header[1] != CLIP_VERSION) {
+		std::cerr << "The file " << path << " is not a version " << CLIP_VERSION << " clip" << std::endl;
+		return Eigen::MatrixXf();
+	}
+
+	int nDims = header[2];
+	int nFrames = header[3];
+	if (nDims < 0 || nFrames < 0 || file.size() != sizeof(header) + static_cast<size_t>(nDims) * nFrames * sizeof(float)) {
+		std::cerr << "The clip " << path << " (" << file.size() << " bytes) does not hold " << nFrames << " poses of " << nDims << " float32 values" << std::endl;
+		return Eigen::MatrixXf();
+	}
+
+	Eigen::MatrixXf poses(nDims, nFrames);
+	memcpy(poses.data(), file.data() + sizeof(header), poses.size() * sizeof(float));
+	return poses;
+}
+
+int AnimationLoader::writeCSV(std::string path, const Eigen::MatrixXf& data) {
+	std::ostringstream os;
+
+	// Make the header
+	os << "Frame";
+	for (int i = 1; i < data.rows(); i++) {
+		os << "," << "Dimension-" << i;
+	}
+	os << std::endl;
+
+	// Make the body
+	for (int f = 0; f < data.cols(); f++) {
+		os << data(0, f);
+		for (int d = 1; d < data.rows(); d++) {
+			os << "," << data(d, f);
+		}
+		os << std::endl;
+	}
+
+	return File::writeStringToFile(path, os.str());
+}
+
+int AnimationLoader::writeClip(std::string path, const Eigen::MatrixXf& data) {
+	int header[4] = { 0, CLIP_VERSION, static_cast<int>(data.rows()), static_cast<int>(data.cols()) };
+	memcpy(header, "SPCL", 4);
+
+	// Written straight from the matrix, so large clips are not copied first
+	std::ofstream handle(path.c_str(), std::ios::out | std::ios::binary);
+	if (!handle.good()) { return 1; }
+	handle.write(reinterpret_cast<const char*>(header), sizeof(header));
+	handle.write(reinterpret_cast<const char*>(data.data()), data.size() * sizeof(float));
+	return handle.good() ? 0 : 1;
+}
+
+bool AnimationLoader::isClipPath(std::string path) {
+	size_t n = strlen(CLIP_EXTENSION);
+	return path.size() >= n && path.compare(path.size() - n, n, CLIP_EXTENSION) == 0;
+}
@@ -0,0 +1,32 @@
+#pragma once
+
+#include <string>
+
+#include "../eigen-git-mirror/Eigen/Dense"
+
+// Extension of the binary clip format
+#define CLIP_EXTENSION ".spclip"
+
+// Bumped whenever the layout of clip files changes
+#define CLIP_VERSION 1
+
+// Reads and writes animations (one pose per column) without going through strings.
+//
+// CSV files are memory-mapped and parsed in one pass straight into the matrix: the
+// newlines are counted first so the matrix is allocated once, and then each field is
+// converted where it lies in the mapping. Lines may be of any length. The first line
+// is a header and only its number of fields is used.
+//
+// Clips are a 16-byte header ("SPCL", CLIP_VERSION, dimensions, frames as int32)
+// followed by the poses as float32, pose-by-pose, which is the matrix's own layout, so
+// loading one is a single copy out of the mapping.
+//
+// On failure the reason is written to std::cerr and an empty matrix is returned.
+class AnimationLoader {
+public:
+	static Eigen::MatrixXf readCSV(std::string path);
+	static Eigen::MatrixXf readClip(std::string path);
+	static int writeCSV(std::string path, const Eigen::MatrixXf& data);
+	static int writeClip(std::string path, const Eigen::MatrixXf& data);
+	static bool isClipPath(std::string path);
+};
@@ -2,6 +2,7 @@
 #include <sstream>
 
 #include "common.hpp"
+#include "AnimationLoader.hpp"
 #include "AnimationProxy.hpp"
 
 AnimationProxy::AnimationProxy(Eigen::MatrixXf data): data(data) {
@@ -24,28 +25,13 @@ Eigen::MatrixXf AnimationProxy::curveByIndex(int index) {
 	return c;
 }
 
+// Paths ending in CLIP_EXTENSION are written as binary clips, anything else as CSV
 int AnimationProxy::save(std::string path) {
-    std::ostringstream os;
-
-	// Make the header
-	os << "Frame";
-    for (int i = 1; i < getNDims(); i++) {
-        os << "," << "Dimension-" << i;
-    }
-    os << std::endl;
-    
-	// Make the body
-    for (int i = 0; i < getNFrames(); i++) {
-        Eigen::VectorXf p = poseByIndex(i);
-		os << p[0];
-        for (int i = 1; i < p.size(); i++) {
-			os << "," << p[i];
-        }
-        os << std::endl;
-    }
-    
     std::cout << "  Saving animation to " << path << std::endl;
-    return File::writeStringToFile(path, os.str());
+    if (AnimationLoader::isClipPath(path)) {
+        return AnimationLoader::writeClip(path, data);
+    }
+    return AnimationLoader::writeCSV(path, data);
 }
 
 AnimationProxy AnimationProxy::subAnimation(int fromIx, int toIx) {
@@ -66,28 +52,43 @@ AnimationProxy AnimationProxy::subAnimation(int fromIx, int toIx) {
 	return AnimationProxy(subData);
 }
 
-AnimationProxy AnimationProxy::fromCSV(std::string path) {
-	File file(path);
-	std::vector< std::vector<std::string> > lines = file.divideByLineAndDelimiter(",");
-	file.close();
+AnimationProxy AnimationProxy::load(std::string path) {
+	return AnimationLoader::isClipPath(path) ? fromClip(path) : fromCSV(path);
+}
 
-	int nF = static_cast<int>(lines.size() - 1); // don't include the header
-	int nD = static_cast<int>(lines[0].size());
-	Eigen::MatrixXf data(nD, nF);
+AnimationProxy AnimationProxy::fromCSV(std::string path) {
+	return AnimationProxy(AnimationLoader::readCSV(path));
+}
 
-	int f = 0;
-	for (int i = 1; i < lines.size(); i++) {
-		std::vector<std::string> line = lines.at(i);
+AnimationProxy AnimationProxy::fromClip(std::string path) {
+	return AnimationProxy(AnimationLoader::readClip(path));
+}
 
-		for (int d = 0; d < line.size(); d++) {
-			float v = static_cast<float>(atof(line.at(d).c_str()));
-			data(d, f) = v;
-		}
+AnimationProxy AnimationProxy::fromBinary(std::string path, int nFrames) {
 
-		f += 1;
+	// The file holds raw float32 values pose-by-pose, which is exactly the column-major
+	// layout of the data matrix (one column per frame), so it is read in a single pass
+	long nBytes = File::sizeOf(path);
+	long bytesPerFrame = nFrames > 0 ? nBytes / nFrames : 0;
+	if (nBytes <= 0 || nFrames <= 0 || bytesPerFrame * nFrames != nBytes || bytesPerFrame % sizeof(float) != 0) {
+		std::cerr << "The binary animation " << path << " (" << nBytes << " bytes) does not hold " << nFrames << " float32 poses" << std::endl;
+		return AnimationProxy();
 	}
 
-	return AnimationProxy(data);
-}
+	int nD = static_cast<int>(bytesPerFrame / sizeof(float));
+	Eigen::MatrixXf data(nD, nFrames);
 
+	FILE* file = fopen(path.c_str(), "rb");
+	if (file == NULL) {
+		std::cerr << "Could not open the binary animation " << path << std::endl;
+		return AnimationProxy();
+	}
+	size_t nRead = fread(data.data(), sizeof(float), data.size(), file);
+	fclose(file);
+	if (nRead != static_cast<size_t>(data.size())) {
+		std::cerr << "Only read " << nRead << " of " << data.size() << " values from " << path << std::endl;
+		return AnimationProxy();
+	}
 
+	return AnimationProxy(data);
+}
\ No newline at end of file
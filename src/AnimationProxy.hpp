@@ -18,7 +18,10 @@ public:
 	Eigen::VectorXf poseByIndex(int);
 	int save(std::string);
 	AnimationProxy subAnimation(int fromIx, int toIx);
+	static AnimationProxy load(std::string);
 	static AnimationProxy fromCSV(std::string);
+	static AnimationProxy fromClip(std::string);
+	static AnimationProxy fromBinary(std::string, int nFrames);
     
 	Eigen::MatrixXf data;
 };
@@ -0,0 +1,225 @@
+#include <algorithm>
+#include <math.h>
+#include <sstream>
+#include <vector>
+
+#include <maya/MGlobal.h>
+#include <maya/MAngle.h>
+#include <maya/MDGModifier.h>
+#include <maya/MDoubleArray.h>
+#include <maya/MFnAnimCurve.h>
+#include <maya/MIntArray.h>
+#include <maya/MPlugArray.h>
+#include <maya/MStringArray.h>
+#include <maya/MTime.h>
+#include <maya/MTimeArray.h>
+
+#include "MayaUtils.hpp"
+#include "ApplyReductionCommand.hpp"
+
+
+#define VERBOSE 0
+
+const char* ApplyReductionCommand::kName = "salientApplyReduction";
+
+MStatus ApplyReductionCommand::doIt(const MArgList& args) {
+    MStatus status;
+
+    status = GatherCommandArguments(args);
+    if (status != MS::kSuccess) {
+        return MS::kFailure;
+    }
+
+    if (VERBOSE == 1) {
+        std::ostringstream os;
+        os << "Rekeying " << fPlugs.size() << " plugs with " << fKeyframes.size() << " keyframes";
+        MGlobal::displayInfo(os.str().c_str());
+    }
+
+    // Every edit is recorded in one change, so the whole write-back undoes as a single step
+    int nValuesPerPlug = (static_cast<int>(fKeyframes.size()) - 1) * 8;
+    int nRekeyed = 0;
+    for (int i = 0; i < fPlugs.size(); i++) {
+        bool rekeyed = false;
+        status = rekey(fPlugs[i], fCubics.data() + i * nValuesPerPlug, rekeyed);
+        if (status != MS::kSuccess) {
+            Log::showStatus(status, std::string("Failed to rekey ") + fPlugs[i].name().asChar());
+            undoIt();
+            return MS::kFailure;
+        }
+        if (rekeyed) {
+            nRekeyed++;
+        } else {
+            std::ostringstream os;
+            os << "Skipped `" << fPlugs[i].name().asChar() << "`: it is driven by something other than a time-keyed anim curve (e.g. a set-driven key)";
+            MGlobal::displayWarning(os.str().c_str());
+        }
+    }
+
+    setResult(static_cast<int>(nRekeyed * fKeyframes.size()));
+    return MS::kSuccess;
+}
+
+MStatus ApplyReductionCommand::redoIt() {
+    MStatus status = fModifier.doIt();
+    if (status != MS::kSuccess) { return status; }
+    return fChange.redoIt();
+}
+
+MStatus ApplyReductionCommand::undoIt() {
+    MStatus status = fChange.undoIt();
+    if (status != MS::kSuccess) { return status; }
+    return fModifier.undoIt();
+}
+
+MStatus ApplyReductionCommand::rekey(const MPlug& plug, const double* cubics, bool& rekeyed) {
+    MStatus status;
+    MTime::Unit timeUnit = MayaConfig::getCurrentFPS();
+    int nKeys = static_cast<int>(fKeyframes.size());
+
+    // Use the time-keyed curve driving the plug, or give an unconnected plug a new one.
+    // Any other driver (a set-driven-key curve, an expression, a constraint) is left alone,
+    // as time keys written into it would corrupt it.
+    MObject curveObj;
+    if (!MayaSampling::findTimeCurve(plug, curveObj)) {
+        MPlugArray sources;
+        plug.connectedTo(sources, true, false, &status);
+        if (status != MS::kSuccess || sources.length() > 0) {
+            rekeyed = false;
+            return MS::kSuccess;
+        }
+    }
+    MFnAnimCurve curve;
+    if (curveObj.isNull()) {
+        curve.create(plug, &fModifier, &status);
+        if (status == MS::kSuccess) { status = fModifier.doIt(); }
+    } else {
+        status = curve.setObject(curveObj);
+    }
+    if (status != MS::kSuccess) { return status; }
+
+    // Clear the range (last key first, so the indices of the keys still to check don't move)
+    MTime first(fKeyframes.front(), timeUnit);
+    MTime last(fKeyframes.back(), timeUnit);
+    for (int k = static_cast<int>(curve.numKeys()) - 1; k >= 0; k--) {
+        MTime t = curve.time(k);
+        if (t >= first && t <= last) {
+            status = curve.remove(k, &fChange);
+            if (status != MS::kSuccess) { return status; }
+        }
+    }
+
+    // Add every key at once; each takes its value from the start of the cubic that
+    // leaves it, and the last takes the end of the last cubic
+    MTimeArray times;
+    MDoubleArray values;
+    for (int k = 0; k < nKeys; k++) {
+        double value = k < nKeys - 1 ? cubics[k * 8 + 1] : cubics[(k - 1) * 8 + 7];
+        times.append(MTime(fKeyframes[k], timeUnit));
+        values.append(MayaSampling::fromUIUnits(plug, value));
+    }
+    status = curve.addKeys(&times, &values, MFnAnimCurve::kTangentFixed, MFnAnimCurve::kTangentFixed, true, &fChange);
+    if (status != MS::kSuccess) { return status; }
+
+    // Free, weighted tangents, shaped by each cubic: it leaves its first key along
+    // p1 -> p2 and arrives at its last key along p3 -> p4
+    status = curve.setIsWeighted(true, &fChange);
+    if (status != MS::kSuccess) { return status; }
+    for (int k = 0; k < nKeys; k++) {
+        unsigned int index;
+        if (!curve.find(times[k], index, &status)) { return MS::kFailure; }
+        curve.setTangentsLocked(index, false, &fChange);
+        curve.setWeightsLocked(index, false, &fChange);
+        curve.setIsBreakdown(index, fIsBreakdown[k], &fChange);
+
+        if (k < nKeys - 1) {
+            const double* c = cubics + k * 8;
+            double dx = c[2] - c[0], dy = c[3] - c[1];
+            MAngle angle(atan2(dy, dx), MAngle::kRadians);
+            status = curve.setTangent(index, angle, sqrt(dx * dx + dy * dy), false, &fChange);
+            if (status != MS::kSuccess) { return status; }
+        }
+        if (k > 0) {
+            const double* c = cubics + (k - 1) * 8;
+            double dx = c[6] - c[4], dy = c[7] - c[5];
+            MAngle angle(atan2(dy, dx), MAngle::kRadians);
+            status = curve.setTangent(index, angle, sqrt(dx * dx + dy * dy), true, &fChange);
+            if (status != MS::kSuccess) { return status; }
+        }
+    }
+
+    rekeyed = true;
+    return MS::kSuccess;
+}
+
+MStatus ApplyReductionCommand::GatherCommandArguments(const MArgList& args) {
+
+    if (args.length() != 4) {
+        std::ostringstream os;
+        os << std::endl;
+        os << "----------------------------------------------" << std::endl;
+        os << "Invalid args" << std::endl;
+        os << "-----------" << std::endl;
+        os << "You must provide 4 arguments:" << std::endl;
+        os << "    1. keyframes (list of ints, frame numbers in increasing order)" << std::endl;
+        os << "    2. breakdowns (list of ints, the keyframes to mark as breakdowns)" << std::endl;
+        os << "    3. attributes to rekey (list of strings, e.g. `pCube1.tx`)" << std::endl;
+        os << "    4. the fitted cubics (list of floats, as returned by salientReduceBatch)." << std::endl;
+        os << "----------------------------------------------" << std::endl;
+        MGlobal::displayError(os.str().c_str());
+        return MS::kFailure;
+    }
+
+    unsigned int ix = 0;
+    MIntArray mKeyframes = args.asIntArray(ix); ix += 1;
+    fKeyframes.clear();
+    for (uint i = 0; i < mKeyframes.length(); i++) {
+        if (i > 0 && mKeyframes[i] <= mKeyframes[i - 1]) {
+            MGlobal::displayError("The keyframes must be given in increasing order");
+            return MS::kFailure;
+        }
+        fKeyframes.push_back(mKeyframes[i]);
+    }
+    if (fKeyframes.size() < 2) {
+        MGlobal::displayError("At least two keyframes are needed to rekey a curve");
+        return MS::kFailure;
+    }
+
+    MIntArray mBreakdowns = args.asIntArray(ix); ix += 1;
+    fIsBreakdown.assign(fKeyframes.size(), false);
+    for (uint i = 0; i < mBreakdowns.length(); i++) {
+        std::vector<int>::iterator found = std::find(fKeyframes.begin(), fKeyframes.end(), mBreakdowns[i]);
+        if (found != fKeyframes.end()) {
+            fIsBreakdown[found - fKeyframes.begin()] = true;
+        }
+    }
+
+    MStringArray mPlugNames = args.asStringArray(ix); ix += 1;
+    fPlugs.clear();
+    for (uint i = 0; i < mPlugNames.length(); i++) {
+        MPlug plug;
+        MStatus status = MayaSampling::findPlug(mPlugNames[i], plug);
+        if (status != MS::kSuccess) {
+            std::ostringstream os;
+            os << "The attribute `" << mPlugNames[i].asChar() << "` could not be found";
+            MGlobal::displayError(os.str().c_str());
+            return MS::kFailure;
+        }
+        fPlugs.push_back(plug);
+    }
+
+    MDoubleArray mCubics = args.asDoubleArray(ix);
+    size_t nExpected = fPlugs.size() * (fKeyframes.size() - 1) * 8;
+    if (mCubics.length() != nExpected) {
+        std::ostringstream os;
+        os << "Expected " << nExpected << " cubic values (8 per keyframe gap per attribute) but was given " << mCubics.length();
+        MGlobal::displayError(os.str().c_str());
+        return MS::kFailure;
+    }
+    fCubics.resize(nExpected);
+    for (uint i = 0; i < mCubics.length(); i++) {
+        fCubics[i] = mCubics[i];
+    }
+
+    return MS::kSuccess;
+}
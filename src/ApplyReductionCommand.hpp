@@ -0,0 +1,35 @@
+#pragma once
+
+#include <vector>
+
+#include <maya/MArgList.h>
+#include <maya/MSyntax.h>
+#include <maya/MPxCommand.h>
+#include <maya/MPlug.h>
+#include <maya/MAnimCurveChange.h>
+#include <maya/MDGModifier.h>
+
+
+class ApplyReductionCommand : public MPxCommand {
+public:
+    virtual MStatus doIt(const MArgList& args);
+    virtual MStatus redoIt();
+    virtual MStatus undoIt();
+    virtual bool isUndoable() const { return true; }
+    static void* creator() { return new ApplyReductionCommand; }
+    const static char* kName;
+
+private:
+    MStatus GatherCommandArguments(const MArgList& args);
+    MStatus rekey(const MPlug& plug, const double* cubics, bool& rekeyed);
+
+    std::vector<int> fKeyframes;
+    std::vector<bool> fIsBreakdown;
+    std::vector<MPlug> fPlugs;
+    std::vector<double> fCubics;
+
+    // Keys edited on existing curves are recorded in the change, and curves created for
+    // plugs that had none are recorded in the modifier
+    MAnimCurveChange fChange;
+    MDGModifier fModifier;
+};
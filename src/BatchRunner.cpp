@@ -0,0 +1,352 @@
+#include <algorithm>
+#include <iostream>
+#include <map>
+#include <new>
+#include <set>
+#include <sstream>
+#include <thread>
+
+#include "AnimationLoader.hpp"
+#include "AnimationProxy.hpp"
+#include "BatchRunner.hpp"
+#include "ErrorTable.hpp"
+#include "Interpolator.hpp"
+#include "Profiler.hpp"
+#include "SelectionManager.hpp"
+
+static bool hasExtension(std::string path, std::string extension) {
+	return path.size() >= extension.size() && path.compare(path.size() - extension.size(), extension.size(), extension) == 0;
+}
+
+static bool isAbsolute(std::string path) {
+	return (path.size() > 0 && (path[0] == '/' || path[0] == '\\')) || (path.size() > 1 && path[1] == ':');
+}
+
+static std::string directoryOf(std::string path) {
+	size_t found = path.find_last_of("/\\");
+	return found == std::string::npos ? "." : path.substr(0, found);
+}
+
+// The fixed keyframes in increasing order, without repeats
+static std::vector<int> sortedKeyframes(std::vector<int> keyframes) {
+	std::sort(keyframes.begin(), keyframes.end());
+	keyframes.erase(std::unique(keyframes.begin(), keyframes.end()), keyframes.end());
+	return keyframes;
+}
+
+static std::vector<int> parseKeyframes(std::string csv) {
+	std::vector<int> keyframes;
+	std::istringstream is(csv);
+	std::string token;
+	while (std::getline(is, token, ',')) {
+		if (token.find_first_not_of(" \t\r") != std::string::npos) {
+			keyframes.push_back(std::stoi(token));
+		}
+	}
+	return keyframes;
+}
+
+std::vector<BatchClip> BatchRunner::clipsFrom(std::string source) {
+	std::vector<BatchClip> clips;
+
+	if (OS::isDirectory(source)) {
+		std::vector<std::string> names = OS::listDirectory(source);
+		std::sort(names.begin(), names.end());
+		for (size_t i = 0; i < names.size(); i++) {
+			if (hasExtension(names[i], ".csv") || hasExtension(names[i], CLIP_EXTENSION)) {
+				clips.push_back(BatchClip(source + "/" + names[i]));
+			}
+		}
+		return clips;
+	}
+
+	std::ifstream manifest(source.c_str());
+	if (!manifest.good()) {
+		std::cerr << "Could not open the manifest " << source << std::endl;
+		return clips;
+	}
+	std::string directory = directoryOf(source);
+	std::string line;
+	while (std::getline(manifest, line)) {
+		if (line.size() > 0 && line[line.size() - 1] == '\r') { line.erase(line.size() - 1); }
+		if (line.find_first_not_of(" \t") == std::string::npos || line[0] == '#') { continue; }
+
+		size_t tab = line.find('\t');
+		std::string path = line.substr(0, tab);
+		std::vector<int> fixedKeyframes;
+		if (tab != std::string::npos) {
+			try {
+				fixedKeyframes = parseKeyframes(line.substr(tab + 1));
+			} catch (const std::exception&) {
+				std::cerr << "Ignoring the fixed keyframes of " << path << ", which are not a list of frame indices" << std::endl;
+			}
+		}
+		clips.push_back(BatchClip(isAbsolute(path) ? path : directory + "/" + path, fixedKeyframes));
+	}
+	return clips;
+}
+
+int BatchRunner::run(std::vector<BatchClip> clips) {
+	size_t nTotal = clips.size();
+	if (settings.resume) {
+		clips = skipFinished(clips);
+	}
+
+	output.open(settings.outputPath.c_str(), settings.resume ? std::ios::out | std::ios::app : std::ios::out | std::ios::trunc);
+	if (!output.good()) {
+		std::cerr << "Could not open " << settings.outputPath << " for the results" << std::endl;
+		return 1;
+	}
+	if (settings.exportPath.length() > 0) {
+		writer = new CompressedAnimationWriter(settings.exportPath);
+		if (!writer->isOpen()) {
+			std::cerr << "Could not open " << settings.exportPath << " for the compressed clips" << std::endl;
+			delete writer;
+			writer = NULL;
+			return 1;
+		}
+	}
+
+	int nJobs = settings.nJobs > 0 ? settings.nJobs : static_cast<int>(std::thread::hardware_concurrency());
+	nJobs = std::max(1, std::min(nJobs, static_cast<int>(clips.size())));
+	std::cerr << "Reducing " << clips.size() << " clips (" << nTotal - clips.size() << " already done) with " << nJobs << " workers" << std::endl;
+
+	Profiler::Clock::time_point start = Profiler::Clock::now();
+	size_t next = 0;
+	std::vector<std::thread> workers;
+	for (int w = 0; w < nJobs; w++) {
+		workers.push_back(std::thread(&BatchRunner::work, this, std::cref(clips), std::ref(next), clips.size()));
+	}
+	for (size_t w = 0; w < workers.size(); w++) {
+		workers[w].join();
+	}
+	output.close();
+	long long exportedBytes = 0;
+	if (writer != NULL) {
+		if (writer->close() != 0) {
+			std::cerr << "Failed to write the compressed clips to " << settings.exportPath << std::endl;
+			nFailed += 1;
+		}
+		exportedBytes = writer->bytesWritten();
+		delete writer;
+		writer = NULL;
+	}
+
+	double seconds = Profiler::secondsSince(start);
+	JSONObject summary;
+	summary.set("clips", nFinished);
+	summary.set("failed", nFailed);
+	summary.set("frames", nFramesDone);
+	summary.set("seconds", seconds);
+	summary.set("clipsPerSecond", seconds > 0.0 ? nFinished / seconds : 0.0);
+	summary.set("framesPerSecond", seconds > 0.0 ? nFramesDone / seconds : 0.0);
+	summary.set("peakMemoryMB", OS::peakMemoryBytes() / (1024.0 * 1024.0));
+	if (settings.exportPath.length() > 0) {
+		summary.set("exportedBytes", exportedBytes);
+	}
+	std::cout << summary.str() << std::endl;
+
+	return nFailed > 0 ? 1 : 0;
+}
+
+void BatchRunner::work(const std::vector<BatchClip>& clips, size_t& next, size_t nTotal) {
+	while (true) {
+		size_t i;
+		{
+			std::lock_guard<std::mutex> lock(mutex);
+			if (next >= clips.size()) { return; }
+			i = next++;
+		}
+
+		int nFrames = 0;
+		std::string line = process(clips[i], nFrames);
+		bool failed = nFrames < 0;
+
+		std::lock_guard<std::mutex> lock(mutex);
+		output << line << "\n";
+		output.flush();
+		nFinished += 1;
+		nFailed += failed ? 1 : 0;
+		nFramesDone += std::max(nFrames, 0);
+		std::cerr << "[" << nFinished << "/" << nTotal << "] " << clips[i].path << (failed ? " failed" : "") << std::endl;
+	}
+}
+
+// Reduces one clip and returns its line of output, setting nFrames to the clip's length
+// (or to -1 when it failed)
+std::string BatchRunner::process(const BatchClip& clip, int& nFrames) {
+	JSONObject json;
+	json.set("clip", clip.path);
+
+	AnimationProxy anim = AnimationProxy::load(clip.path);
+	nFrames = anim.getNFrames();
+	if (nFrames < 2) {
+		nFrames = -1;
+		json.set("failed", "the clip could not be read or has fewer than two frames");
+		return json.str();
+	}
+
+	std::vector<int> fixedKeyframes = sortedKeyframes(clip.fixedKeyframes);
+	if (fixedKeyframes.size() > 0 && (fixedKeyframes.front() < 0 || fixedKeyframes.back() >= nFrames)) {
+		nFrames = -1;
+		json.set("failed", "a fixed keyframe is outside the clip");
+		return json.str();
+	}
+
+	// Tables are copied into the selectors, so a clip briefly holds two of each
+	int nKeyframes = settings.nKeyframes > 0 ? settings.nKeyframes : std::max(2, nFrames / 5);
+	size_t bytes =
+		2 * ErrorTable::memoryFor(nFrames, settings.maxSpan) +
+		static_cast<size_t>(std::min(nKeyframes, nFrames)) * nFrames * sizeof(int) +
+		3 * anim.data.size() * sizeof(float);
+	reserveMemory(bytes);
+
+	try {
+		SelectionManager manager(settings.errorType, anim, fixedKeyframes, settings.maxSpan, NULL, settings.nThreadsPerClip);
+		manager.incrementUntilNKeyframes(nKeyframes);
+		SelectionProxy proxy = manager.getFinalSelectionProxy();
+
+		int n = std::min(std::max(nKeyframes, proxy.getMinKeyframes()), proxy.getMaxKeyframes());
+		std::vector<int> selection = proxy.getSelectionByNKeyframes(n);
+		std::vector<float> errors;
+		for (int k = proxy.getMinKeyframes(); k <= proxy.getMaxKeyframes(); k++) {
+			errors.push_back(proxy.getErrorByNKeyframes(k));
+		}
+
+		// Every curve is fitted against the first row (the frame numbers)
+		std::vector<HighDimCubic> cubics = Interpolate::optimalForEachCurve(anim.data, selection, settings.nThreadsPerClip);
+		int nSegments = static_cast<int>(selection.size()) - 1;
+		std::ostringstream curves;
+		curves << "[";
+		for (int c = 0; nSegments > 0 && c < static_cast<int>(cubics.size()) / nSegments; c++) {
+			std::vector<float> values;
+			for (int s = 0; s < nSegments; s++) {
+				const HighDimCubic& cubic = cubics[c * nSegments + s];
+				const Eigen::VectorXf* points[4] = { &cubic.p1, &cubic.p2, &cubic.p3, &cubic.p4 };
+				for (int p = 0; p < 4; p++) {
+					values.push_back((*points[p])[0]);
+					values.push_back((*points[p])[1]);
+				}
+			}
+			curves << (c > 0 ? "," : "") << JSONObject::array(values);
+		}
+		curves << "]";
+
+		json.set("frames", nFrames);
+		json.set("dims", anim.getNDims());
+		json.set("errorType", settings.errorType);
+		json.set("settings", settingsJSON());
+		json.setRaw("fixedKeyframes", JSONObject::array(fixedKeyframes));
+		json.setRaw("selection", JSONObject::array(selection));
+		json.set("error", static_cast<double>(proxy.getErrorByNKeyframes(n)));
+		json.set("minKeyframes", proxy.getMinKeyframes());
+		json.setRaw("errors", JSONObject::array(errors));
+		json.setRaw("cubics", curves.str());
+
+		// The record is encoded outside the lock, which only covers the write
+		if (writer != NULL) {
+			std::string record = CompressedClip::encode(anim.data, selection, cubics);
+			int failed;
+			{
+				std::lock_guard<std::mutex> lock(mutex);
+				failed = writer->addEncoded(clip.path, record);
+			}
+			if (failed != 0) {
+				nFrames = -1;
+				json = JSONObject();
+				json.set("clip", clip.path);
+				json.set("failed", "the compressed clip could not be written");
+			} else {
+				json.set("exportedBytes", static_cast<long long>(record.size()));
+			}
+		}
+	} catch (const std::bad_alloc&) {
+		nFrames = -1;
+		json = JSONObject();
+		json.set("clip", clip.path);
+		json.set("failed", "ran out of memory");
+	}
+
+	releaseMemory(bytes);
+	return json.str();
+}
+
+// The settings that change a clip's results, as each line of output records them
+JSONObject BatchRunner::settingsJSON() const {
+	JSONObject json;
+	json.set("errorType", settings.errorType);
+	json.set("keyframes", settings.nKeyframes);
+	json.set("maxSpan", settings.maxSpan);
+	return json;
+}
+
+// Keeps the complete lines of an earlier run's output that were made with the same
+// settings (and, for the clips still to reduce, the same fixed keyframes), and returns
+// the clips it lacks
+std::vector<BatchClip> BatchRunner::skipFinished(const std::vector<BatchClip>& clips) {
+	std::ifstream previous(settings.outputPath.c_str(), std::ios::in | std::ios::binary);
+	if (!previous.good()) { return clips; }
+
+	std::map<std::string, std::string> fixedByClip;
+	for (size_t i = 0; i < clips.size(); i++) {
+		fixedByClip[JSONObject::quote(clips[i].path)] = "\"fixedKeyframes\":" + JSONObject::array(sortedKeyframes(clips[i].fixedKeyframes));
+	}
+
+	std::string prefix = "{\"clip\":";
+	std::string sameSettings = "\"settings\":" + settingsJSON().str();
+	std::set<std::string> finished;
+	std::string kept;
+	std::string line;
+	int nOtherSettings = 0;
+	while (std::getline(previous, line)) {
+
+		// A last line without a newline was cut short
+		if (previous.eof()) { break; }
+		if (line.compare(0, prefix.size(), prefix) != 0 || line[line.size() - 1] != '}' || line.find("\"failed\":") != std::string::npos) {
+			continue;
+		}
+
+		// The clip's path, still quoted, to compare against JSONObject::quote
+		size_t end = prefix.size() + 1;
+		while (end < line.size() && line[end] != '"') {
+			end += line[end] == '\\' ? 2 : 1;
+		}
+		std::string path = line.substr(prefix.size(), end - prefix.size() + 1);
+		std::map<std::string, std::string>::const_iterator fixed = fixedByClip.find(path);
+		if (line.find(sameSettings) == std::string::npos || (fixed != fixedByClip.end() && line.find(fixed->second) == std::string::npos)) {
+			nOtherSettings++;
+			continue;
+		}
+		finished.insert(path);
+		kept += line + "\n";
+	}
+	previous.close();
+	File::writeBytesToFile(settings.outputPath, kept.data(), kept.size());
+	if (nOtherSettings > 0) {
+		std::cerr << "Redoing " << nOtherSettings << " clips reduced with other settings or fixed keyframes" << std::endl;
+	}
+
+	std::vector<BatchClip> remaining;
+	for (size_t i = 0; i < clips.size(); i++) {
+		if (finished.count(JSONObject::quote(clips[i].path)) == 0) {
+			remaining.push_back(clips[i]);
+		}
+	}
+	return remaining;
+}
+
+void BatchRunner::reserveMemory(size_t bytes) {
+	if (settings.memoryBudget == 0) { return; }
+	std::unique_lock<std::mutex> lock(mutex);
+	while (memoryReserved > 0 && memoryReserved + bytes > settings.memoryBudget) {
+		memoryFreed.wait(lock);
+	}
+	memoryReserved += bytes;
+}
+
+void BatchRunner::releaseMemory(size_t bytes) {
+	if (settings.memoryBudget == 0) { return; }
+	std::lock_guard<std::mutex> lock(mutex);
+	memoryReserved -= bytes;
+	memoryFreed.notify_all();
+}
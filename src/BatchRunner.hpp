@@ -0,0 +1,81 @@
+#pragma once
+
+#include <condition_variable>
+#include <fstream>
+#include <mutex>
+#include <string>
+#include <vector>
+
+#include "CompressedAnimation.hpp"
+#include "common.hpp"
+
+// One clip to reduce, and the keyframes (frame indices) it must keep
+class BatchClip {
+public:
+	BatchClip(std::string path, std::vector<int> fixedKeyframes = std::vector<int>()) : path(path), fixedKeyframes(fixedKeyframes) {}
+	std::string path;
+	std::vector<int> fixedKeyframes;
+};
+
+class BatchSettings {
+public:
+	BatchSettings() : errorType("line"), nKeyframes(0), maxSpan(0), nJobs(0), nThreadsPerClip(1), memoryBudget(0), resume(false) {}
+	std::string errorType;
+	int nKeyframes;         // 0 for a fifth of each clip's frames
+	int maxSpan;
+	int nJobs;              // clips in flight at once, 0 for one per core
+	int nThreadsPerClip;
+	size_t memoryBudget;    // bytes, 0 for no limit
+	bool resume;
+	std::string outputPath;
+	std::string exportPath; // also write every reduced clip to this compressed file
+};
+
+// Selects keyframes for many clips and fits cubics to every curve of each, for offline
+// reduction of whole libraries without Maya.
+//
+// Clips come from a manifest (one path per line, relative to the manifest, optionally
+// followed by a tab and comma-separated fixed keyframes; # starts a comment) or from
+// every CSV file and clip in a directory. A pool of workers takes clips one at a time.
+// Before a clip's error tables are built its working set is estimated and reserved from
+// the memory budget, and a worker waits while the reservation does not fit (a clip
+// larger than the whole budget runs once nothing else does).
+//
+// Each finished clip is written to the output as one JSON line, in the order clips
+// finish: the selection and its error, the error for every number of keyframes, and the
+// cubics of each curve (eight values per span, as for salientReduceBatch). Clips that
+// fail get a line with a "failed" reason instead. Each line records the settings it was
+// made with (error type, number of keyframes and maximum span). When resuming, clips
+// with a complete line made with the same settings and fixed keyframes are skipped, and
+// anything else in the file (failures, a line cut short by an interruption, a line made
+// with other settings) is dropped and redone.
+//
+// Given an export path, each reduced clip is also written to one compressed file (see
+// CompressedAnimation), named by its path, as soon as it is done.
+class BatchRunner {
+public:
+	BatchRunner(BatchSettings settings) : settings(settings), writer(NULL), memoryReserved(0), nFinished(0), nFailed(0), nFramesDone(0) {}
+	static std::vector<BatchClip> clipsFrom(std::string manifestOrDirectory);
+	int run(std::vector<BatchClip> clips);
+
+private:
+	void work(const std::vector<BatchClip>& clips, size_t& next, size_t nTotal);
+	std::string process(const BatchClip& clip, int& nFrames);
+	std::vector<BatchClip> skipFinished(const std::vector<BatchClip>& clips);
+	JSONObject settingsJSON() const;
+	void reserveMemory(size_t bytes);
+	void releaseMemory(size_t bytes);
+
+	BatchSettings settings;
+	std::ofstream output;
+
+	CompressedAnimationWriter* writer;
+
+	// Guards everything below, and the output and the writer
+	std::mutex mutex;
+	std::condition_variable memoryFreed;
+	size_t memoryReserved;
+	int nFinished;
+	int nFailed;
+	long long nFramesDone;
+};
@@ -0,0 +1,275 @@
+#include <math.h>
+#include <string.h>
+#include <algorithm>
+
+#include "CompressedAnimation.hpp"
+#include "Interpolator.hpp"
+
+// Newton steps taken to find the parameter of a cubic at a time
+#define SAMPLER_NEWTON_STEPS 8
+
+template <typename T>
+static void append(std::string& bytes, const T* values, size_t n) {
+	bytes.append(reinterpret_cast<const char*>(values), n * sizeof(T));
+}
+
+static uint16_t quantize(double fraction) {
+	double q = floor(fraction * COMPRESSED_LEVELS + 0.5);
+	return static_cast<uint16_t>(std::min(std::max(q, 0.0), static_cast<double>(COMPRESSED_LEVELS)));
+}
+
+// The size of a clip's record, before padding
+static size_t recordSize(int nCurves, int nKeyframes) {
+	return 2 * sizeof(int32_t)
+		+ static_cast<size_t>(nKeyframes) * sizeof(float)
+		+ static_cast<size_t>(nCurves) * 2 * sizeof(float)
+		+ static_cast<size_t>(nCurves) * nKeyframes * sizeof(uint16_t)
+		+ static_cast<size_t>(nCurves) * (nKeyframes - 1) * 4 * sizeof(uint16_t);
+}
+
+std::string CompressedClip::encode(const Eigen::MatrixXf& poses, const std::vector<int>& keyframes, const std::vector<HighDimCubic>& cubics) {
+	int32_t counts[2] = { static_cast<int32_t>(poses.rows()) - 1, static_cast<int32_t>(keyframes.size()) };
+	int nCurves = counts[0];
+	int nKeyframes = counts[1];
+	int nSpans = nKeyframes - 1;
+
+	std::vector<float> times(nKeyframes);
+	for (int k = 0; k < nKeyframes; k++) { times[k] = poses(0, keyframes[k]); }
+
+	// Each curve's range covers its keyframes' values and its inner control points
+	std::vector<float> ranges(2 * nCurves);
+	std::vector<uint16_t> keyValues(static_cast<size_t>(nCurves) * nKeyframes);
+	std::vector<uint16_t> spans(static_cast<size_t>(nCurves) * nSpans * 4);
+	for (int c = 0; c < nCurves; c++) {
+		float lowest = poses(c + 1, keyframes[0]);
+		float highest = lowest;
+		for (int k = 0; k < nKeyframes; k++) {
+			lowest = std::min(lowest, poses(c + 1, keyframes[k]));
+			highest = std::max(highest, poses(c + 1, keyframes[k]));
+		}
+		for (int s = 0; s < nSpans; s++) {
+			const HighDimCubic& cubic = cubics[c * nSpans + s];
+			lowest = std::min(lowest, std::min(cubic.p2[1], cubic.p3[1]));
+			highest = std::max(highest, std::max(cubic.p2[1], cubic.p3[1]));
+		}
+		float step = (highest - lowest) / COMPRESSED_LEVELS;
+		ranges[2 * c] = lowest;
+		ranges[2 * c + 1] = step;
+
+		for (int k = 0; k < nKeyframes; k++) {
+			keyValues[c * nKeyframes + k] = step > 0.0f ? quantize((poses(c + 1, keyframes[k]) - lowest) / double(highest - lowest)) : 0;
+		}
+		for (int s = 0; s < nSpans; s++) {
+			const HighDimCubic& cubic = cubics[c * nSpans + s];
+			uint16_t* span = &spans[(static_cast<size_t>(c) * nSpans + s) * 4];
+			double length = times[s + 1] - times[s];
+			span[0] = step > 0.0f ? quantize((cubic.p2[1] - lowest) / double(highest - lowest)) : 0;
+			span[1] = step > 0.0f ? quantize((cubic.p3[1] - lowest) / double(highest - lowest)) : 0;
+			span[2] = length > 0.0 ? quantize((cubic.p2[0] - times[s]) / length) : 0;
+			span[3] = length > 0.0 ? quantize((cubic.p3[0] - times[s]) / length) : 0;
+		}
+	}
+
+	std::string bytes;
+	bytes.reserve(recordSize(nCurves, nKeyframes) + 3);
+	append(bytes, counts, 2);
+	append(bytes, times.data(), times.size());
+	append(bytes, ranges.data(), ranges.size());
+	append(bytes, keyValues.data(), keyValues.size());
+	append(bytes, spans.data(), spans.size());
+	bytes.resize((bytes.size() + 3) / 4 * 4, '\0');
+	return bytes;
+}
+
+CompressedAnimationWriter::CompressedAnimationWriter(std::string path) :
+	handle(path.c_str(), std::ios::out | std::ios::binary), nBytes(0) {
+
+	// The header is written again on close, once the directory is known
+	char header[32] = { 0 };
+	handle.write(header, sizeof(header));
+	nBytes = sizeof(header);
+}
+
+// Fits every curve between the keyframes, then writes the clip straight away
+int CompressedAnimationWriter::add(std::string name, const Eigen::MatrixXf& poses, const std::vector<int>& keyframes, int nThreads) {
+	if (poses.rows() < 2 || keyframes.size() < 2) {
+		return 1;
+	}
+	std::vector<HighDimCubic> cubics = Interpolate::optimalForEachCurve(poses, keyframes, nThreads);
+	return addEncoded(name, CompressedClip::encode(poses, keyframes, cubics));
+}
+
+int CompressedAnimationWriter::addEncoded(std::string name, const std::string& record) {
+	if (!isOpen()) {
+		return 1;
+	}
+	handle.write(record.data(), record.size());
+	names.push_back(name);
+	offsets.push_back(nBytes);
+	sizes.push_back(static_cast<long long>(record.size()));
+	nBytes += record.size();
+	return handle.good() ? 0 : 1;
+}
+
+int CompressedAnimationWriter::close() {
+	if (!handle.is_open()) {
+		return 0;
+	}
+
+	std::string directory;
+	for (size_t i = 0; i < names.size(); i++) {
+		int32_t length = static_cast<int32_t>(names[i].size());
+		int64_t place[2] = { offsets[i], sizes[i] };
+		append(directory, &length, 1);
+		directory.append(names[i]);
+		append(directory, place, 2);
+	}
+	handle.write(directory.data(), directory.size());
+
+	int32_t header[4] = { 0, COMPRESSED_VERSION, static_cast<int32_t>(names.size()), 0 };
+	memcpy(header, "SPAN", 4);
+	int64_t place[2] = { nBytes, static_cast<int64_t>(directory.size()) };
+	handle.seekp(0);
+	handle.write(reinterpret_cast<const char*>(header), sizeof(header));
+	handle.write(reinterpret_cast<const char*>(place), sizeof(place));
+	nBytes += directory.size();
+
+	bool ok = handle.good();
+	handle.close();
+	return ok ? 0 : 1;
+}
+
+CompressedAnimation::CompressedAnimation(std::string path) : file(path), valid(false) {
+	int32_t header[4];
+	int64_t place[2];
+	if (!file.isOpen() || file.size() < sizeof(header) + sizeof(place)) {
+		std::cerr << "Could not open the compressed animation " << path << std::endl;
+		return;
+	}
+	memcpy(header, file.data(), sizeof(header));
+	memcpy(place, file.data() + sizeof(header), sizeof(place));
+	if (memcmp(header, "SPAN", 4) != 0 || header[1] != COMPRESSED_VERSION) {
+		std::cerr << "The file " << path << " is not a version " << COMPRESSED_VERSION << " compressed animation" << std::endl;
+		return;
+	}
+	if (header[2] < 0 || place[0] < 0 || place[1] < 0 || static_cast<size_t>(place[0] + place[1]) > file.size()) {
+		std::cerr << "The compressed animation " << path << " has no complete directory (was it closed?)" << std::endl;
+		return;
+	}
+
+	const char* entry = file.data() + place[0];
+	const char* end = entry + place[1];
+	for (int i = 0; i < header[2]; i++) {
+		int32_t length;
+		int64_t record[2];
+		if (end - entry < static_cast<long long>(sizeof(length))) { break; }
+		memcpy(&length, entry, sizeof(length));
+		entry += sizeof(length);
+		if (length < 0 || end - entry < length + static_cast<long long>(sizeof(record))) { break; }
+
+		CompressedClip clip;
+		clip.name.assign(entry, length);
+		entry += length;
+		memcpy(record, entry, sizeof(record));
+		entry += sizeof(record);
+
+		// Each record must hold the arrays its counts call for
+		int32_t counts[2] = { -1, -1 };
+		if (record[0] >= 0 && record[1] >= static_cast<int64_t>(sizeof(counts)) && static_cast<size_t>(record[0] + record[1]) <= file.size() && record[0] % 4 == 0) {
+			memcpy(counts, file.data() + record[0], sizeof(counts));
+		}
+		if (counts[0] < 0 || counts[1] < 2 || recordSize(counts[0], counts[1]) > static_cast<size_t>(record[1])) {
+			std::cerr << "The clip `" << clip.name << "` in " << path << " is not a complete record" << std::endl;
+			clips.clear();
+			return;
+		}
+
+		const char* data = file.data() + record[0] + sizeof(counts);
+		clip.nCurves = counts[0];
+		clip.nKeyframes = counts[1];
+		clip.times = reinterpret_cast<const float*>(data);
+		clip.ranges = clip.times + clip.nKeyframes;
+		clip.keyValues = reinterpret_cast<const uint16_t*>(clip.ranges + 2 * clip.nCurves);
+		clip.spans = clip.keyValues + static_cast<size_t>(clip.nCurves) * clip.nKeyframes;
+		clips.push_back(clip);
+	}
+	if (static_cast<int>(clips.size()) != header[2]) {
+		std::cerr << "The directory of " << path << " lists " << header[2] << " clips but only " << clips.size() << " could be read" << std::endl;
+		clips.clear();
+		return;
+	}
+	valid = true;
+}
+
+int CompressedAnimation::find(std::string name) const {
+	for (size_t i = 0; i < clips.size(); i++) {
+		if (clips[i].name == name) { return static_cast<int>(i); }
+	}
+	return -1;
+}
+
+// The parameter at which a span's cubic reaches the fraction tau of the span's time, when
+// its inner control points are at the fractions b and c. Newton steps that would leave the
+// bracket around the root are replaced by bisection, so the search always converges.
+static inline float spanParameter(float tau, float b, float c) {
+	float k1 = 3.0f * b;
+	float k2 = 3.0f * c - 6.0f * b;
+	float k3 = 1.0f + 3.0f * b - 3.0f * c;
+	float lo = 0.0f, hi = 1.0f, u = tau;
+	for (int i = 0; i < SAMPLER_NEWTON_STEPS; i++) {
+		float x = ((k3 * u + k2) * u + k1) * u - tau;
+		if (fabsf(x) < 1e-6f) { break; }
+		if (x > 0.0f) { hi = u; } else { lo = u; }
+		float dx = (3.0f * k3 * u + 2.0f * k2) * u + k1;
+		float next = dx > 1e-6f ? u - x / dx : -1.0f;
+		u = next > lo && next < hi ? next : 0.5f * (lo + hi);
+	}
+	return u;
+}
+
+void CurveSampler::sample(const CompressedClip& clip, const float* times, int nTimes, float* out) {
+	sampleCurves(clip, 0, clip.nCurves, times, nTimes, out);
+}
+
+void CurveSampler::sampleCurves(const CompressedClip& clip, int firstCurve, int nCurves, const float* times, int nTimes, float* out) {
+	int nKeyframes = clip.nKeyframes;
+	int nSpans = nKeyframes - 1;
+	const float* keyTimes = clip.times;
+	const float levels = 1.0f / COMPRESSED_LEVELS;
+
+	for (int t = 0; t < nTimes; t++) {
+		float time = times[t];
+		float* values = out + static_cast<size_t>(t) * nCurves;
+
+		// Outside the keyframes, curves hold their end values
+		if (!(time > keyTimes[0]) || !(time < keyTimes[nSpans])) {
+			int k = time > keyTimes[0] ? nSpans : 0;
+			for (int c = 0; c < nCurves; c++) { values[c] = clip.keyValue(firstCurve + c, k); }
+			continue;
+		}
+
+		int s = static_cast<int>(std::upper_bound(keyTimes, keyTimes + nKeyframes, time) - keyTimes) - 1;
+		float tau = (time - keyTimes[s]) / (keyTimes[s + 1] - keyTimes[s]);
+		for (int c = 0; c < nCurves; c++) {
+			int curve = firstCurve + c;
+			const uint16_t* keys = clip.keyValues + static_cast<size_t>(curve) * nKeyframes + s;
+			const uint16_t* span = clip.spans + (static_cast<size_t>(curve) * nSpans + s) * 4;
+			float u = spanParameter(tau, span[2] * levels, span[3] * levels);
+			float oneSubU = 1.0f - u;
+
+			// The value is linear in the quantized control points, so it is dequantized last
+			float q =
+				keys[0] * (oneSubU * oneSubU * oneSubU) +
+				span[0] * (3.0f * oneSubU * oneSubU * u) +
+				span[1] * (3.0f * oneSubU * u * u) +
+				keys[1] * (u * u * u);
+			values[c] = clip.ranges[2 * curve] + q * clip.ranges[2 * curve + 1];
+		}
+	}
+}
+
+float CurveSampler::sampleCurve(const CompressedClip& clip, int curve, float time) {
+	float value;
+	sampleCurves(clip, curve, 1, &time, 1, &value);
+	return value;
+}
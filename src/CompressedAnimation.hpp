@@ -0,0 +1,109 @@
+#pragma once
+
+#include <stdint.h>
+#include <fstream>
+#include <string>
+#include <vector>
+
+#include "common.hpp"
+
+#include "../eigen-git-mirror/Eigen/Dense"
+
+// Extension of the compressed animation format
+#define COMPRESSED_EXTENSION ".spanim"
+
+// Bumped whenever the layout of compressed files changes
+#define COMPRESSED_VERSION 1
+
+// Control points are stored as 16-bit fractions of each curve's range
+#define COMPRESSED_LEVELS 65535
+
+// A reduced clip as it lies in a compressed file: the keyframes' times, shared by every
+// curve, and for each curve its value at every keyframe and the two inner control points
+// of the cubic between each pair of keyframes.
+//
+// Values are quantized to 16 bits between the curve's smallest and largest control
+// point (value = offset + q * step), and the inner control points' times as 16-bit
+// fractions of their span, so a curve costs 2 bytes per keyframe and 8 per span (the
+// values and times of the inner control points, next to each other) plus 8 for its range.
+// The pointers point into the file's mapping, so a clip is never copied.
+class CompressedClip {
+public:
+	CompressedClip() : nCurves(0), nKeyframes(0), times(NULL), ranges(NULL), keyValues(NULL), spans(NULL) {}
+
+	std::string name;
+	int nCurves;
+	int nKeyframes;
+	const float* times;         // nKeyframes frame numbers
+	const float* ranges;        // offset and step of each curve
+	const uint16_t* keyValues;  // nKeyframes per curve
+	const uint16_t* spans;      // value, value, time, time for each of nKeyframes - 1 spans per curve
+
+	float duration() const { return nKeyframes > 0 ? times[nKeyframes - 1] - times[0] : 0.0f; }
+	float keyValue(int curve, int k) const { return ranges[2 * curve] + keyValues[curve * nKeyframes + k] * ranges[2 * curve + 1]; }
+
+	// The bytes of a clip's record, from the poses (frame numbers in the first row, one
+	// curve in each row after it), its keyframes (frame indices) and the cubics fitted to
+	// each curve between them (as Interpolate::optimalForEachCurve returns them)
+	static std::string encode(const Eigen::MatrixXf& poses, const std::vector<int>& keyframes, const std::vector<HighDimCubic>& cubics);
+};
+
+// Writes compressed clips to one file as they are made, so a library of any size is
+// never held in memory: each clip is written as soon as it is added, and only its name
+// and place in the file are kept for the directory written by close().
+//
+// Files start with a 32-byte header ("SPAN", COMPRESSED_VERSION, the number of clips and
+// a reserved int32, then the directory's offset and size as int64), which is filled in on
+// close. Each clip's record (nCurves and nKeyframes as int32, then the arrays in the order
+// CompressedClip lists them) is padded to 4 bytes. The directory lists, for each clip,
+// the length of its name (int32), the name, and the record's offset and size (int64).
+class CompressedAnimationWriter {
+public:
+	CompressedAnimationWriter(std::string path);
+	~CompressedAnimationWriter() { close(); }
+	bool isOpen() const { return handle.is_open() && handle.good(); }
+	int add(std::string name, const Eigen::MatrixXf& poses, const std::vector<int>& keyframes, int nThreads = 0);
+	int addEncoded(std::string name, const std::string& record);
+	int close();
+	long long bytesWritten() const { return nBytes; }
+	int nClipsWritten() const { return static_cast<int>(names.size()); }
+
+private:
+	std::ofstream handle;
+	long long nBytes;
+	std::vector<std::string> names;
+	std::vector<long long> offsets;
+	std::vector<long long> sizes;
+};
+
+// Reads a compressed file through a memory mapping. Clips are views into the mapping,
+// so they are only valid while the reader is.
+class CompressedAnimation {
+public:
+	CompressedAnimation(std::string path);
+	bool isOpen() const { return valid; }
+	int nClips() const { return static_cast<int>(clips.size()); }
+	const CompressedClip& clip(int i) const { return clips[i]; }
+	int find(std::string name) const;
+	size_t size() const { return file.size(); }
+
+private:
+	MappedFile file;
+	bool valid;
+	std::vector<CompressedClip> clips;
+};
+
+// Evaluates compressed curves at any times, without allocating.
+//
+// For each time, the span holding it is found once (a binary search of the keyframe
+// times) and then every curve is evaluated in it: the curve's cubic is in time and value,
+// as Maya's curves are, so the parameter at that time is found with a few safeguarded
+// Newton steps before the value is. Times before the first keyframe or after the last
+// take the first or last keyframe's values.
+class CurveSampler {
+public:
+	// Writes nTimes x nCurves values to out, time by time
+	static void sample(const CompressedClip& clip, const float* times, int nTimes, float* out);
+	static void sampleCurves(const CompressedClip& clip, int firstCurve, int nCurves, const float* times, int nTimes, float* out);
+	static float sampleCurve(const CompressedClip& clip, int curve, float time);
+};
@@ -0,0 +1,265 @@
+#include <algorithm>
+#include <limits>
+#include <math.h>
+
+#include "CubicFitter.hpp"
+
+#define COARSE_STEPS 16
+#define NEWTON_STEPS 8
+
+typedef Eigen::Matrix<double, 4, SAMPLES_PER_CURVE> SampleTable;
+typedef Eigen::Matrix<double, 4, FITTING_RESOLUTION> GridTable;
+
+// Bernstein weights at each step of the reparameterisation grid (one column per step)
+static GridTable makeGridBasis() {
+	GridTable basis;
+	for (int k = 0; k < FITTING_RESOLUTION; k++) {
+		double u = k / double(FITTING_RESOLUTION - 1);
+		double oneSubU = 1.0 - u;
+		basis(0, k) = oneSubU * oneSubU * oneSubU;
+		basis(1, k) = 3.0 * oneSubU * oneSubU * u;
+		basis(2, k) = 3.0 * oneSubU * u * u;
+		basis(3, k) = u * u * u;
+	}
+	return basis;
+}
+
+// Powers [1, u, u^2, u^3] of the evenly spaced sample parameters
+static SampleTable makeSamplePowers() {
+	SampleTable powers;
+	for (int s = 0; s < SAMPLES_PER_CURVE; s++) {
+		double u = s / double(SAMPLES_PER_CURVE - 1);
+		powers(0, s) = 1.0; powers(1, s) = u; powers(2, s) = u * u; powers(3, s) = u * u * u;
+	}
+	return powers;
+}
+
+static const GridTable gridBasis = makeGridBasis();
+static const SampleTable samplePowers = makeSamplePowers();
+
+// The squared distance from a sample to the cubic at u, less the sample's own squared
+// norm, given the cubic's Gram matrix G and the sample's projection h onto its coefficients
+static double distanceTerm(const Eigen::Matrix4d& G, const Eigen::Vector4d& h, double u) {
+	Eigen::Vector4d p(1.0, u, u * u, u * u * u);
+	return p.dot(G * p) - 2.0 * h.dot(p);
+}
+
+// Half the first and second derivatives of the squared distance at u
+static void distanceDerivatives(const Eigen::Matrix4d& G, const Eigen::Vector4d& h, double u, double& d1, double& d2) {
+	Eigen::Vector4d p(1.0, u, u * u, u * u * u);
+	Eigen::Vector4d dp(0.0, 1.0, 2.0 * u, 3.0 * u * u);
+	Eigen::Vector4d ddp(0.0, 0.0, 2.0, 6.0 * u);
+	Eigen::Vector4d Gp = G * p;
+	d1 = dp.dot(Gp) - h.dot(dp);
+	d2 = dp.dot(G * dp) + ddp.dot(Gp) - h.dot(ddp);
+}
+
+CubicFitter::CubicFitter(int nDims) :
+	targets(nDims, SAMPLES_PER_CURVE),
+	samples(nDims, SAMPLES_PER_CURVE),
+	control(nDims, 4),
+	coefficients(nDims, 4),
+	fitted(nDims, SAMPLES_PER_CURVE),
+	gridPoints(nDims, FITTING_RESOLUTION),
+	projections(4, SAMPLES_PER_CURVE),
+	rhs(nDims, 2),
+	origin(nDims),
+	parameters(SAMPLES_PER_CURVE),
+	distances(FITTING_RESOLUTION),
+	warmControl(nDims, 4),
+	warmParameters(SAMPLES_PER_CURVE) {
+}
+
+void CubicFitter::sampleAt(const Eigen::MatrixXf& data, double x, Eigen::MatrixXd::ColXpr out) const {
+	int left = static_cast<int>(floor(x));
+	int right = static_cast<int>(ceil(x));
+	if (left == right) {
+		out = data.col(left).cast<double>() - origin;
+	} else {
+		double t = x - left;
+		out = data.col(left).cast<double>() * (1.0 - t) + data.col(right).cast<double>() * t - origin;
+	}
+}
+
+void CubicFitter::sampleTargets(const Eigen::MatrixXf& data, int from, int to) {
+
+	// Everything is kept relative to the first pose, which keeps the Gram matrix well scaled
+	origin = data.col(from).cast<double>();
+	for (int s = 0; s < SAMPLES_PER_CURVE; s++) {
+		sampleAt(data, from + (to - from) * (s / double(SAMPLES_PER_CURVE - 1)), targets.col(s));
+	}
+}
+
+void CubicFitter::solveControlPoints(const Eigen::MatrixXf& data, int from, int to) {
+
+	// Sample the animation where the current parameters place each sample, and pin the
+	// end control points to the first and last of them
+	for (int s = 0; s < SAMPLES_PER_CURVE; s++) {
+		sampleAt(data, from + (to - from) * parameters[s], samples.col(s));
+	}
+	control.col(0) = samples.col(0);
+	control.col(3) = samples.col(SAMPLES_PER_CURVE - 1);
+
+	// Least-squares solve for the inner control points via the 2x2 normal equations
+	Eigen::Matrix2d normal = Eigen::Matrix2d::Zero();
+	rhs.setZero();
+	for (int s = 0; s < SAMPLES_PER_CURVE; s++) {
+		double u = parameters[s];
+		double oneSubU = 1.0 - u;
+		double b0 = oneSubU * oneSubU * oneSubU;
+		double b1 = 3.0 * oneSubU * oneSubU * u;
+		double b2 = 3.0 * oneSubU * u * u;
+		double b3 = u * u * u;
+		normal(0, 0) += b1 * b1; normal(0, 1) += b1 * b2; normal(1, 1) += b2 * b2;
+		rhs.col(0) += b1 * (samples.col(s) - b0 * control.col(0) - b3 * control.col(3));
+		rhs.col(1) += b2 * (samples.col(s) - b0 * control.col(0) - b3 * control.col(3));
+	}
+	normal(1, 0) = normal(0, 1);
+
+	double det = normal.determinant();
+	if (fabs(det) > 1e-12) {
+		double a = normal(1, 1) / det, b = -normal(0, 1) / det, c = normal(0, 0) / det;
+		control.col(1) = a * rhs.col(0) + b * rhs.col(1);
+		control.col(2) = b * rhs.col(0) + c * rhs.col(1);
+	} else {
+		control.col(1) = control.col(0) + (control.col(3) - control.col(0)) / 3.0;
+		control.col(2) = control.col(0) + (control.col(3) - control.col(0)) * (2.0 / 3.0);
+	}
+}
+
+void CubicFitter::resetParameters() {
+	for (int s = 0; s < SAMPLES_PER_CURVE; s++) {
+		parameters[s] = s / double(SAMPLES_PER_CURVE - 1);
+	}
+}
+
+void CubicFitter::computeCoefficients() {
+	coefficients.col(0) = control.col(0);
+	coefficients.col(1) = 3.0 * (control.col(1) - control.col(0));
+	coefficients.col(2) = 3.0 * (control.col(0) - 2.0 * control.col(1) + control.col(2));
+	coefficients.col(3) = control.col(3) - control.col(0) + 3.0 * (control.col(1) - control.col(2));
+}
+
+HighDimCubic CubicFitter::fit(const Eigen::MatrixXf& data, int from, int to) {
+	sampleTargets(data, from, to);
+	resetParameters();
+
+	for (int i = 0; i < FITTING_ITERATIONS; i++) {
+		solveControlPoints(data, from, to);
+
+		// Evaluate the cubic at every grid step at once, then move each sample to the
+		// step closest to its evenly spaced target
+		gridPoints.noalias() = control * gridBasis;
+		for (int s = 0; s < SAMPLES_PER_CURVE; s++) {
+			distances.noalias() = (gridPoints.colwise() - targets.col(s)).colwise().squaredNorm();
+			int bestK = 0;
+			double minDist = std::numeric_limits<double>::infinity();
+			for (int k = 0; k < FITTING_RESOLUTION; k++) {
+				if (distances[k] < minDist) {
+					minDist = distances[k];
+					bestK = k;
+				}
+			}
+			parameters[s] = bestK / double(FITTING_RESOLUTION - 1);
+		}
+	}
+
+	return cubic();
+}
+
+void CubicFitter::fitSpan(const Eigen::MatrixXf& data, int from, int to, int iterations, bool coldStart) {
+	sampleTargets(data, from, to);
+	if (coldStart) {
+		resetParameters();
+	}
+
+	for (int it = 0; it < iterations; it++) {
+		solveControlPoints(data, from, to);
+
+		// The cubic's Gram matrix and the targets' projections onto its coefficients are
+		// all the Newton steps need
+		computeCoefficients();
+		Eigen::Matrix4d G;
+		G.noalias() = coefficients.transpose() * coefficients;
+		projections.noalias() = coefficients.transpose() * targets;
+
+		for (int s = 0; s < SAMPLES_PER_CURVE; s++) {
+			Eigen::Vector4d h = projections.col(s);
+			double u = parameters[s];
+
+			// Without a previous fit to start from, begin at the best of a coarse grid
+			if (coldStart) {
+				double best = distanceTerm(G, h, u);
+				for (int k = 0; k < COARSE_STEPS; k++) {
+					double candidate = k / (COARSE_STEPS - 1.0);
+					double value = distanceTerm(G, h, candidate);
+					if (value < best) { best = value; u = candidate; }
+				}
+			}
+
+			for (int k = 0; k < NEWTON_STEPS; k++) {
+				double d1, d2;
+				distanceDerivatives(G, h, u, d1, d2);
+				if (d2 <= 1e-12) { break; }
+				double next = std::min(1.0, std::max(0.0, u - d1 / d2));
+				bool converged = fabs(next - u) < 1e-9;
+				u = next;
+				if (converged) { break; }
+			}
+			parameters[s] = u;
+		}
+	}
+}
+
+std::pair<int, float> CubicFitter::fitSpanGuarded(const Eigen::MatrixXf& data, int from, int to, int warmIterations, int coldIterations, double margin) {
+	fitSpan(data, from, to, warmIterations, false);
+	std::pair<int, float> warm = spanError(from, to);
+	warmControl = control;
+	warmParameters = parameters;
+
+	// The cubic through the evenly spaced samples costs one solve, and a good warm fit is
+	// never much worse than it
+	resetParameters();
+	solveControlPoints(data, from, to);
+	if (warm.second <= margin * spanError(from, to).second) {
+		control = warmControl;
+		parameters = warmParameters;
+		return warm;
+	}
+
+	fitSpan(data, from, to, coldIterations, true);
+	std::pair<int, float> cold = spanError(from, to);
+	if (cold.second <= warm.second) { return cold; }
+	control = warmControl;
+	parameters = warmParameters;
+	return warm;
+}
+
+std::pair<int, float> CubicFitter::spanError(int from, int to) {
+	computeCoefficients();
+	fitted.noalias() = coefficients * samplePowers;
+	fitted -= targets;
+
+	double sumSquaredDist = 0.0;
+	double maxDist = 0.0;
+	int maxIndex = -1;
+	for (int s = 0; s < SAMPLES_PER_CURVE; s++) {
+		double dist = fitted.col(s).squaredNorm();
+		sumSquaredDist += dist;
+		if (dist > maxDist) {
+			maxDist = dist;
+			maxIndex = static_cast<int>(round(from + (to - from) * (s / double(SAMPLES_PER_CURVE - 1))));
+		}
+	}
+
+	return std::make_pair(maxIndex, static_cast<float>(sumSquaredDist));
+}
+
+HighDimCubic CubicFitter::cubic() const {
+	return HighDimCubic(
+		(control.col(0) + origin).cast<float>(),
+		(control.col(1) + origin).cast<float>(),
+		(control.col(2) + origin).cast<float>(),
+		(control.col(3) + origin).cast<float>()
+	);
+}
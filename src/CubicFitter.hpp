@@ -0,0 +1,62 @@
+#pragma once
+
+#include <utility>
+
+#include "../eigen-git-mirror/Eigen/Dense"
+
+#include "common.hpp"
+
+#define FITTING_ITERATIONS 4
+#define SAMPLES_PER_CURVE 10
+#define FITTING_RESOLUTION 100
+
+// Fits cubics to spans of an animation (one pose per column).
+//
+// The Bernstein weights for the evenly spaced samples and for every step of the
+// reparameterisation grid are tabulated once, and each fitter owns scratch buffers
+// sized for its dimensionality, so fitting many spans allocates nothing. Keep one
+// fitter per thread.
+//
+// Two fits are offered:
+//   - fit() is the reference fit (what HighDimCubic::fitToCurve and Interpolate use):
+//     FITTING_ITERATIONS rounds of a least-squares solve for the inner control points
+//     followed by a search of the whole FITTING_RESOLUTION grid for each sample, with
+//     the grid's points evaluated as a single matrix product.
+//   - fitSpan() is the fast fit used to fill error tables: it can be warm-started from
+//     the parameters of a neighbouring span and reparameterises by Newton's method
+//     using the cubic's Gram matrix, so its cost per step does not grow with dimension.
+//     fitSpanGuarded() is the warm-started fit with a safeguard: on rough motion a warm
+//     start can settle far from the best fit, so when the warm fit's error is more than
+//     margin times that of the cubic through the evenly spaced samples (where a cold fit
+//     starts), the span is refitted cold and the better of the two fits is kept.
+class CubicFitter {
+public:
+	CubicFitter(int nDims);
+
+	HighDimCubic fit(const Eigen::MatrixXf& data, int from, int to);
+	void fitSpan(const Eigen::MatrixXf& data, int from, int to, int iterations, bool coldStart);
+	std::pair<int, float> fitSpanGuarded(const Eigen::MatrixXf& data, int from, int to, int warmIterations, int coldIterations, double margin);
+	std::pair<int, float> spanError(int from, int to);
+	HighDimCubic cubic() const;
+
+private:
+	void sampleAt(const Eigen::MatrixXf& data, double x, Eigen::MatrixXd::ColXpr out) const;
+	void sampleTargets(const Eigen::MatrixXf& data, int from, int to);
+	void solveControlPoints(const Eigen::MatrixXf& data, int from, int to);
+	void computeCoefficients();
+	void resetParameters();
+
+	Eigen::MatrixXd targets;
+	Eigen::MatrixXd samples;
+	Eigen::MatrixXd control;
+	Eigen::MatrixXd coefficients;
+	Eigen::MatrixXd fitted;
+	Eigen::MatrixXd gridPoints;
+	Eigen::MatrixXd projections;
+	Eigen::MatrixXd rhs;
+	Eigen::VectorXd origin;
+	Eigen::VectorXd parameters;
+	Eigen::RowVectorXd distances;
+	Eigen::MatrixXd warmControl;
+	Eigen::VectorXd warmParameters;
+};
@@ -0,0 +1,52 @@
+#include <algorithm>
+
+#include "CurveErrorEngine.hpp"
+
+#define CURVE_COLD_ITERATIONS FITTING_ITERATIONS
+#define CURVE_WARM_ITERATIONS 2
+
+// A warm fit whose error is more than this times that of the cubic through the evenly
+// spaced samples is refitted cold (see CubicFitter::fitSpanGuarded)
+#define CURVE_WARM_MARGIN 1.25
+
+// Finds the error of each span (i, jFrom) to (i, jTo) and hands it to store, with the
+// index of the sample furthest from the fitted cubic.
+//
+// Chains start cold at the first fitted span (five frames) and at every length that is a
+// multiple of CURVE_WARM_START_SPANS. A run that starts inside a chain first fits the
+// chain's earlier spans without storing them, so every span's fit is warm-started from
+// the same place wherever the run starts.
+template <typename Store>
+static void curveSpans(const Eigen::MatrixXf& data, int i, int jFrom, int jTo, CubicFitter& fitter, Store store) {
+	int chainStart = jFrom;
+	if (jFrom - i > 4) {
+		chainStart = i + std::max(4, (jFrom - i) / CURVE_WARM_START_SPANS * CURVE_WARM_START_SPANS);
+	}
+
+	for (int j = chainStart; j <= jTo; j++) {
+		int nFrames = j - i + 1;
+		if (nFrames == 2) {
+			store(j, i, 0.0f);
+		} else if (nFrames <= 4) {
+			store(j, i + 1, 0.0f);
+		} else {
+			std::pair<int, float> indexAndValue;
+			if (nFrames == 5 || (j - i) % CURVE_WARM_START_SPANS == 0) {
+				fitter.fitSpan(data, i, j, CURVE_COLD_ITERATIONS, true);
+				indexAndValue = fitter.spanError(i, j);
+			} else {
+				indexAndValue = fitter.fitSpanGuarded(data, i, j, CURVE_WARM_ITERATIONS, CURVE_COLD_ITERATIONS, CURVE_WARM_MARGIN);
+			}
+			if (j < jFrom) { continue; }
+			store(j, indexAndValue.first, indexAndValue.second);
+		}
+	}
+}
+
+void CurveErrorEngine::computeSpans(int i, int jFrom, int jTo, ErrorTable& table, CubicFitter& fitter) const {
+	curveSpans(data, i, jFrom, jTo, fitter, [&](int j, int index, float value) { table.set(i, j, index, value); });
+}
+
+void CurveErrorEngine::computeRow(int i, int jFrom, int jTo, float* values, CubicFitter& fitter) const {
+	curveSpans(data, i, jFrom, jTo, fitter, [&](int j, int, float value) { values[j - jFrom] = value; });
+}
@@ -0,0 +1,41 @@
+#pragma once
+
+#include "../eigen-git-mirror/Eigen/Dense"
+
+#include "CubicFitter.hpp"
+#include "ErrorTable.hpp"
+
+// Warm-start chains along a row restart at spans whose length is a multiple of this
+#define CURVE_WARM_START_SPANS 32
+
+// Fills an ErrorTable with the curve-based error: for each span (i, j), a cubic is
+// fitted to the poses from i to j and the error is the sum of squared distances
+// between the cubic and the poses at evenly spaced samples.
+//
+// Spans in a row (fixed i) are visited in order of j, and each fit is warm-started
+// from the sample parameters of the previous span using CubicFitter::fitSpan, so it
+// needs fewer iterations than a fit from scratch. A warm start can settle far from the
+// best fit on rough motion, so each warm fit goes through CubicFitter::fitSpanGuarded,
+// which refits the span cold when the warm fit is clearly poor. Warm-start chains
+// restart every CURVE_WARM_START_SPANS spans, and a run of spans that starts inside a
+// chain first refits the chain's earlier spans, so a row can be split anywhere without
+// changing any result. computeRow gives the same errors for callers that keep them
+// somewhere other than a table.
+//
+// Tolerance, against HighDimCubic::fitToCurve (240-500 frame synthetic clips, 3-20
+// dimensions): on smooth motion-capture-like clips the errors are within 1% for 99% of
+// spans and within 2.5% for every span. On rough clips (random walks) they are within
+// 3% for 99% of spans and 25% for every span while the frame axis dominates, but only
+// within 20% and about 2.2 times for walks whose steps are large next to a frame, where
+// a cold fit can also settle in a different minimum from the reference's. Newton is
+// not limited to a 100-step grid, so about half of the spans come out lower than
+// before, and selections on rough clips can differ from the reference's.
+class CurveErrorEngine {
+public:
+	CurveErrorEngine(const Eigen::MatrixXf& data) : data(data) {}
+	void computeSpans(int i, int jFrom, int jTo, ErrorTable& table, CubicFitter& fitter) const;
+	void computeRow(int i, int jFrom, int jTo, float* values, CubicFitter& fitter) const;
+
+private:
+	const Eigen::MatrixXf& data;
+};
@@ -1,3 +1,4 @@
+#include <algorithm>
 #include <iostream>
 #include <sstream>
 #include <limits.h>
@@ -5,57 +6,132 @@
 #include "../eigen-git-mirror/Eigen/Dense"
 
 #include "AnimationProxy.hpp"
+#include "CurveErrorEngine.hpp"
 #include "ErrorTable.hpp"
+#include "LineErrorEngine.hpp"
 #include "common.hpp"
 
-ErrorTable ErrorTable::usingLineBasedError(AnimationProxy anim) {
-	ErrorTable table = ErrorTable(anim);
+ErrorTable::ErrorTable(int nFrames, int maxSpan) : nFrames(nFrames) {
+	this->maxSpan = maxSpan > 0 && maxSpan < nFrames - 1 ? maxSpan : std::max(nFrames - 1, 0);
 
-	#pragma omp parallel for collapse(2)
-	for (int i = 0; i < anim.getNFrames(); i++) {
-		for (int j = i + 1; j < anim.getNFrames(); j++) {
-			std::pair<int, float> indexAndValue = table.indexAndErrorViaMaxPerpDistToLine(i, j);
-			table.errorIndices(i, j) = indexAndValue.first;
-			table.errorValues(i, j) = indexAndValue.second;
-		}
+	columnOffsets.assign(std::max(nFrames, 1), 0);
+	size_t nSpans = 0;
+	for (int j = 0; j < nFrames; j++) {
+		columnOffsets[j] = nSpans;
+		nSpans += j - firstInColumn(j);
 	}
+	errorIndices.assign(nSpans, -1);
+	errorValues.assign(nSpans, 0.0f);
+}
 
-	return table;
+// What memoryUsage() will report for a table of this size, without allocating it
+size_t ErrorTable::memoryFor(int nFrames, int maxSpan) {
+	size_t n = static_cast<size_t>(std::max(nFrames, 1));
+	size_t span = maxSpan > 0 && maxSpan < nFrames - 1 ? maxSpan : n - 1;
+	size_t nSpans = span * (span + 1) / 2 + (n - 1 - span) * span;
+	return nSpans * (sizeof(float) + sizeof(int)) + n * sizeof(size_t);
 }
 
-ErrorTable ErrorTable::usingCurveBasedError(AnimationProxy anim) {
-	ErrorTable table = ErrorTable(anim);
-
-	#pragma omp parallel for collapse(2)
-	for (int i = 0; i < anim.getNFrames(); i++) {
-		for (int j = i + 1; j < anim.getNFrames(); j++) {
-			int nFrames = j - i + 1;
-			if (nFrames == 2) {
-				table.errorIndices(i, j) = i;
-				table.errorValues(i, j) = 0.0;
-			} else if (nFrames == 3) {
-				table.errorIndices(i, j) = i+1;
-				table.errorValues(i, j) = 0.0;
-			} else if (nFrames == 4) {
-				table.errorIndices(i, j) = i + 1;
-				table.errorValues(i, j) = 0.0;
+// Work is handed to threads in tiles of this many spans from one row. Tiles start at span
+// lengths that are multiples of it, where the curve engine's warm-start chains restart,
+// so no tile refits spans that belong to the tile before it.
+#define ERROR_TABLE_TILE_SPANS (4 * CURVE_WARM_START_SPANS)
+
+namespace {
+
+// The spans (i, jFrom) to (i, jTo) of one segment's table
+class SpanTile {
+public:
+	SpanTile(int segment, int i, int jFrom, int jTo, double cost) :
+		segment(segment), i(i), jFrom(jFrom), jTo(jTo), cost(cost) {}
+	bool operator<(const SpanTile& other) const { return cost > other.cost; }
+	int segment;
+	int i;
+	int jFrom;
+	int jTo;
+	double cost;
+};
+
+}
+
+ErrorTable ErrorTable::usingLineBasedError(AnimationProxy anim, int maxSpan) {
+	return computeAll(std::vector<AnimationProxy>(1, anim), "line", maxSpan)[0];
+}
+
+ErrorTable ErrorTable::usingCurveBasedError(AnimationProxy anim, int maxSpan) {
+	return computeAll(std::vector<AnimationProxy>(1, anim), "curve", maxSpan)[0];
+}
+
+ErrorTable ErrorTable::usingErrorType(AnimationProxy anim, std::string errorType, int maxSpan) {
+	return computeAll(std::vector<AnimationProxy>(1, anim), errorType, maxSpan)[0];
+}
+
+std::vector<ErrorTable> ErrorTable::computeAll(const std::vector<AnimationProxy>& anims, std::string errorType, int maxSpan, int nThreads, TaskProgress* progress) {
+	bool useCurve = errorType == "curve";
+	std::vector<ErrorTable> tables;
+	std::vector<SpanTile> tiles;
+	int nDims = 0;
+	int maxOffsets = 1;
+
+	// Cut every row of every table into tiles, estimating each tile's cost: a curve fit
+	// costs about the same for any span, while a line span costs its number of poses
+	for (size_t s = 0; s < anims.size(); s++) {
+		int nFrames = anims[s].getNFrames();
+		tables.push_back(ErrorTable(nFrames, maxSpan));
+		int span = tables.back().getMaxSpan();
+		nDims = static_cast<int>(anims[s].data.rows());
+		maxOffsets = std::max(maxOffsets, std::min(span + 1, nFrames));
+
+		for (int i = 0; i < nFrames - 1; i++) {
+			int longest = std::min(span, nFrames - 1 - i);
+			for (int first = 1; first <= longest; first = first / ERROR_TABLE_TILE_SPANS * ERROR_TABLE_TILE_SPANS + ERROR_TABLE_TILE_SPANS) {
+				int last = std::min(longest, first / ERROR_TABLE_TILE_SPANS * ERROR_TABLE_TILE_SPANS + ERROR_TABLE_TILE_SPANS - 1);
+				double nSpans = last - first + 1;
+				double cost = useCurve ? nSpans : nSpans * (first + last) * 0.5;
+				tiles.push_back(SpanTile(static_cast<int>(s), i, i + first, i + last, cost));
+			}
+		}
+	}
+
+	// Hand out the most expensive tiles first, so no thread is left with a long one at the end.
+	// Every tile writes its own entries, so the results do not depend on the order.
+	std::stable_sort(tiles.begin(), tiles.end());
+	int nTiles = static_cast<int>(tiles.size());
+	if (progress != NULL) {
+		progress->done = 0;
+		progress->total = nTiles;
+	}
+
+	nThreads = OS::threadsFor(nThreads);
+
+	#pragma omp parallel num_threads(nThreads)
+	{
+		LineErrorEngine::Workspace workspace(useCurve ? 1 : nDims, useCurve ? 1 : maxOffsets);
+		CubicFitter fitter(useCurve ? nDims : 1);
+
+		#pragma omp for schedule(dynamic)
+		for (int t = 0; t < nTiles; t++) {
+			if (progress != NULL && progress->cancelled) { continue; }
+			const SpanTile& tile = tiles[t];
+			const Eigen::MatrixXf& data = anims[tile.segment].data;
+			if (useCurve) {
+				CurveErrorEngine(data).computeSpans(tile.i, tile.jFrom, tile.jTo, tables[tile.segment], fitter);
 			} else {
-				std::pair<int, float> indexAndValue = table.indexAndErrorViaSumSqauredDistToCurve(i, j);
-				table.errorIndices(i, j) = indexAndValue.first;
-				table.errorValues(i, j) = indexAndValue.second;
+				LineErrorEngine(data).computeSpans(tile.i, tile.jFrom, tile.jTo, tables[tile.segment], workspace);
 			}
-			
+			if (progress != NULL) { progress->done++; }
 		}
 	}
 
-	return table;
+	return tables;
 }
 
 int ErrorTable::save(std::string path) {
 	std::string content = "i,j,errorIndex,errorValue\n";
 
-	for (int i = 0; i < errorIndices.rows(); i++) {
-		for (int j = i + 1; j < errorIndices.cols(); j++) {
+	for (int i = 0; i < nFrames; i++) {
+		int last = std::min(i + maxSpan, nFrames - 1);
+		for (int j = i + 1; j <= last; j++) {
 			std::ostringstream os;
 			os << i << "," << j << ",";
 			os << errorIndex(i, j) << ",";
@@ -66,64 +142,49 @@ int ErrorTable::save(std::string path) {
 
 	std::cout << "  Saving error table to " << path << std::endl;
 	return File::writeStringToFile(path, content);
-}	
-
-std::pair<int, float> ErrorTable::indexAndErrorViaMaxPerpDistToLine(int i, int j) {
-	Eigen::VectorXf a = anim.poseByIndex(i);
-	Eigen::VectorXf b = anim.poseByIndex(j);
-	float distEnd2End = (a - b).norm();
-	Eigen::VectorXf vnEnd2End = (a - b) / distEnd2End;
-
-	float maxDist = 0.0f;
-	int maxIndex = -1;
-	for (int k = i + 1; k < j; k++) {
-		Eigen::VectorXf c = anim.poseByIndex(k);
-		float dot = (c - a).dot(vnEnd2End);
-		Eigen::VectorXf p = a + dot * vnEnd2End;
-		float dist = (p - c).norm();
-		if (dist > maxDist) {
-			maxDist = dist;
-			maxIndex = k;
-		}
-	}
-    
-	std::pair<int, float> ret;
-	ret.first = maxIndex;
-	ret.second = maxDist;
-	return ret;
 }
 
-std::pair<int, float> ErrorTable::indexAndErrorViaSumSqauredDistToCurve(int i, int j) {
-	Curve curve(anim.data);
-	HighDimCubic cubic = HighDimCubic::fitToCurve(curve, i, j);	
-
-	int nDims = anim.data.rows();
-	
-	Eigen::MatrixXf r(1, 4);
-	Eigen::MatrixXf rm(1, 4);
-
-	Eigen::VectorXf a;
-	Eigen::VectorXf b;
-
-	int nSamples = 10;
-	float sumSquaredDist = 0.0f;
-	float maxDist = 0.0f;
-	int maxIndex = -1;
-	for (int s = 0; s < nSamples; s++) {
-		float u = s / (nSamples - 1.0);
-		a = cubic.sampleAt(u);
-		float x = i + (j - i) * u;
-		curve.sampleAt(b, x);
-		float dist = (a - b).norm();
-		sumSquaredDist += dist * dist;
-		if (dist > maxDist) {
-			maxDist = dist;
-			maxIndex = (int) round(x);
-		}
+// Binary layout: a header of the magic "SPET", the format version, nFrames, maxSpan and
+// the number of stored spans (int32s), and the key (uint64), followed by the int32
+// indices and then the float32 values, both in storage order
+int ErrorTable::saveBinary(std::string path, unsigned long long key) const {
+	int header[5] = { 0, ERROR_TABLE_VERSION, nFrames, maxSpan, static_cast<int>(errorValues.size()) };
+	memcpy(header, "SPET", 4);
+
+	std::string content;
+	content.append(reinterpret_cast<const char*>(header), sizeof(header));
+	content.append(reinterpret_cast<const char*>(&key), sizeof(key));
+	content.append(reinterpret_cast<const char*>(errorIndices.data()), errorIndices.size() * sizeof(int));
+	content.append(reinterpret_cast<const char*>(errorValues.data()), errorValues.size() * sizeof(float));
+	return File::writeBytesToFile(path, content.data(), content.size());
+}
+
+ErrorTable ErrorTable::fromBinary(std::string path, unsigned long long key) {
+	MappedFile file(path);
+	size_t headerSize = 5 * sizeof(int) + sizeof(key);
+	if (!file.isOpen() || file.size() < headerSize) {
+		return ErrorTable();
+	}
+
+	int header[5];
+	unsigned long long storedKey;
+	memcpy(header, file.data(), sizeof(header));
+	memcpy(&storedKey, file.data() + sizeof(header), sizeof(storedKey));
+	if (memcmp(header, "SPET", 4) != 0 || header[1] != ERROR_TABLE_VERSION || storedKey != key) {
+		return ErrorTable();
+	}
+
+	size_t nSpans = static_cast<size_t>(std::max(header[4], 0));
+	if (header[2] < 0 || file.size() != headerSize + nSpans * (sizeof(int) + sizeof(float))) {
+		return ErrorTable();
+	}
+	ErrorTable table(header[2], header[3]);
+	if (table.errorValues.size() != nSpans) {
+		return ErrorTable();
 	}
-	
-	std::pair<int, float> ret;
-	ret.first = maxIndex;
-	ret.second = sumSquaredDist;
-	return ret;
+
+	const char* body = file.data() + headerSize;
+	memcpy(table.errorIndices.data(), body, nSpans * sizeof(int));
+	memcpy(table.errorValues.data(), body + nSpans * sizeof(int), nSpans * sizeof(float));
+	return table;
 }
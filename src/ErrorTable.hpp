@@ -4,35 +4,66 @@
 
 #include <stdio.h>
 #include <iostream>
+#include <limits>
 #include <string>
 #include <vector>
 
 #include "AnimationProxy.hpp"
+#include "common.hpp"
 
 #include "../eigen-git-mirror/Eigen/Dense"
 
+// Bump whenever a change to the error engines changes the values they compute, so that
+// tables saved by ErrorTableCache under an older version are not reused
+#define ERROR_TABLE_VERSION 1
 
+
+// Errors for the spans (i, j) of an animation, for i < j.
+//
+// Only spans no longer than maxSpan frames (j - i <= maxSpan) are computed and stored,
+// and a maxSpan of zero keeps every span. The values are stored by end frame: column j
+// holds the spans that end at j, starting from the earliest i in the band, so memory
+// (and the work to fill the table) grows linearly with the length of the clip. Spans
+// outside the band have an infinite error.
+//
+// computeAll fills the tables of several segments at once: the rows of every table are cut
+// into tiles, which are shared out between threads, and the results are the same for any
+// number of threads. Given a TaskProgress, it counts the tiles done and, once cancelled,
+// skips the rest (leaving the tables incomplete).
 class ErrorTable {
 public:
-	ErrorTable() { }
-	static ErrorTable usingLineBasedError(AnimationProxy);
-	static ErrorTable usingCurveBasedError(AnimationProxy);
-	
-	float errorIndex(int i, int j) const { return errorIndices(i, j); }
-    float errorValue(int i, int j) const { return errorValues(i, j); }
-    int save(std::string path);
+	ErrorTable() : nFrames(0), maxSpan(0) { }
+	static ErrorTable usingLineBasedError(AnimationProxy, int maxSpan = 0);
+	static ErrorTable usingCurveBasedError(AnimationProxy, int maxSpan = 0);
+	static ErrorTable usingErrorType(AnimationProxy, std::string errorType, int maxSpan = 0);
+	static std::vector<ErrorTable> computeAll(const std::vector<AnimationProxy>& anims, std::string errorType, int maxSpan = 0, int nThreads = 0, TaskProgress* progress = NULL);
+
+	int getNFrames() const { return nFrames; }
+	int getMaxSpan() const { return maxSpan; }
+	bool inBand(int i, int j) const { return i < j && j - i <= maxSpan; }
+	int firstInColumn(int j) const { return j > maxSpan ? j - maxSpan : 0; }
+	int errorIndex(int i, int j) const { return inBand(i, j) ? errorIndices[offset(i, j)] : -1; }
+	float errorValue(int i, int j) const { return inBand(i, j) ? errorValues[offset(i, j)] : std::numeric_limits<float>::infinity(); }
+	const float* columnValues(int j) const { return &errorValues[columnOffsets[j]]; }
+	size_t memoryUsage() const { return errorValues.size() * (sizeof(float) + sizeof(int)) + columnOffsets.size() * sizeof(size_t); }
+	static size_t memoryFor(int nFrames, int maxSpan);
+	int save(std::string path);
+	int saveBinary(std::string path, unsigned long long key) const;
+	static ErrorTable fromBinary(std::string path, unsigned long long key);
  	
 private:
-	std::pair<int, float> indexAndErrorViaMaxPerpDistToLine(int, int);
-	std::pair<int, float> indexAndErrorViaSumSqauredDistToCurve(int, int);
-	
-	ErrorTable(AnimationProxy anim) : anim(anim) {
-		errorIndices = Eigen::MatrixXf(anim.getNFrames(), anim.getNFrames());
-		errorValues = Eigen::MatrixXf(anim.getNFrames(), anim.getNFrames());
-	}
-
-	AnimationProxy anim;
-	Eigen::MatrixXf errorIndices; 
-	Eigen::MatrixXf errorValues;
+	friend class LineErrorEngine;
+	friend class CurveErrorEngine;
+
+	void set(int i, int j, int index, float value) { size_t o = offset(i, j); errorIndices[o] = index; errorValues[o] = value; }
+	size_t offset(int i, int j) const { return columnOffsets[j] + (i - firstInColumn(j)); }
+
+	ErrorTable(int nFrames, int maxSpan);
+
+	int nFrames;
+	int maxSpan;
+	std::vector<size_t> columnOffsets;
+	std::vector<int> errorIndices;
+	std::vector<float> errorValues;
     
 };
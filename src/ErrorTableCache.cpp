@@ -0,0 +1,152 @@
+#include <stdio.h>
+#include <iomanip>
+#include <sstream>
+
+#include "ErrorTableCache.hpp"
+
+#define FNV_OFFSET_BASIS 14695981039346656037ULL
+#define FNV_PRIME 1099511628211ULL
+
+static unsigned long long hashBytes(unsigned long long hash, const void* bytes, size_t nBytes) {
+	const unsigned char* b = static_cast<const unsigned char*>(bytes);
+	for (size_t i = 0; i < nBytes; i++) {
+		hash ^= b[i];
+		hash *= FNV_PRIME;
+	}
+	return hash;
+}
+
+JSONObject CacheStats::toJSON() const {
+	JSONObject json;
+	json.set("memoryHits", memoryHits);
+	json.set("diskHits", diskHits);
+	json.set("misses", misses);
+	return json;
+}
+
+ErrorTableCache& ErrorTableCache::shared() {
+	static ErrorTableCache cache(static_cast<size_t>(ERROR_TABLE_CACHE_MEGABYTES) * 1024 * 1024);
+	return cache;
+}
+
+unsigned long long ErrorTableCache::keyFor(const AnimationProxy& anim, std::string errorType, int maxSpan) {
+	int header[5] = {
+		ERROR_TABLE_VERSION,
+		static_cast<int>(anim.data.rows()),
+		static_cast<int>(anim.data.cols()),
+		maxSpan,
+		static_cast<int>(errorType.size())
+	};
+	unsigned long long hash = FNV_OFFSET_BASIS;
+	hash = hashBytes(hash, header, sizeof(header));
+	hash = hashBytes(hash, errorType.data(), errorType.size());
+	hash = hashBytes(hash, anim.data.data(), anim.data.size() * sizeof(float));
+	return hash;
+}
+
+bool ErrorTableCache::find(const AnimationProxy& anim, std::string errorType, int maxSpan, ErrorTable& table, CacheStats& stats) {
+	unsigned long long key = keyFor(anim, errorType, maxSpan);
+
+	std::string dir;
+	{
+		std::lock_guard<std::mutex> lock(mutex);
+		std::map<unsigned long long, Entries::iterator>::iterator found = index.find(key);
+		if (found != index.end()) {
+			entries.splice(entries.begin(), entries, found->second);
+			stats.memoryHits += 1;
+			table = found->second->second;
+			return true;
+		}
+		dir = directory;
+	}
+
+	if (dir.length() > 0) {
+		ErrorTable loaded = ErrorTable::fromBinary(pathFor(dir, key), key);
+		if (loaded.getNFrames() == anim.getNFrames()) {
+			stats.diskHits += 1;
+			remember(key, loaded);
+			table = loaded;
+			return true;
+		}
+	}
+
+	stats.misses += 1;
+	return false;
+}
+
+void ErrorTableCache::store(const AnimationProxy& anim, std::string errorType, int maxSpan, const ErrorTable& table) {
+	unsigned long long key = keyFor(anim, errorType, maxSpan);
+
+	std::string dir;
+	{
+		std::lock_guard<std::mutex> lock(mutex);
+		dir = directory;
+	}
+
+	// Write to a temporary name first, so that other sessions never read a partial file
+	if (dir.length() > 0) {
+		std::string path = pathFor(dir, key);
+		std::string partial = path + ".partial";
+		if (table.saveBinary(partial, key) == 0 && rename(partial.c_str(), path.c_str()) != 0) {
+			remove(partial.c_str());
+		}
+	}
+
+	remember(key, table);
+}
+
+ErrorTable ErrorTableCache::lookup(const AnimationProxy& anim, std::string errorType, int maxSpan, CacheStats& stats) {
+	ErrorTable table;
+	if (!find(anim, errorType, maxSpan, table, stats)) {
+		table = ErrorTable::usingErrorType(anim, errorType, maxSpan);
+		store(anim, errorType, maxSpan, table);
+	}
+	return table;
+}
+
+void ErrorTableCache::setMemoryBudget(size_t bytes) {
+	std::lock_guard<std::mutex> lock(mutex);
+	memoryBudget = bytes;
+	evict();
+}
+
+void ErrorTableCache::setDirectory(std::string path) {
+	std::lock_guard<std::mutex> lock(mutex);
+	if (path.length() > 0 && !OS::makeDirectory(path)) {
+		std::cerr << "Could not create the error table cache directory `" << path << "`, only caching in memory" << std::endl;
+		path = "";
+	}
+	directory = path;
+}
+
+void ErrorTableCache::clear() {
+	std::lock_guard<std::mutex> lock(mutex);
+	entries.clear();
+	index.clear();
+	memoryUsed = 0;
+}
+
+std::string ErrorTableCache::pathFor(std::string directory, unsigned long long key) {
+	std::ostringstream os;
+	os << directory << "/" << std::hex << std::setw(16) << std::setfill('0') << key << ".spet";
+	return os.str();
+}
+
+void ErrorTableCache::remember(unsigned long long key, const ErrorTable& table) {
+	std::lock_guard<std::mutex> lock(mutex);
+	if (index.count(key) > 0 || table.memoryUsage() > memoryBudget) {
+		return;
+	}
+	entries.push_front(std::make_pair(key, table));
+	index[key] = entries.begin();
+	memoryUsed += table.memoryUsage();
+	evict();
+}
+
+void ErrorTableCache::evict() {
+	while (memoryUsed > memoryBudget && !entries.empty()) {
+		memoryUsed -= entries.back().second.memoryUsage();
+		index.erase(entries.back().first);
+		entries.pop_back();
+	}
+}
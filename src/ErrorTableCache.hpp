@@ -0,0 +1,65 @@
+#pragma once
+
+#include <list>
+#include <map>
+#include <mutex>
+#include <string>
+#include <utility>
+
+#include "AnimationProxy.hpp"
+#include "ErrorTable.hpp"
+#include "common.hpp"
+
+// Default budget for the in-memory tier of the shared cache, in megabytes
+#define ERROR_TABLE_CACHE_MEGABYTES 256
+
+// How many lookups were answered from memory, from disk, or had to be computed
+class CacheStats {
+public:
+	CacheStats() : memoryHits(0), diskHits(0), misses(0) {}
+	void add(const CacheStats& other) { memoryHits += other.memoryHits; diskHits += other.diskHits; misses += other.misses; }
+	JSONObject toJSON() const;
+	int memoryHits;
+	int diskHits;
+	int misses;
+};
+
+// Keeps the error tables of animation segments, so a segment that has not changed since
+// an earlier selection is not recomputed.
+//
+// Tables are keyed by a hash of the segment's pose data, the error type, the maximum span
+// and ERROR_TABLE_VERSION. Recently used tables are kept in memory, up to a budget in
+// bytes (the least recently used are dropped first). When a directory is set, tables are
+// also written there, one binary file per key, and read back through a memory mapping
+// when they are not in memory, so they survive between sessions.
+//
+// find() and store() let a caller compute the missing tables itself (all at once, in
+// parallel); lookup() computes a missing table on the spot. The cache is safe to use from
+// several threads, and tables are computed and written outside its lock.
+class ErrorTableCache {
+public:
+	ErrorTableCache(size_t memoryBudget) : memoryBudget(memoryBudget), memoryUsed(0) {}
+	static ErrorTableCache& shared();
+	static unsigned long long keyFor(const AnimationProxy& anim, std::string errorType, int maxSpan);
+
+	bool find(const AnimationProxy& anim, std::string errorType, int maxSpan, ErrorTable& table, CacheStats& stats);
+	void store(const AnimationProxy& anim, std::string errorType, int maxSpan, const ErrorTable& table);
+	ErrorTable lookup(const AnimationProxy& anim, std::string errorType, int maxSpan, CacheStats& stats);
+	void setMemoryBudget(size_t bytes);
+	void setDirectory(std::string path);
+	void clear();
+
+private:
+	static std::string pathFor(std::string directory, unsigned long long key);
+	void remember(unsigned long long key, const ErrorTable& table);
+	void evict();
+
+	typedef std::list< std::pair<unsigned long long, ErrorTable> > Entries;
+
+	std::mutex mutex;
+	size_t memoryBudget;
+	size_t memoryUsed;
+	std::string directory;
+	Entries entries;
+	std::map<unsigned long long, Entries::iterator> index;
+};
@@ -1,18 +1,58 @@
 #include <sstream>
 
 #include "common.hpp"
+#include "CubicFitter.hpp"
 #include "AnimationProxy.hpp"
 #include "Selector.hpp"
 #include "Interpolator.hpp"
 
 std::vector<HighDimCubic> Interpolate::optimal(const Eigen::MatrixXf& curve, std::vector<int> keyframes) {
 	std::vector<HighDimCubic> ret = std::vector<HighDimCubic>();
+	CubicFitter fitter(static_cast<int>(curve.rows()));
     int start = keyframes[0];
 	for (int i = 1; i < keyframes.size(); i++) {
 		int from = keyframes.at(i - 1) - start;
 		int to = keyframes.at(i) - start;
-		HighDimCubic cubic = HighDimCubic::fitToCurve(curve, from, to);
+		HighDimCubic cubic = fitter.fit(curve, from, to);
 		ret.push_back(cubic);
 	}
 	return ret;
 }
+
+// Fits every curve between every pair of consecutive keyframes. The poses hold the frame
+// number in their first row and one curve in each row after it, and the cubics are
+// returned curve by curve (all of the first curve's segments, then the second's, and so on).
+std::vector<HighDimCubic> Interpolate::optimalForEachCurve(const Eigen::MatrixXf& poses, std::vector<int> keyframes, int nThreads) {
+	int nCurves = static_cast<int>(poses.rows()) - 1;
+	int nSegments = static_cast<int>(keyframes.size()) - 1;
+	if (nCurves <= 0 || nSegments <= 0) {
+		return std::vector<HighDimCubic>();
+	}
+
+	// Pair each curve with the frame numbers, as the fits are done in two dimensions
+	std::vector<Eigen::MatrixXf> curves(nCurves, Eigen::MatrixXf(2, poses.cols()));
+	for (int c = 0; c < nCurves; c++) {
+		curves[c].row(0) = poses.row(0);
+		curves[c].row(1) = poses.row(c + 1);
+	}
+
+	std::vector<HighDimCubic> ret(nCurves * nSegments);
+	int nFits = nCurves * nSegments;
+	int start = keyframes[0];
+
+	nThreads = OS::threadsFor(nThreads);
+
+	#pragma omp parallel num_threads(nThreads)
+	{
+		CubicFitter fitter(2);
+
+		#pragma omp for schedule(dynamic)
+		for (int k = 0; k < nFits; k++) {
+			int c = k / nSegments;
+			int s = k % nSegments;
+			ret[k] = fitter.fit(curves[c], keyframes[s] - start, keyframes[s + 1] - start);
+		}
+	}
+
+	return ret;
+}
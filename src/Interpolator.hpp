@@ -12,4 +12,5 @@
 class Interpolate {
 public:
 	static std::vector<HighDimCubic> optimal(const Eigen::MatrixXf& curve, std::vector<int> keyframes);
+	static std::vector<HighDimCubic> optimalForEachCurve(const Eigen::MatrixXf& poses, std::vector<int> keyframes, int nThreads = 0);
 };
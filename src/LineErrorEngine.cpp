@@ -0,0 +1,74 @@
+#include <algorithm>
+#include <math.h>
+
+#include "LineErrorEngine.hpp"
+
+// Residuals are formed this many poses at a time, which keeps the scratch space
+// small for long spans while still handing Eigen reasonably sized blocks
+#define LINE_ERROR_BLOCK 256
+
+LineErrorEngine::Workspace::Workspace(int nDims, int nFrames) :
+	offsets(nDims, std::max(nFrames, 1)),
+	residuals(nDims, LINE_ERROR_BLOCK),
+	direction(nDims),
+	dots(LINE_ERROR_BLOCK),
+	distances(LINE_ERROR_BLOCK) {
+}
+
+// Finds the error of each span (i, jFrom) to (i, jTo) and hands it to store, with the
+// index of the pose furthest from the span's line
+template <typename Store>
+static void lineSpans(const Eigen::MatrixXf& data, int i, int jFrom, int jTo, LineErrorEngine::Workspace& ws, Store store) {
+
+	// Offsets of the poses after i (up to the widest span) from pose i, shared by every span in the row
+	int nOffsets = jTo - i;
+	if (nOffsets <= 0) { return; }
+	ws.offsets.leftCols(nOffsets) = data.middleCols(i + 1, nOffsets).colwise() - data.col(i);
+
+	for (int j = jFrom; j <= jTo; j++) {
+		int nInner = j - i - 1;
+		if (nInner <= 0) {
+			store(j, -1, 0.0f);
+			continue;
+		}
+
+		ws.direction = ws.offsets.col(j - i - 1);
+		float length = ws.direction.norm();
+		bool hasDirection = length > 0.0f;
+		if (hasDirection) {
+			ws.direction /= length;
+		}
+
+		float maxDist = 0.0f;
+		int maxIndex = -1;
+		for (int b = 0; b < nInner; b += LINE_ERROR_BLOCK) {
+			int n = std::min(LINE_ERROR_BLOCK, nInner - b);
+
+			// Remove each pose's component along the span; what remains is its perpendicular offset.
+			// When the end poses coincide there is no line, so the distance is to the pose itself.
+			ws.residuals.leftCols(n) = ws.offsets.middleCols(b, n);
+			if (hasDirection) {
+				ws.dots.head(n).noalias() = ws.direction.transpose() * ws.offsets.middleCols(b, n);
+				ws.residuals.leftCols(n).noalias() -= ws.direction * ws.dots.head(n);
+			}
+			ws.distances.head(n) = ws.residuals.leftCols(n).colwise().squaredNorm();
+
+			for (int k = 0; k < n; k++) {
+				if (ws.distances[k] > maxDist) {
+					maxDist = ws.distances[k];
+					maxIndex = i + 1 + b + k;
+				}
+			}
+		}
+
+		store(j, maxIndex, sqrt(maxDist));
+	}
+}
+
+void LineErrorEngine::computeSpans(int i, int jFrom, int jTo, ErrorTable& table, Workspace& ws) const {
+	lineSpans(data, i, jFrom, jTo, ws, [&](int j, int index, float value) { table.set(i, j, index, value); });
+}
+
+void LineErrorEngine::computeRow(int i, int jFrom, int jTo, float* values, Workspace& ws) const {
+	lineSpans(data, i, jFrom, jTo, ws, [&](int j, int, float value) { values[j - jFrom] = value; });
+}
@@ -0,0 +1,35 @@
+#pragma once
+
+#include "../eigen-git-mirror/Eigen/Dense"
+
+#include "ErrorTable.hpp"
+
+// Fills an ErrorTable with the line-based error: for each span (i, j), the pose
+// between i and j that lies furthest from the straight line joining poses i and j.
+//
+// Spans are processed in runs from one row (fixed i). The offsets of the later poses
+// from pose i are computed once per run, and then every span in the run reuses them:
+// projecting onto the span's direction is one matrix-vector product, and the
+// perpendicular distances are the column norms of what is left over. computeRow gives
+// the same errors for callers that keep them somewhere other than a table.
+class LineErrorEngine {
+public:
+
+	// Scratch buffers for one thread, sized once so nothing is allocated per span
+	class Workspace {
+	public:
+		Workspace(int nDims, int nFrames);
+		Eigen::MatrixXf offsets;
+		Eigen::MatrixXf residuals;
+		Eigen::VectorXf direction;
+		Eigen::RowVectorXf dots;
+		Eigen::RowVectorXf distances;
+	};
+
+	LineErrorEngine(const Eigen::MatrixXf& data) : data(data) {}
+	void computeSpans(int i, int jFrom, int jTo, ErrorTable& table, Workspace& workspace) const;
+	void computeRow(int i, int jFrom, int jTo, float* values, Workspace& workspace) const;
+
+private:
+	const Eigen::MatrixXf& data;
+};
@@ -7,8 +7,15 @@
 
 #include <sstream>
 #include <stdexcept>
+#include <string.h>
 
 #include <maya/MGlobal.h>
+#include <maya/MDGContext.h>
+#include <maya/MDistance.h>
+#include <maya/MFnAnimCurve.h>
+#include <maya/MFnUnitAttribute.h>
+#include <maya/MPlugArray.h>
+#include <maya/MSelectionList.h>
 
 #include "MayaUtils.hpp"
 
@@ -93,6 +100,55 @@ void Log::showStatusWhenError(MStatus status) {
     showStatus(status);
 }
 
+MayaFlags::MayaFlags(const MArgList& args, const char* const names[][2], int nNames) :
+    args(args), names(names), nNames(nNames) {
+}
+
+unsigned int MayaFlags::indexOf(const char* longName) const {
+    for (int i = 0; i < nNames; i++) {
+        if (strcmp(names[i][1], longName) == 0) {
+            return args.flagIndex(names[i][0], names[i][1]);
+        }
+    }
+    return MArgList::kInvalidArgIndex;
+}
+
+unsigned int MayaFlags::positionalCount() const {
+    unsigned int count = args.length();
+    for (int i = 0; i < nNames; i++) {
+        unsigned int ix = args.flagIndex(names[i][0], names[i][1]);
+        if (ix != MArgList::kInvalidArgIndex && ix < count) {
+            count = ix;
+        }
+    }
+    return count;
+}
+
+bool MayaFlags::isSet(const char* longName) const {
+    return indexOf(longName) != MArgList::kInvalidArgIndex;
+}
+
+MString MayaFlags::asString(const char* longName, MString defaultValue) const {
+    unsigned int ix = indexOf(longName);
+    if (ix == MArgList::kInvalidArgIndex || ix + 1 >= args.length()) { return defaultValue; }
+    ix += 1;
+    return args.asString(ix);
+}
+
+int MayaFlags::asInt(const char* longName, int defaultValue) const {
+    unsigned int ix = indexOf(longName);
+    if (ix == MArgList::kInvalidArgIndex || ix + 1 >= args.length()) { return defaultValue; }
+    ix += 1;
+    return args.asInt(ix);
+}
+
+double MayaFlags::asDouble(const char* longName, double defaultValue) const {
+    unsigned int ix = indexOf(longName);
+    if (ix == MArgList::kInvalidArgIndex || ix + 1 >= args.length()) { return defaultValue; }
+    ix += 1;
+    return args.asDouble(ix);
+}
+
 void MayaCheck::objectIsPointArray(MObject obj) {
     MFn::Type type = obj.apiType();
     if (type != MFn::kPointArrayData) {
@@ -118,3 +174,88 @@ MAngle::Unit MayaConfig::getCurrentAngleUnit() {
     return MAngle::uiUnit();
 }
 
+
+
+MStatus MayaSampling::findPlug(MString name, MPlug& plug) {
+    MSelectionList list;
+    MStatus status = list.add(name);
+    if (status != MS::kSuccess) { return status; }
+    return list.getPlug(0, plug);
+}
+
+double MayaSampling::toUIUnits(const MPlug& plug, double value) {
+    MObject attr = plug.attribute();
+    if (!attr.hasFn(MFn::kUnitAttribute)) { return value; }
+    
+    // Match what getAttr reports, so sampled data lines up with the keys the artist sees
+    MFnUnitAttribute fnUnit(attr);
+    switch (fnUnit.unitType()) {
+        case MFnUnitAttribute::kAngle:
+            return MAngle(value, MAngle::internalUnit()).as(MAngle::uiUnit());
+        case MFnUnitAttribute::kDistance:
+            return MDistance(value, MDistance::internalUnit()).as(MDistance::uiUnit());
+        default:
+            return value;
+    }
+}
+
+double MayaSampling::fromUIUnits(const MPlug& plug, double value) {
+    MObject attr = plug.attribute();
+    if (!attr.hasFn(MFn::kUnitAttribute)) { return value; }
+    
+    MFnUnitAttribute fnUnit(attr);
+    switch (fnUnit.unitType()) {
+        case MFnUnitAttribute::kAngle:
+            return MAngle(value, MAngle::uiUnit()).as(MAngle::internalUnit());
+        case MFnUnitAttribute::kDistance:
+            return MDistance(value, MDistance::uiUnit()).as(MDistance::internalUnit());
+        default:
+            return value;
+    }
+}
+
+// Finds the anim curve whose output drives the plug directly, if it is keyed in time.
+// Set-driven-key curves (animCurveUL, UA, UU and UT) take another attribute as their
+// input, so they are not returned, and neither is a curve behind a conversion node.
+bool MayaSampling::findTimeCurve(const MPlug& plug, MObject& curve) {
+    MStatus status;
+    MPlugArray sources;
+    plug.connectedTo(sources, true, false, &status);
+    if (status != MS::kSuccess || sources.length() != 1 || !sources[0].node().hasFn(MFn::kAnimCurve)) { return false; }
+    
+    MFnAnimCurve fnCurve(sources[0].node(), &status);
+    if (status != MS::kSuccess || !fnCurve.isTimeInput()) { return false; }
+    if (!(sources[0].attribute() == fnCurve.attribute("output"))) { return false; }
+    curve = sources[0].node();
+    return true;
+}
+
+MStatus MayaSampling::samplePlug(const MPlug& plug, double start, int nFrames, double* out, int stride) {
+    MStatus status;
+    MTime::Unit timeUnit = MayaConfig::getCurrentFPS();
+    
+    // When the plug is driven directly by a time-keyed anim curve the curve can be
+    // evaluated natively, which avoids pulling the dependency graph once per frame
+    MObject curveNode;
+    if (findTimeCurve(plug, curveNode)) {
+        MFnAnimCurve curve(curveNode, &status);
+        if (status == MS::kSuccess) {
+            for (int f = 0; f < nFrames; f++) {
+                double value = curve.evaluate(MTime(start + f, timeUnit), &status);
+                if (status != MS::kSuccess) { break; }
+                out[f * stride] = toUIUnits(plug, value);
+            }
+            if (status == MS::kSuccess) { return MS::kSuccess; }
+        }
+    }
+    
+    // Otherwise (or if the curve could not be evaluated) evaluate the plug in the
+    // context of each frame
+    for (int f = 0; f < nFrames; f++) {
+        MDGContext context(MTime(start + f, timeUnit));
+        double value = plug.asDouble(context, &status);
+        if (status != MS::kSuccess) { return status; }
+        out[f * stride] = toUIUnits(plug, value);
+    }
+    return MS::kSuccess;
+}
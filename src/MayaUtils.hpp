@@ -8,11 +8,13 @@
 #ifndef MayaUtils_hpp
 #define MayaUtils_hpp
 
+#include <maya/MArgList.h>
 #include <maya/MString.h>
 #include <maya/MObject.h>
 #include <maya/MStatus.h>
 #include <maya/MTime.h>
 #include <maya/MAngle.h>
+#include <maya/MPlug.h>
 
 class Log {
 public:
@@ -48,6 +50,30 @@ public:
     }
 };
 
+/* Optional flags
+ *
+ * Commands in this plug-in take positional arguments, so optional settings are read
+ * straight from the argument list as trailing `-flag value` pairs. Each command lists
+ * its flags as {short name, long name} pairs, and anything before the first flag is
+ * treated as a positional argument.
+ */
+class MayaFlags {
+public:
+    MayaFlags(const MArgList& args, const char* const names[][2], int nNames);
+    unsigned int positionalCount() const;
+    bool isSet(const char* longName) const;
+    MString asString(const char* longName, MString defaultValue) const;
+    int asInt(const char* longName, int defaultValue) const;
+    double asDouble(const char* longName, double defaultValue) const;
+
+private:
+    unsigned int indexOf(const char* longName) const;
+
+    const MArgList& args;
+    const char* const (*names)[2];
+    int nNames;
+};
+
 class MayaCheck {
 public:
     static void objectIsPointArray(MObject obj);
@@ -60,5 +86,14 @@ public:
     static MAngle::Unit getCurrentAngleUnit();
 };
 
+class MayaSampling {
+public:
+    static MStatus findPlug(MString name, MPlug& plug);
+    static double toUIUnits(const MPlug& plug, double value);
+    static double fromUIUnits(const MPlug& plug, double value);
+    static bool findTimeCurve(const MPlug& plug, MObject& curve);
+    static MStatus samplePlug(const MPlug& plug, double start, int nFrames, double* out, int stride);
+};
+
 
 #endif /* MayaUtils_hpp */
@@ -0,0 +1,179 @@
+#include <algorithm>
+#include <limits>
+#include <map>
+
+#include "CurveErrorEngine.hpp"
+#include "MultiresolutionSelector.hpp"
+#include "SelectionManager.hpp"
+
+MultiresolutionSelector::MultiresolutionSelector(std::string errorType, AnimationProxy anim, std::vector<int> fixedKeyframes, int factor, int window, int maxSpan, ErrorTableCache* cache, int nThreads, Profiler* profiler) :
+	errorType(errorType),
+	anim(anim),
+	fixedKeyframes(fixedKeyframes),
+	nFrames(anim.getNFrames()),
+	factor(std::max(1, factor)),
+	window(window > 0 ? window : (std::max(1, factor) + 1) / 2),
+	maxSpan(maxSpan),
+	cache(cache),
+	nThreads(nThreads),
+	profiler(profiler),
+	workspace(errorType == "curve" ? 1 : static_cast<int>(anim.data.rows()), errorType == "curve" ? 1 : anim.getNFrames()),
+	fitter(errorType == "curve" ? static_cast<int>(anim.data.rows()) : 1),
+	nSpansMeasured(0),
+	coarseSeconds(0.0),
+	refineSeconds(0.0) {
+
+	// The first and last frames are kept in place, as they are by SelectionManager
+	isFixed.assign(std::max(nFrames, 1), false);
+	isFixed[0] = true;
+	isFixed[std::max(nFrames - 1, 0)] = true;
+	for (size_t k = 0; k < fixedKeyframes.size(); k++) {
+		if (fixedKeyframes[k] >= 0 && fixedKeyframes[k] < nFrames) { isFixed[fixedKeyframes[k]] = true; }
+	}
+	for (int f = 0; f < nFrames; f++) {
+		if (f % this->factor == 0 || isFixed[f]) { coarseFrames.push_back(f); }
+	}
+}
+
+SelectionProxy MultiresolutionSelector::select(int maxKeyframes) {
+
+	// Decimate, keeping the frame numbers in the first row so that time is measured in
+	// frames of the original animation
+	if (profiler != NULL) { profiler->begin("decimate"); }
+	int nCoarse = static_cast<int>(coarseFrames.size());
+	Eigen::MatrixXf coarseData(anim.data.rows(), nCoarse);
+	std::vector<int> coarseFixed;
+	for (int c = 0; c < nCoarse; c++) {
+		coarseData.col(c) = anim.data.col(coarseFrames[c]);
+		if (isFixed[coarseFrames[c]] && c != 0 && c != nCoarse - 1) { coarseFixed.push_back(c); }
+	}
+	if (profiler != NULL) {
+		JSONObject details;
+		details.set("factor", factor);
+		details.set("coarseFrames", nCoarse);
+		profiler->end(details);
+	}
+
+	// Select at the coarse resolution; a coarse span of s frames covers at most s * factor
+	// of the original frames, so the maximum span is scaled down to keep within it
+	Profiler::Clock::time_point started = Profiler::Clock::now();
+	int coarseMaxSpan = maxSpan > 0 ? std::max(1, maxSpan / factor) : 0;
+	SelectionManager manager(errorType, AnimationProxy(coarseData), coarseFixed, coarseMaxSpan, cache, nThreads, profiler);
+	manager.incrementUntilNKeyframes(std::min(maxKeyframes, nCoarse));
+	SelectionProxy coarse = manager.getFinalSelectionProxy();
+	cacheStats = manager.getCacheStats();
+	coarseSeconds = Profiler::secondsSince(started);
+
+	// Refine every selection at full resolution
+	if (profiler != NULL) { profiler->begin("refine"); }
+	started = Profiler::Clock::now();
+	std::map< int, std::vector<int> > selections;
+	std::map< int, float > errors;
+	for (int n = coarse.getMinKeyframes(); n <= coarse.getMaxKeyframes(); n++) {
+		std::vector<int> coarseSelection = coarse.getSelectionByNKeyframes(n);
+		if (coarseSelection.empty()) { continue; }
+		for (size_t k = 0; k < coarseSelection.size(); k++) {
+			coarseSelection[k] = coarseFrames[coarseSelection[k]];
+		}
+		float error = 0.0f;
+		selections[n] = refine(coarseSelection, error);
+		errors[n] = error;
+	}
+	refineSeconds = Profiler::secondsSince(started);
+	if (profiler != NULL) {
+		JSONObject details;
+		details.set("window", window);
+		details.set("selections", static_cast<int>(selections.size()));
+		details.set("spansMeasured", nSpansMeasured);
+		profiler->end(details);
+	}
+
+	return SelectionProxy(selections, errors);
+}
+
+// Measures the spans (i, jFrom) to (i, jTo) at full resolution, unless they already are
+void MultiresolutionSelector::measureRow(int i, int jFrom, int jTo) {
+	bool known = true;
+	for (int j = jFrom; j <= jTo && known; j++) {
+		known = spanErrors.count(spanKey(i, j)) > 0;
+	}
+	if (known) { return; }
+
+	row.resize(jTo - jFrom + 1);
+	if (errorType == "curve") {
+		CurveErrorEngine(anim.data).computeRow(i, jFrom, jTo, row.data(), fitter);
+	} else {
+		LineErrorEngine(anim.data).computeRow(i, jFrom, jTo, row.data(), workspace);
+	}
+	for (int j = jFrom; j <= jTo; j++) {
+		spanErrors[spanKey(i, j)] = row[j - jFrom];
+	}
+	nSpansMeasured += jTo - jFrom + 1;
+}
+
+std::vector<int> MultiresolutionSelector::refine(const std::vector<int>& coarseSelection, float& error) {
+	int n = static_cast<int>(coarseSelection.size());
+
+	// The frames each keyframe may move to, as ranges (fixed keyframes stay where they are)
+	std::vector<int> first(n), last(n);
+	for (int m = 0; m < n; m++) {
+		int k = coarseSelection[m];
+		if (isFixed[k]) {
+			first[m] = k;
+			last[m] = k;
+		} else {
+			first[m] = std::max(1, k - window);
+			last[m] = std::min(nFrames - 2, k + window);
+		}
+	}
+
+	// best[m][c] is the smallest maximum error of keyframes 0 to m with keyframe m at
+	// frame first[m] + c, and back[m][c] is where keyframe m - 1 is then
+	std::vector< std::vector<float> > best(n);
+	std::vector< std::vector<int> > back(n);
+	best[0].assign(1, 0.0f);
+	back[0].assign(1, -1);
+	for (int m = 1; m < n; m++) {
+		int nCandidates = last[m] - first[m] + 1;
+		best[m].assign(nCandidates, std::numeric_limits<float>::infinity());
+		back[m].assign(nCandidates, -1);
+		for (int p = first[m - 1]; p <= last[m - 1]; p++) {
+			float before = best[m - 1][p - first[m - 1]];
+			int jFrom = std::max(p + 1, first[m]);
+			int jTo = last[m];
+			if (maxSpan > 0) { jTo = std::min(jTo, p + maxSpan); }
+			if (jFrom > jTo || before == std::numeric_limits<float>::infinity()) { continue; }
+
+			measureRow(p, jFrom, jTo);
+			for (int j = jFrom; j <= jTo; j++) {
+				float value = std::max(before, spanErrors[spanKey(p, j)]);
+				if (value < best[m][j - first[m]]) {
+					best[m][j - first[m]] = value;
+					back[m][j - first[m]] = p;
+				}
+			}
+		}
+	}
+
+	// Walk back from the last keyframe, which is always the last frame
+	std::vector<int> selection(n);
+	int c = last[n - 1];
+	error = best[n - 1][c - first[n - 1]];
+	for (int m = n - 1; m >= 0; m--) {
+		selection[m] = c;
+		if (m > 0) { c = back[m][c - first[m]]; }
+	}
+	return selection;
+}
+
+JSONObject MultiresolutionSelector::toJSON() const {
+	JSONObject json;
+	json.set("factor", factor);
+	json.set("window", window);
+	json.set("frames", nFrames);
+	json.set("coarseFrames", static_cast<int>(coarseFrames.size()));
+	json.set("spansMeasured", nSpansMeasured);
+	json.set("coarseSeconds", coarseSeconds);
+	json.set("refineSeconds", refineSeconds);
+	return json;
+}
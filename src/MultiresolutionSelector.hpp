@@ -0,0 +1,68 @@
+#pragma once
+
+#include <string>
+#include <unordered_map>
+#include <vector>
+
+#include "AnimationProxy.hpp"
+#include "CubicFitter.hpp"
+#include "ErrorTableCache.hpp"
+#include "LineErrorEngine.hpp"
+#include "Profiler.hpp"
+#include "SelectionProxy.hpp"
+#include "common.hpp"
+
+// Selects keyframes for very long takes coarse to fine, trading a little error for time.
+//
+// The animation is decimated to every factor-th frame (the fixed keyframes and the last
+// frame are always kept), the selections are made there by a SelectionManager, and then
+// each selection is refined at full resolution: every keyframe that is not fixed may move
+// within a window of frames around where the coarse selection put it, and a dynamic
+// programme over those windows finds the positions with the smallest maximum error. The
+// errors are found with the same engines as the error tables, and spans already measured
+// for one selection are reused for the others.
+//
+// The error tables shrink by about factor^2, and the refinement measures about
+// (2 window + 1)^2 spans per keyframe. The result is never worse than the coarse
+// selection measured at full resolution, but may be worse than the exact selection;
+// bench/SelectionBenchmark --decimate reports by how much. With fixed keyframes, the
+// coarse errors also decide how many keyframes each segment gets, so a small difference
+// in them can move a keyframe to another segment, which is where the largest gaps are.
+class MultiresolutionSelector {
+public:
+	MultiresolutionSelector(std::string errorType, AnimationProxy anim, std::vector<int> fixedKeyframes, int factor, int window = 0, int maxSpan = 0, ErrorTableCache* cache = NULL, int nThreads = 0, Profiler* profiler = NULL);
+	SelectionProxy select(int maxKeyframes);
+	CacheStats getCacheStats() const { return cacheStats; }
+	JSONObject toJSON() const;
+
+private:
+	std::vector<int> refine(const std::vector<int>& coarseSelection, float& error);
+	void measureRow(int i, int jFrom, int jTo);
+	long long spanKey(int i, int j) const { return static_cast<long long>(i) * nFrames + j; }
+
+	std::string errorType;
+	AnimationProxy anim;
+	std::vector<int> fixedKeyframes;
+	int nFrames;
+	int factor;
+	int window;
+	int maxSpan;
+	ErrorTableCache* cache;
+	int nThreads;
+	Profiler* profiler;
+
+	// The frame each coarse frame was taken from, and which frames may not move
+	std::vector<int> coarseFrames;
+	std::vector<bool> isFixed;
+
+	// Full-resolution span errors measured so far, and scratch space for measuring them
+	std::unordered_map<long long, float> spanErrors;
+	std::vector<float> row;
+	LineErrorEngine::Workspace workspace;
+	CubicFitter fitter;
+
+	CacheStats cacheStats;
+	long long nSpansMeasured;
+	double coarseSeconds;
+	double refineSeconds;
+};
@@ -0,0 +1,86 @@
+#include <algorithm>
+#include <math.h>
+
+#include "CubicFitter.hpp"
+#include "PoseProjection.hpp"
+
+// Poses are centred and widened to doubles this many at a time, so long clips of large
+// rigs are not copied whole
+#define PROJECTION_BLOCK 1024
+
+PoseProjection PoseProjection::fit(const Eigen::MatrixXf& poses, int nComponents, double varianceFraction) {
+	PoseProjection projection;
+	projection.nDims = static_cast<int>(poses.rows());
+	int nAttributes = projection.nDims - 1;
+	int nFrames = static_cast<int>(poses.cols());
+	projection.nComponents = std::max(nAttributes, 0);
+	if (nAttributes <= 1 || nFrames == 0) {
+		return projection;
+	}
+
+	// Covariance of the attributes (everything but the frame number)
+	projection.mean = poses.bottomRows(nAttributes).rowwise().mean();
+	Eigen::MatrixXd covariance(nAttributes, nAttributes);
+	covariance.setZero();
+	for (int f = 0; f < nFrames; f += PROJECTION_BLOCK) {
+		int n = std::min(PROJECTION_BLOCK, nFrames - f);
+		Eigen::MatrixXd centred = (poses.block(1, f, nAttributes, n).colwise() - projection.mean).cast<double>();
+		covariance.selfadjointView<Eigen::Lower>().rankUpdate(centred, 1.0 / nFrames);
+	}
+	Eigen::SelfAdjointEigenSolver<Eigen::MatrixXd> solver(covariance.selfadjointView<Eigen::Lower>());
+
+	// Eigenvalues come smallest first, so the leading components are the last columns
+	Eigen::VectorXd variances = solver.eigenvalues().reverse().cwiseMax(0.0);
+	double total = variances.sum();
+	int k = nAttributes;
+	if (nComponents > 0) {
+		k = std::min(nComponents, nAttributes);
+	} else if (varianceFraction > 0.0 && varianceFraction < 1.0 && total > 0.0) {
+		double explained = 0.0;
+		for (k = 0; k < nAttributes && explained < varianceFraction * total; k++) {
+			explained += variances[k];
+		}
+		k = std::max(k, 1);
+	}
+	projection.nComponents = k;
+	projection.explainedVariance = total > 0.0 ? variances.head(k).sum() / total : 1.0;
+	projection.basis = solver.eigenvectors().rightCols(k).rowwise().reverse().cast<float>();
+
+	// The largest distance from a pose to its projection (the basis is orthonormal, so
+	// what the projection drops is the difference of the squared lengths)
+	Eigen::MatrixXd basis = solver.eigenvectors().rightCols(k);
+	double maxSquared = 0.0;
+	for (int f = 0; f < nFrames; f += PROJECTION_BLOCK) {
+		int n = std::min(PROJECTION_BLOCK, nFrames - f);
+		Eigen::MatrixXd centred = (poses.block(1, f, nAttributes, n).colwise() - projection.mean).cast<double>();
+		Eigen::RowVectorXd dropped = centred.colwise().squaredNorm() - (basis.transpose() * centred).colwise().squaredNorm();
+		maxSquared = std::max(maxSquared, dropped.maxCoeff());
+	}
+	projection.maxResidual = static_cast<float>(sqrt(maxSquared));
+	return projection;
+}
+
+Eigen::MatrixXf PoseProjection::project(const Eigen::MatrixXf& poses) const {
+	if (!isReducing()) {
+		return poses;
+	}
+	Eigen::MatrixXf projected(nComponents + 1, poses.cols());
+	projected.row(0) = poses.row(0);
+	projected.bottomRows(nComponents).noalias() = basis.transpose() * (poses.bottomRows(nDims - 1).colwise() - mean);
+	return projected;
+}
+
+float PoseProjection::errorBound(std::string errorType) const {
+	float bound = 2.0f * maxResidual;
+	return errorType == "curve" ? SAMPLES_PER_CURVE * bound * bound : bound;
+}
+
+JSONObject PoseProjection::toJSON(std::string errorType) const {
+	JSONObject json;
+	json.set("dims", nDims);
+	json.set("components", nComponents);
+	json.set("explainedVariance", explainedVariance);
+	json.set("maxResidual", static_cast<double>(maxResidual));
+	json.set("errorBound", static_cast<double>(errorBound(errorType)));
+	return json;
+}
@@ -0,0 +1,39 @@
+#pragma once
+
+#include <string>
+
+#include "../eigen-git-mirror/Eigen/Dense"
+
+#include "common.hpp"
+
+// Projects poses onto their top principal components, so that error tables for rigs with
+// hundreds of correlated attributes are built in a space whose size follows the motion
+// rather than the rig.
+//
+// The first row (the frame number) is kept as it is; the other rows are centred and
+// projected onto the leading eigenvectors of their covariance. The number of components
+// is given directly or as the smallest that explains a fraction of the variance.
+//
+// Projection never lengthens a distance, so projected errors are not above the full ones
+// (for the curve error, given the same sample parameters). How far below they can be
+// depends on the residual R, the largest distance from a pose to its projection: a line
+// error (a distance) is at most 2R lower, as long as the nearest point on the line lies
+// between the span's end poses, and a curve error (a sum of squared distances) at most
+// SAMPLES_PER_CURVE * (2R)^2 lower. errorBound() reports these.
+class PoseProjection {
+public:
+	PoseProjection() : nDims(0), nComponents(0), explainedVariance(1.0), maxResidual(0.0f) {}
+	static PoseProjection fit(const Eigen::MatrixXf& poses, int nComponents, double varianceFraction);
+	Eigen::MatrixXf project(const Eigen::MatrixXf& poses) const;
+	bool isReducing() const { return nComponents < nDims - 1; }
+	float errorBound(std::string errorType) const;
+	JSONObject toJSON(std::string errorType) const;
+
+private:
+	int nDims;
+	int nComponents;
+	double explainedVariance;
+	float maxResidual;
+	Eigen::VectorXf mean;
+	Eigen::MatrixXf basis;
+};
@@ -0,0 +1,66 @@
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+#include "Profiler.hpp"
+
+#define BYTES_PER_MEGABYTE (1024.0 * 1024.0)
+
+Profiler::OpenPhase::OpenPhase(std::string name, int depth) :
+	name(name),
+	depth(depth),
+	start(Clock::now()),
+	cpuStart(OS::cpuSeconds()),
+	peakStart(OS::peakMemoryBytes()) {
+}
+
+void Profiler::begin(std::string phase) {
+	if (!enabled) { return; }
+	open.push_back(OpenPhase(phase, static_cast<int>(open.size())));
+}
+
+void Profiler::end(const JSONObject& details) {
+	if (!enabled || open.empty()) { return; }
+	const OpenPhase& phase = open.back();
+	size_t peak = OS::peakMemoryBytes();
+
+	JSONObject json;
+	json.set("name", phase.name);
+	json.set("depth", phase.depth);
+	json.set("wallSeconds", secondsSince(phase.start));
+	json.set("cpuSeconds", OS::cpuSeconds() - phase.cpuStart);
+	json.set("peakMemoryMB", peak / BYTES_PER_MEGABYTE);
+	json.set("peakGrowthMB", (peak - phase.peakStart) / BYTES_PER_MEGABYTE);
+	if (!details.empty()) {
+		json.set("details", details);
+	}
+	phases.push_back(json);
+	open.pop_back();
+}
+
+void Profiler::addSegment(const JSONObject& segment) {
+	if (!enabled) { return; }
+	segments.push_back(segment);
+}
+
+JSONObject Profiler::report() const {
+	JSONObject json;
+	json.set("wallSeconds", secondsSince(created));
+	json.set("peakMemoryMB", OS::peakMemoryBytes() / BYTES_PER_MEGABYTE);
+#ifdef _OPENMP
+	json.set("maxThreads", omp_get_max_threads());
+#else
+	json.set("maxThreads", 1);
+#endif
+	if (!notes.empty()) {
+		json.set("context", notes);
+	}
+	json.setRaw("phases", JSONObject::array(phases));
+	json.setRaw("segments", JSONObject::array(segments));
+	return json;
+}
+
+int Profiler::writeTrace(std::string path) const {
+	std::string content = report().str() + "\n";
+	return File::writeBytesToFile(path, content.data(), content.size());
+}
@@ -0,0 +1,53 @@
+#pragma once
+
+#include <chrono>
+#include <string>
+#include <vector>
+
+#include "common.hpp"
+
+// Times the phases of a command, for when a selection or reduction is slower than
+// expected and it is not clear where the time goes.
+//
+// Each phase records its wall time, the CPU time used by the whole process over it
+// (summed over threads, so the ratio to wall time shows how parallel it was), and the
+// process's peak memory at its end along with how much the phase raised that peak.
+// Phases may be nested. Details such as table sizes and thread counts are attached to a
+// phase when it ends, and anything per segment is collected separately.
+//
+// A disabled profiler ignores every call, so callers can time unconditionally.
+class Profiler {
+public:
+	Profiler(bool enabled = false) : enabled(enabled), created(Clock::now()) {}
+	bool isEnabled() const { return enabled; }
+
+	void begin(std::string phase);
+	void end(const JSONObject& details = JSONObject());
+	void addSegment(const JSONObject& segment);
+	template <typename T> void note(std::string key, T value) { if (enabled) { notes.set(key, value); } }
+
+	JSONObject report() const;
+	int writeTrace(std::string path) const;
+
+	// Seconds since an earlier time point, for callers accumulating many short intervals
+	typedef std::chrono::steady_clock Clock;
+	static double secondsSince(Clock::time_point start) { return std::chrono::duration<double>(Clock::now() - start).count(); }
+
+private:
+	class OpenPhase {
+	public:
+		OpenPhase(std::string name, int depth);
+		std::string name;
+		int depth;
+		Clock::time_point start;
+		double cpuStart;
+		size_t peakStart;
+	};
+
+	bool enabled;
+	Clock::time_point created;
+	std::vector<OpenPhase> open;
+	std::vector<JSONObject> phases;
+	std::vector<JSONObject> segments;
+	JSONObject notes;
+};
@@ -0,0 +1,169 @@
+#include <sstream>
+#include <vector>
+
+#include <maya/MGlobal.h>
+#include <maya/MDoubleArray.h>
+#include <maya/MIntArray.h>
+#include <maya/MStringArray.h>
+
+#include "../eigen-git-mirror/Eigen/Dense"
+
+#include "common.hpp"
+#include "Interpolator.hpp"
+#include "MayaUtils.hpp"
+#include "Profiler.hpp"
+#include "ReduceBatchCommand.hpp"
+
+
+#define VERBOSE 0
+
+const char* ReduceBatchCommand::kName = "salientReduceBatch";
+const char* const ReduceBatchCommand::kFlags[][2] = {
+    { "t", "threads" },
+    { "i", "instrument" },
+    { "tf", "traceFile" }
+};
+const int ReduceBatchCommand::kNFlags = 3;
+
+MStatus ReduceBatchCommand::doIt(const MArgList& args) {
+    MStatus status;
+
+    Profiler profiler(true);
+    profiler.begin("arguments");
+    status = GatherCommandArguments(args);
+    if (status != MS::kSuccess) {
+        return MS::kFailure;
+    }
+    profiler.end();
+
+    int start = fKeyframes.front();
+    int nFrames = fKeyframes.back() - start + 1;
+    int nPlugs = static_cast<int>(fPlugs.size());
+    int nSegments = static_cast<int>(fKeyframes.size()) - 1;
+
+    if (VERBOSE == 1) {
+        std::ostringstream os;
+        os << "Reducing " << nPlugs << " plugs to " << fKeyframes.size() << " keyframes over " << nFrames << " frames";
+        MGlobal::displayInfo(os.str().c_str());
+    }
+
+    // Sample every curve in one pass, pose-by-pose and led by the frame number
+    profiler.begin("sample");
+    int stride = nPlugs + 1;
+    std::vector<double> samples(nFrames * stride, 0.0);
+    for (int f = 0; f < nFrames; f++) {
+        samples[f * stride] = start + f;
+    }
+    for (int i = 0; i < nPlugs; i++) {
+        status = MayaSampling::samplePlug(fPlugs[i], start, nFrames, samples.data() + 1 + i, stride);
+        if (status != MS::kSuccess) {
+            Log::showStatus(status, std::string("Failed to sample ") + fPlugs[i].name().asChar());
+            return MS::kFailure;
+        }
+    }
+    Eigen::MatrixXf poses = Eigen::Map<Eigen::MatrixXd>(samples.data(), stride, nFrames).cast<float>();
+    JSONObject sampleDetails;
+    sampleDetails.set("plugs", nPlugs);
+    sampleDetails.set("frames", nFrames);
+    profiler.end(sampleDetails);
+
+    std::vector<int> keyframes(fKeyframes.size());
+    for (int i = 0; i < keyframes.size(); i++) {
+        keyframes[i] = fKeyframes[i] - start;
+    }
+    profiler.begin("fit");
+    std::vector<HighDimCubic> cubics = Interpolate::optimalForEachCurve(poses, keyframes, fThreads);
+    JSONObject fitDetails;
+    fitDetails.set("cubics", static_cast<int>(cubics.size()));
+    fitDetails.set("threads", OS::threadsFor(fThreads));
+    profiler.end(fitDetails);
+
+    // Return the control points curve by curve and then segment by segment, with eight
+    // values per cubic (x and y of each of its four control points)
+    profiler.begin("formatResult");
+    MDoubleArray values(static_cast<unsigned int>(nPlugs * nSegments * 8));
+    for (int k = 0; k < cubics.size(); k++) {
+        const HighDimCubic& cubic = cubics[k];
+        const Eigen::VectorXf* points[4] = { &cubic.p1, &cubic.p2, &cubic.p3, &cubic.p4 };
+        for (int p = 0; p < 4; p++) {
+            values[k * 8 + p * 2] = (*points[p])[0];
+            values[k * 8 + p * 2 + 1] = (*points[p])[1];
+        }
+    }
+    profiler.end();
+    setResult(values);
+
+    // The result is the control points, so the profile goes to the script editor and trace file
+    if (fInstrument || fTraceFile.length() > 0) {
+        profiler.note("command", kName);
+        profiler.note("keyframes", static_cast<int>(fKeyframes.size()));
+        if (fInstrument) {
+            MGlobal::displayInfo(profiler.report().str().c_str());
+        }
+        if (fTraceFile.length() > 0 && profiler.writeTrace(fTraceFile.asChar()) != 0) {
+            std::ostringstream os;
+            os << "Failed to write the trace to `" << fTraceFile.asChar() << "`";
+            MGlobal::displayWarning(os.str().c_str());
+        }
+    }
+    return MS::kSuccess;
+}
+
+MStatus ReduceBatchCommand::GatherCommandArguments(const MArgList& args) {
+
+    MayaFlags flags(args, kFlags, kNFlags);
+    fThreads = flags.asInt("threads", 0);
+    fInstrument = flags.asInt("instrument", 0) != 0;
+    fTraceFile = flags.asString("traceFile", "");
+
+    if (flags.positionalCount() != 2) {
+        std::ostringstream os;
+        os << std::endl;
+        os << "----------------------------------------------" << std::endl;
+        os << "Invalid args" << std::endl;
+        os << "-----------" << std::endl;
+        os << "You must provide 2 arguments:" << std::endl;
+        os << "    1. keyframes (list of ints, frame numbers in increasing order)" << std::endl;
+        os << "    2. attributes to reduce (list of strings, e.g. `pCube1.tx`)." << std::endl;
+        os << "Optional flags:" << std::endl;
+        os << "    -threads (int): number of threads used for fitting, 0 for all cores (default 0)." << std::endl;
+        os << "    -instrument (bool): print the time, CPU time and peak memory of each phase as JSON." << std::endl;
+        os << "    -traceFile (string): write that profile to this file." << std::endl;
+        os << "Returns 8 values (p1x, p1y, p2x, p2y, p3x, p3y, p4x, p4y) per cubic, for each attribute in turn" << std::endl;
+        os << "and, within an attribute, for each pair of consecutive keyframes in turn." << std::endl;
+        os << "----------------------------------------------" << std::endl;
+        MGlobal::displayError(os.str().c_str());
+        return MS::kFailure;
+    }
+
+    unsigned int ix = 0;
+    MIntArray mKeyframes = args.asIntArray(ix); ix += 1;
+    fKeyframes.clear();
+    for (uint i = 0; i < mKeyframes.length(); i++) {
+        if (i > 0 && mKeyframes[i] <= mKeyframes[i - 1]) {
+            MGlobal::displayError("The keyframes must be given in increasing order");
+            return MS::kFailure;
+        }
+        fKeyframes.push_back(mKeyframes[i]);
+    }
+    if (fKeyframes.size() < 2) {
+        MGlobal::displayError("At least two keyframes are needed for a reduction");
+        return MS::kFailure;
+    }
+
+    MStringArray mPlugNames = args.asStringArray(ix);
+    fPlugs.clear();
+    for (uint i = 0; i < mPlugNames.length(); i++) {
+        MPlug plug;
+        MStatus status = MayaSampling::findPlug(mPlugNames[i], plug);
+        if (status != MS::kSuccess) {
+            std::ostringstream os;
+            os << "The attribute `" << mPlugNames[i].asChar() << "` could not be found";
+            MGlobal::displayError(os.str().c_str());
+            return MS::kFailure;
+        }
+        fPlugs.push_back(plug);
+    }
+
+    return MS::kSuccess;
+}
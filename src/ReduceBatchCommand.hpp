@@ -0,0 +1,31 @@
+#pragma once
+
+#include <vector>
+
+#include <maya/MArgList.h>
+#include <maya/MSyntax.h>
+#include <maya/MPxCommand.h>
+#include <maya/MPlug.h>
+#include <maya/MSelectionList.h>
+
+#include "Profiler.hpp"
+
+
+class ReduceBatchCommand : public MPxCommand {
+public:
+    virtual MStatus  doIt(const MArgList& args);
+    virtual bool isUndoable() const { return false; }
+    static void* creator() { return new ReduceBatchCommand; }
+    const static char* kName;
+    const static char* const kFlags[][2];
+    const static int kNFlags;
+
+private:
+    MStatus GatherCommandArguments(const MArgList& args);
+
+    std::vector<int> fKeyframes;
+    std::vector<MPlug> fPlugs;
+    int fThreads;
+    bool fInstrument;
+    MString fTraceFile;
+};
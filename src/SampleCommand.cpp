@@ -0,0 +1,128 @@
+#include <math.h>
+#include <sstream>
+#include <vector>
+
+#include <maya/MGlobal.h>
+#include <maya/MDoubleArray.h>
+#include <maya/MStringArray.h>
+
+#include "common.hpp"
+#include "MayaUtils.hpp"
+#include "SampleCommand.hpp"
+
+
+#define VERBOSE 0
+
+const char* SampleCommand::kName = "salientSample";
+const char* const SampleCommand::kFlags[][2] = {
+    { "f", "file" }
+};
+const int SampleCommand::kNFlags = 1;
+
+MStatus SampleCommand::doIt(const MArgList& args) {
+    MStatus status;
+
+    status = GatherCommandArguments(args);
+    if (status != MS::kSuccess) {
+        return MS::kFailure;
+    }
+
+    int nFrames = static_cast<int>(floor(fEnd - fStart)) + 1;
+    int nPlugs = static_cast<int>(fPlugs.size());
+    int stride = nPlugs + (fWithFrames ? 1 : 0);
+
+    if (VERBOSE == 1) {
+        std::ostringstream os;
+        os << "Sampling " << nPlugs << " plugs over " << nFrames << " frames (" << fStart << " to " << fEnd << ")";
+        MGlobal::displayInfo(os.str().c_str());
+    }
+
+    // Fill the result pose-by-pose (optionally led by the frame number), which is
+    // the layout that salientSelect and salientReduce expect for their data
+    std::vector<double> samples(nFrames * stride, 0.0);
+    double* out = samples.data();
+
+    if (fWithFrames) {
+        for (int f = 0; f < nFrames; f++) {
+            out[f * stride] = fStart + f;
+        }
+    }
+
+    int offset = fWithFrames ? 1 : 0;
+    for (int i = 0; i < nPlugs; i++) {
+        status = MayaSampling::samplePlug(fPlugs[i], fStart, nFrames, out + offset + i, stride);
+        if (status != MS::kSuccess) {
+            Log::showStatus(status, std::string("Failed to sample ") + fPlugs[i].name().asChar());
+            return MS::kFailure;
+        }
+    }
+
+    // Write raw float32 poses for salientSelect's -dataFile, so the samples never pass through the script
+    if (fFile.length() > 0) {
+        std::vector<float> values(samples.begin(), samples.end());
+        int failed = File::writeBytesToFile(fFile.asChar(), reinterpret_cast<const char*>(values.data()), values.size() * sizeof(float));
+        if (failed) {
+            std::ostringstream os;
+            os << "Failed to write samples to `" << fFile.asChar() << "`";
+            MGlobal::displayError(os.str().c_str());
+            return MS::kFailure;
+        }
+        setResult(nFrames);
+        return MS::kSuccess;
+    }
+
+    setResult(MDoubleArray(out, static_cast<unsigned int>(samples.size())));
+    return MS::kSuccess;
+}
+
+MStatus SampleCommand::GatherCommandArguments(const MArgList& args) {
+
+    MayaFlags flags(args, kFlags, kNFlags);
+    fFile = flags.asString("file", "");
+
+    if (flags.positionalCount() != 4) {
+        std::ostringstream os;
+        os << std::endl;
+        os << "----------------------------------------------" << std::endl;
+        os << "Invalid args" << std::endl;
+        os << "-----------" << std::endl;
+        os << "You must provide 4 arguments:" << std::endl;
+        os << "    1. start (float, frame number)" << std::endl;
+        os << "    2. end (float, frame number)" << std::endl;
+        os << "    3. include the frame number in each pose (int, 0 or 1)" << std::endl;
+        os << "    4. attributes to sample (list of strings, e.g. `pCube1.tx`)." << std::endl;
+        os << "Optional flags:" << std::endl;
+        os << "    -file (string): write the samples to this file as raw float32 instead of returning them." << std::endl;
+        os << "----------------------------------------------" << std::endl;
+        MGlobal::displayError(os.str().c_str());
+        return MS::kFailure;
+    }
+
+    unsigned int ix = 0;
+    fStart = args.asDouble(ix++);
+    fEnd = args.asDouble(ix++);
+    fWithFrames = args.asInt(ix++) != 0;
+
+    if (fEnd < fStart) {
+        std::ostringstream os;
+        os << "The end frame (" << fEnd << ") comes before the start frame (" << fStart << ")";
+        MGlobal::displayError(os.str().c_str());
+        return MS::kFailure;
+    }
+
+    MStringArray mPlugNames = args.asStringArray(ix);
+    fPlugs.clear();
+    for (uint i = 0; i < mPlugNames.length(); i++) {
+        MPlug plug;
+        MStatus status = MayaSampling::findPlug(mPlugNames[i], plug);
+        if (status != MS::kSuccess) {
+            std::ostringstream os;
+            os << "The attribute `" << mPlugNames[i].asChar() << "` could not be found";
+            MGlobal::displayError(os.str().c_str());
+            return MS::kFailure;
+        }
+        fPlugs.push_back(plug);
+    }
+
+    return MS::kSuccess;
+}
@@ -0,0 +1,29 @@
+#pragma once
+
+#include <vector>
+
+#include <maya/MArgList.h>
+#include <maya/MSyntax.h>
+#include <maya/MPxCommand.h>
+#include <maya/MPlug.h>
+#include <maya/MSelectionList.h>
+
+
+class SampleCommand : public MPxCommand {
+public:
+    virtual MStatus  doIt(const MArgList& args);
+    virtual bool isUndoable() const { return false; }
+    static void* creator() { return new SampleCommand; }
+    const static char* kName;
+    const static char* const kFlags[][2];
+    const static int kNFlags;
+
+private:
+    MStatus GatherCommandArguments(const MArgList& args);
+
+    double fStart;
+    double fEnd;
+    bool fWithFrames;
+    std::vector<MPlug> fPlugs;
+    MString fFile;
+};
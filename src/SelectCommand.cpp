@@ -1,4 +1,5 @@
 #include <iomanip>
+#include <memory>
 #include <sstream>
 #include <vector>
 
@@ -20,21 +21,54 @@
 #include "SelectCommand.hpp"
 #include "MayaUtils.hpp"
 #include "ErrorTable.hpp"
+#include "ErrorTableCache.hpp"
+#include "MultiresolutionSelector.hpp"
+#include "PoseProjection.hpp"
+#include "Profiler.hpp"
 #include "Selector.hpp"
+#include "SelectionJob.hpp"
 #include "SelectionManager.hpp"
+#include "common.hpp"
 
 
 #define VERBOSE 0
 
 const char* SelectCommand::kName = "salientSelect";
+const char* const SelectCommand::kFlags[][2] = {
+    { "df", "dataFile" },
+    { "rf", "resultFile" },
+    { "ms", "maxSpan" },
+    { "c", "cache" },
+    { "cd", "cacheDir" },
+    { "t", "threads" },
+    { "i", "instrument" },
+    { "tf", "traceFile" },
+    { "pc", "components" },
+    { "pv", "variance" },
+    { "bg", "background" },
+    { "dc", "decimate" },
+    { "rw", "refineWindow" },
+    { "tol", "tolerance" },
+    { "sp", "spread" }
+};
+const int SelectCommand::kNFlags = 15;
 
 MStatus SelectCommand::doIt(const MArgList& args) {
     MStatus status;
-    
+
+    // Phases are always timed (it costs nothing), but only reported when asked for
+    Profiler profiler(true);
+    profiler.begin("arguments");
     status = GatherCommandArguments(args);
 	if (status != MS::kSuccess) {
 		return MS::kFailure;
 	}
+    JSONObject argumentDetails;
+    argumentDetails.set("frames", static_cast<int>(fAnimData.cols()));
+    argumentDetails.set("dims", static_cast<int>(fAnimData.rows()));
+    argumentDetails.set("fromDataFile", fDataFile.length() > 0);
+    profiler.end(argumentDetails);
+    bool instrument = fInstrument || fTraceFile.length() > 0;
     
     // Ensure the start and end frames are given as argumetns
     if (fStart == -1 || fEnd == -1) {
@@ -56,6 +90,16 @@ MStatus SelectCommand::doIt(const MArgList& args) {
         MGlobal::displayInfo(os.str().c_str());
     }
     
+    // Select in the space of the poses' principal components when asked to
+    PoseProjection projection;
+    bool project = fComponents > 0 || fVariance > 0.0;
+    if (project) {
+        profiler.begin("projection");
+        projection = PoseProjection::fit(fAnimData, fComponents, fVariance);
+        fAnimData = projection.project(fAnimData);
+        profiler.end(projection.toJSON(fErrorType.asChar()));
+    }
+
     // Perform the selection
     AnimationProxy anim = AnimationProxy(fAnimData);
 
@@ -72,9 +116,61 @@ MStatus SelectCommand::doIt(const MArgList& args) {
 
     SelectionProxy selections = Select::upToN(anim, table, fMaxKeyframes);*/
 
-	SelectionManager manager(fErrorType.asChar(), anim, fFixedKeyframes);
-	manager.incrementUntilNKeyframes(fMaxKeyframes);
-	SelectionProxy selections = manager.getFinalSelectionProxy();
+	// Segments whose poses have not changed since an earlier selection reuse their error tables
+	// (only when asked for, in memory, on disk or both)
+	ErrorTableCache* cache = NULL;
+	if (fCacheMegabytes > 0 || fCacheDir.length() > 0) {
+		cache = &ErrorTableCache::shared();
+		cache->setMemoryBudget(static_cast<size_t>(fCacheMegabytes) * 1024 * 1024);
+		cache->setDirectory(fCacheDir.asChar());
+	}
+
+	// In the background, the selection runs on a worker thread and its id is returned
+	// straight away, for polling with salientSelectJob
+	if (fBackground) {
+		std::shared_ptr<SelectionJob> job(new SelectionJob(fErrorType.asChar(), anim, fFixedKeyframes, fMaxKeyframes, fMaxSpan, cache, fThreads, instrument));
+		if (project) {
+			job->setDetail("projection", projection.toJSON(fErrorType.asChar()));
+		}
+		setResult(SelectionJob::start(job));
+		return MS::kSuccess;
+	}
+
+	// Long takes can be selected coarse to fine, trading a little error for time
+	SelectionProxy selections;
+	CacheStats cacheStats;
+	JSONObject multiresolutionDetails;
+	if (fDecimate > 1) {
+		MultiresolutionSelector multiresolution(fErrorType.asChar(), anim, fFixedKeyframes, fDecimate, fRefineWindow, fMaxSpan, cache, fThreads, instrument ? &profiler : NULL);
+		selections = multiresolution.select(fMaxKeyframes);
+		cacheStats = multiresolution.getCacheStats();
+		multiresolutionDetails = multiresolution.toJSON();
+	} else {
+		SelectionManager manager(fErrorType.asChar(), anim, fFixedKeyframes, fMaxSpan, cache, fThreads, instrument ? &profiler : NULL);
+		if (fTolerance >= 0.0) {
+			selections = manager.selectWithinTolerance(static_cast<float>(fTolerance), fSpread);
+		} else {
+			manager.incrementUntilNKeyframes(fMaxKeyframes);
+			selections = manager.getFinalSelectionProxy();
+		}
+		cacheStats = manager.getCacheStats();
+		if (instrument) {
+			manager.addSegmentsTo(profiler);
+		}
+	}
+	if (instrument) {
+		profiler.note("command", kName);
+		profiler.note("errorType", fErrorType.asChar());
+		profiler.note("maxKeyframes", fMaxKeyframes);
+		if (fTolerance >= 0.0) {
+			profiler.note("tolerance", fTolerance);
+		}
+		profiler.note("fixedKeyframes", static_cast<int>(fFixedKeyframes.size()));
+		profiler.note("threads", OS::threadsFor(fThreads));
+		if (cache != NULL) {
+			profiler.note("cache", cacheStats.toJSON());
+		}
+	}
     
     if (VERBOSE == 2) {
         std::ostringstream os;
@@ -89,42 +185,134 @@ MStatus SelectCommand::doIt(const MArgList& args) {
         MGlobal::displayInfo(os.str().c_str());
     }
 
+    // Hand the result back as typed arrays in a binary file when one was requested,
+    // returning a short summary instead of the formatted text
+    if (fResultFile.length() > 0) {
+        profiler.begin("writeResult");
+        if (selections.saveBinary(fResultFile.asChar()) != 0) {
+            std::ostringstream os;
+            os << "Failed to write the selection result to `" << fResultFile.asChar() << "`";
+            MGlobal::displayError(os.str().c_str());
+            return MS::kFailure;
+        }
+        profiler.end();
+        JSONObject summary;
+        summary.set("resultFile", fResultFile.asChar());
+        summary.set("selections", selections.nSelections());
+        summary.set("minKeyframes", selections.getMinKeyframes());
+        summary.set("maxKeyframes", selections.getMaxKeyframes());
+        summary.set("cache", cacheStats.toJSON());
+        if (project) {
+            summary.set("projection", projection.toJSON(fErrorType.asChar()));
+        }
+        if (!multiresolutionDetails.empty()) {
+            summary.set("multiresolution", multiresolutionDetails);
+        }
+        if (instrument) {
+            summary.set("profile", reportProfile(profiler));
+        }
+        setResult(MString(summary.str().c_str()));
+        return MS::kSuccess;
+    }
+
     // Build string containing result (precise to four decimal places)
+    if (project) {
+        std::ostringstream os;
+        os << "Selected using the poses' principal components: " << projection.toJSON(fErrorType.asChar()).str();
+        MGlobal::displayInfo(os.str().c_str());
+    }
+    if (!multiresolutionDetails.empty()) {
+        std::ostringstream os;
+        os << "Selected coarse to fine: " << multiresolutionDetails.str();
+        MGlobal::displayInfo(os.str().c_str());
+    }
+    profiler.begin("formatResult");
     std::ostringstream ret;
     ret << std::setprecision(4) << std::fixed;
 
     // Pipe in pairs of error and selection in the form:
     //   e|a,b,c
     //     where e is error, | is a delimiter, and a,b,c are the selection (wthout spaces).
-    // Each error-selection pair is delimited by a new line.
+    // Each error-selection pair is delimited by a new line. Only when instrumenting, a last
+    // line starting with # holds the profile (with the cache's hit and miss counts) as JSON.
+    // Within a tolerance, counts may be skipped where a better selection needs fewer keyframes.
     for (int i = selections.getMinKeyframes(); i < selections.getMaxKeyframes() + 1; i++) {
-        float error = selections.getErrorByNKeyframes(i);
         std::vector<int> selection = selections.getSelectionByNKeyframes(i);
+        if (selection.empty()) { continue; }
+        float error = selections.getErrorByNKeyframes(i);
         ret << error << "|";
         ret << selection[0];
         for (int j = 1; j < selection.size(); j++) ret << "," << selection[j];
         ret << "\n";
     }
+    profiler.end();
+    if (instrument) {
+        ret << "#" << reportProfile(profiler).str() << "\n";
+    }
 
 	setResult(MString(ret.str().c_str()));
     return MS::kSuccess;
 }
 
+JSONObject SelectCommand::reportProfile(const Profiler& profiler) {
+    if (fTraceFile.length() > 0 && profiler.writeTrace(fTraceFile.asChar()) != 0) {
+        std::ostringstream os;
+        os << "Failed to write the trace to `" << fTraceFile.asChar() << "`";
+        MGlobal::displayWarning(os.str().c_str());
+    }
+    return profiler.report();
+}
+
 MStatus SelectCommand::GatherCommandArguments(const MArgList& args) {
 
-	if (args.length() != 6) {
+	MayaFlags flags(args, kFlags, kNFlags);
+	fDataFile = flags.asString("dataFile", "");
+	fResultFile = flags.asString("resultFile", "");
+	fMaxSpan = flags.asInt("maxSpan", 0);
+	fCacheMegabytes = flags.asInt("cache", 0);
+	fCacheDir = flags.asString("cacheDir", "");
+	fThreads = flags.asInt("threads", 0);
+	fInstrument = flags.asInt("instrument", 0) != 0;
+	fTraceFile = flags.asString("traceFile", "");
+	fComponents = flags.asInt("components", 0);
+	fVariance = flags.asDouble("variance", 0.0);
+	fBackground = flags.asInt("background", 0) != 0;
+	fDecimate = flags.asInt("decimate", 1);
+	fRefineWindow = flags.asInt("refineWindow", 0);
+	fTolerance = flags.asDouble("tolerance", -1.0);
+	fSpread = flags.asInt("spread", 0);
+	unsigned int nExpected = fDataFile.length() > 0 ? 5 : 6;
+
+	if (flags.positionalCount() != nExpected) {
 		std::ostringstream os;
 		os << std::endl;
 		os << "----------------------------------------------" << std::endl; 
 		os << "Invalid args" << std::endl;
 		os << "-----------" << std::endl;
-		os << "You must provide 5 arguments:" << std::endl;
+		os << "You must provide 6 arguments:" << std::endl;
 		os << "    1. error type (`line` or `curve`)" << std::endl;
 		os << "    2. start (int, frame number)" << std::endl;
 		os << "    3. end (int, frame number)" << std::endl; 
 		os << "    4. max number of keyframes (int)" << std::endl;
 		os << "    5. fixed keyframes (list of ints)." << std::endl;
 		os << "    6. the animation data (list of floats, pose-by-pose)." << std::endl;
+		os << "The 6th argument is left out when the data is given with -dataFile." << std::endl;
+		os << "Optional flags:" << std::endl;
+		os << "    -dataFile (string): raw float32 file holding the animation data, pose-by-pose." << std::endl;
+		os << "    -resultFile (string): write the selections to this file as typed arrays instead of returning text." << std::endl;
+		os << "    -maxSpan (int): only consider keyframes up to this many frames apart, 0 for no limit (default 0)." << std::endl;
+		os << "    -cache (int): keep up to this many megabytes of error tables in memory between calls, e.g. " << ERROR_TABLE_CACHE_MEGABYTES << " (default 0, no caching)." << std::endl;
+		os << "    -cacheDir (string): keep error tables in this directory, so they are reused across sessions (with or without -cache)." << std::endl;
+		os << "    -threads (int): number of threads used to compute error tables, 0 for all cores (default 0)." << std::endl;
+		os << "    -instrument (bool): also return the time, CPU time and peak memory of each phase and segment as JSON." << std::endl;
+		os << "    -traceFile (string): write that profile to this file (implies -instrument)." << std::endl;
+		os << "    -components (int): select using this many principal components of the poses, 0 for the full poses (default 0)." << std::endl;
+		os << "    -variance (float): or use the fewest components that explain this fraction of the variance, e.g. 0.99." << std::endl;
+		os << "    -background (bool): select on a worker thread and return a job id for salientSelectJob straight away." << std::endl;
+		os << "    -decimate (int): select on one frame in every n, then refine the keyframes at full resolution (default 1, exact)." << std::endl;
+		os << "    -refineWindow (int): how many frames each keyframe may move when refined, 0 for half the decimation (default 0)." << std::endl;
+		os << "    -tolerance (float): return only the selection with the fewest keyframes whose error is at most this (the max number of keyframes is then ignored)." << std::endl;
+		os << "    -spread (int): with -tolerance, also return the selections with up to this many keyframes more and fewer (default 0)." << std::endl;
 		os << "----------------------------------------------" << std::endl;
 		MGlobal::displayError(os.str().c_str());
 		return MS::kFailure;
@@ -145,7 +333,56 @@ MStatus SelectCommand::GatherCommandArguments(const MArgList& args) {
 	int nFrames = fEnd - fStart + 1;
 	fMaxKeyframes = args.asInt(ix++);
 
-	if (fMaxKeyframes > nFrames) {
+	if (fComponents < 0 || fVariance < 0.0 || fVariance > 1.0) {
+		std::ostringstream os;
+		os << "The number of components cannot be negative, and the variance must be a fraction between 0 and 1" << std::endl;
+		MGlobal::displayError(os.str().c_str());
+		return MS::kFailure;
+	}
+
+	if (fBackground && (fResultFile.length() > 0 || fTraceFile.length() > 0)) {
+		std::ostringstream os;
+		os << "A selection in the background returns its selections and profile through salientSelectJob, so it takes neither -resultFile nor -traceFile" << std::endl;
+		MGlobal::displayError(os.str().c_str());
+		return MS::kFailure;
+	}
+
+	if (fDecimate < 1 || fRefineWindow < 0) {
+		std::ostringstream os;
+		os << "The decimation must be at least 1, and the refinement window cannot be negative" << std::endl;
+		MGlobal::displayError(os.str().c_str());
+		return MS::kFailure;
+	}
+
+	if (fBackground && fDecimate > 1) {
+		std::ostringstream os;
+		os << "A coarse-to-fine selection cannot run in the background" << std::endl;
+		MGlobal::displayError(os.str().c_str());
+		return MS::kFailure;
+	}
+
+	if (fTolerance >= 0.0 && (fBackground || fDecimate > 1)) {
+		std::ostringstream os;
+		os << "A selection within a tolerance can neither run in the background nor be made coarse to fine" << std::endl;
+		MGlobal::displayError(os.str().c_str());
+		return MS::kFailure;
+	}
+
+	if (fSpread < 0) {
+		std::ostringstream os;
+		os << "The spread cannot be negative" << std::endl;
+		MGlobal::displayError(os.str().c_str());
+		return MS::kFailure;
+	}
+
+	if (fMaxSpan < 0) {
+		std::ostringstream os;
+		os << "The maximum span cannot be negative" << std::endl;
+		MGlobal::displayError(os.str().c_str());
+		return MS::kFailure;
+	}
+
+	if (fTolerance < 0.0 && fMaxKeyframes > nFrames) {
 		std::ostringstream os;
 		os << "You cannot select more keyframes than there are frames" << std::endl;
 		MGlobal::displayError(os.str().c_str());
@@ -160,6 +397,22 @@ MStatus SelectCommand::GatherCommandArguments(const MArgList& args) {
 
 	ix += 1;
 
+	if (fDataFile.length() > 0) {
+		AnimationProxy anim = AnimationProxy::fromBinary(fDataFile.asChar(), nFrames);
+		if (anim.getNFrames() != nFrames) {
+			std::ostringstream os;
+			if (File::sizeOf(fDataFile.asChar()) < 0) {
+				os << "The data file `" << fDataFile.asChar() << "` could not be opened" << std::endl;
+			} else {
+				os << "The data file `" << fDataFile.asChar() << "` could not be read as " << nFrames << " float32 poses" << std::endl;
+			}
+			MGlobal::displayError(os.str().c_str());
+			return MS::kFailure;
+		}
+		fAnimData = anim.data;
+		return MS::kSuccess;
+	}
+
     MDoubleArray mAnimData = args.asDoubleArray(ix);
     int nDims = mAnimData.length() / nFrames;
     fAnimData = Eigen::MatrixXf(nDims, nFrames);
@@ -9,6 +9,8 @@
 #include <maya/MPxCommand.h>
 #include <maya/MSelectionList.h>
 
+#include "Profiler.hpp"
+
 
 class SelectCommand : public MPxCommand {
 public:
@@ -16,9 +18,12 @@ public:
     virtual bool isUndoable() const { return false; }
     static void* creator() { return new SelectCommand; }
     const static char* kName;
+    const static char* const kFlags[][2];
+    const static int kNFlags;
     
 private:
     MStatus GatherCommandArguments(const MArgList& args);
+    JSONObject reportProfile(const Profiler& profiler);
     
 	MString fErrorType;
     int fStart;
@@ -26,5 +31,20 @@ private:
 	int fMaxKeyframes;
 	std::vector<int> fFixedKeyframes;
     Eigen::MatrixXf fAnimData;
+    MString fDataFile;
+    MString fResultFile;
+    int fMaxSpan;
+    int fCacheMegabytes;
+    MString fCacheDir;
+    int fThreads;
+    bool fInstrument;
+    MString fTraceFile;
+    int fComponents;
+    double fVariance;
+    bool fBackground;
+    int fDecimate;
+    int fRefineWindow;
+    double fTolerance;
+    int fSpread;
     
 };
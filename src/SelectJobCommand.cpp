@@ -0,0 +1,83 @@
+#include <memory>
+#include <sstream>
+
+#include <maya/MGlobal.h>
+
+#include "SelectJobCommand.hpp"
+#include "SelectionJob.hpp"
+#include "MayaUtils.hpp"
+#include "common.hpp"
+
+
+const char* SelectJobCommand::kName = "salientSelectJob";
+const char* const SelectJobCommand::kFlags[][2] = {
+    { "s", "since" },
+    { "c", "cancel" },
+    { "w", "wait" },
+    { "r", "release" }
+};
+const int SelectJobCommand::kNFlags = 4;
+
+MStatus SelectJobCommand::doIt(const MArgList& args) {
+    MStatus status;
+
+    status = GatherCommandArguments(args);
+    if (status != MS::kSuccess) {
+        return MS::kFailure;
+    }
+
+    std::shared_ptr<SelectionJob> job = SelectionJob::find(fJobId);
+    if (!job) {
+        std::ostringstream os;
+        os << "There is no selection job " << fJobId << " (it may have been released)";
+        MGlobal::displayError(os.str().c_str());
+        return MS::kFailure;
+    }
+
+    if (fCancel) {
+        job->cancel();
+    }
+    if (fWait || fRelease) {
+        // Stop the job before it is released, so the last poll is its final state
+        if (fRelease) { job->cancel(); }
+        job->wait();
+    }
+
+    JSONObject result = job->poll(fSince);
+    if (fRelease) {
+        SelectionJob::release(fJobId);
+    }
+    setResult(MString(result.str().c_str()));
+    return MS::kSuccess;
+}
+
+MStatus SelectJobCommand::GatherCommandArguments(const MArgList& args) {
+
+    MayaFlags flags(args, kFlags, kNFlags);
+    fSince = flags.asInt("since", 0);
+    fCancel = flags.asInt("cancel", 0) != 0;
+    fWait = flags.asInt("wait", 0) != 0;
+    fRelease = flags.asInt("release", 0) != 0;
+
+    if (flags.positionalCount() != 1) {
+        std::ostringstream os;
+        os << std::endl;
+        os << "----------------------------------------------" << std::endl;
+        os << "Invalid args" << std::endl;
+        os << "-----------" << std::endl;
+        os << "You must provide 1 argument:" << std::endl;
+        os << "    1. the job id returned by `salientSelect -background 1` (int)" << std::endl;
+        os << "Returns the job's status, stage and progress, and its selections, as JSON." << std::endl;
+        os << "Optional flags:" << std::endl;
+        os << "    -since (int): only return the selections with more than this many keyframes (default 0)." << std::endl;
+        os << "    -cancel (bool): stop the job; the selections made so far are kept." << std::endl;
+        os << "    -wait (bool): wait for the job to stop before returning." << std::endl;
+        os << "    -release (bool): stop the job, return its final state and then forget it." << std::endl;
+        os << "----------------------------------------------" << std::endl;
+        MGlobal::displayError(os.str().c_str());
+        return MS::kFailure;
+    }
+
+    fJobId = args.asInt(0);
+    return MS::kSuccess;
+}
@@ -0,0 +1,25 @@
+#pragma once
+
+#include <maya/MArgList.h>
+#include <maya/MSyntax.h>
+#include <maya/MPxCommand.h>
+
+
+class SelectJobCommand : public MPxCommand {
+public:
+    virtual MStatus doIt(const MArgList& args);
+    virtual bool isUndoable() const { return false; }
+    static void* creator() { return new SelectJobCommand; }
+    const static char* kName;
+    const static char* const kFlags[][2];
+    const static int kNFlags;
+
+private:
+    MStatus GatherCommandArguments(const MArgList& args);
+
+    int fJobId;
+    int fSince;
+    bool fCancel;
+    bool fWait;
+    bool fRelease;
+};
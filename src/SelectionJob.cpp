@@ -0,0 +1,187 @@
+#include <algorithm>
+#include <new>
+
+#include "SelectionJob.hpp"
+#include "SelectionManager.hpp"
+
+static std::mutex jobsMutex;
+static std::map< int, std::shared_ptr<SelectionJob> > jobs;
+static int nextJobId = 1;
+
+SelectionJob::SelectionJob(std::string errorType, AnimationProxy anim, std::vector<int> fixedKeyframes, int maxKeyframes, int maxSpan, ErrorTableCache* cache, int nThreads, bool instrument) :
+	errorType(errorType),
+	anim(anim),
+	fixedKeyframes(fixedKeyframes),
+	maxKeyframes(maxKeyframes),
+	maxSpan(maxSpan),
+	cache(cache),
+	nThreads(nThreads),
+	profiler(instrument),
+	status("running"),
+	stage("errorTables") {
+}
+
+SelectionJob::~SelectionJob() {
+	cancel();
+	wait();
+}
+
+int SelectionJob::start(std::shared_ptr<SelectionJob> job) {
+	job->worker = std::thread(&SelectionJob::run, job.get());
+	std::lock_guard<std::mutex> lock(jobsMutex);
+	int id = nextJobId++;
+	jobs[id] = job;
+	return id;
+}
+
+std::shared_ptr<SelectionJob> SelectionJob::find(int id) {
+	std::lock_guard<std::mutex> lock(jobsMutex);
+	std::map< int, std::shared_ptr<SelectionJob> >::iterator it = jobs.find(id);
+	return it == jobs.end() ? std::shared_ptr<SelectionJob>() : it->second;
+}
+
+// The job is cancelled, and waited for once the last reference to it goes
+void SelectionJob::release(int id) {
+	std::shared_ptr<SelectionJob> job;
+	{
+		std::lock_guard<std::mutex> lock(jobsMutex);
+		std::map< int, std::shared_ptr<SelectionJob> >::iterator it = jobs.find(id);
+		if (it == jobs.end()) { return; }
+		job = it->second;
+		jobs.erase(it);
+	}
+	job->cancel();
+}
+
+void SelectionJob::releaseAll() {
+	std::map< int, std::shared_ptr<SelectionJob> > released;
+	{
+		std::lock_guard<std::mutex> lock(jobsMutex);
+		released.swap(jobs);
+	}
+	for (std::map< int, std::shared_ptr<SelectionJob> >::iterator it = released.begin(); it != released.end(); ++it) {
+		it->second->cancel();
+	}
+	for (std::map< int, std::shared_ptr<SelectionJob> >::iterator it = released.begin(); it != released.end(); ++it) {
+		it->second->wait();
+	}
+}
+
+void SelectionJob::wait() {
+	if (worker.joinable() && worker.get_id() != std::this_thread::get_id()) {
+		worker.join();
+	}
+}
+
+bool SelectionJob::isRunning() {
+	std::lock_guard<std::mutex> lock(mutex);
+	return status == "running";
+}
+
+void SelectionJob::setDetail(std::string key, const JSONObject& value) {
+	std::lock_guard<std::mutex> lock(mutex);
+	details.set(key, value);
+}
+
+JSONObject SelectionJob::poll(int sinceKeyframes) {
+	std::lock_guard<std::mutex> lock(mutex);
+	JSONObject result;
+	result.set("status", status);
+	result.set("stage", stage);
+
+	// How far through the current stage the job is, from 0 to 1
+	double fraction = 1.0;
+	if (status == "running" && stage == "errorTables") {
+		long long total = progress.total;
+		fraction = total > 0 ? progress.done / double(total) : 0.0;
+	} else if (status == "running" && !selections.empty()) {
+		int first = selections.begin()->first;
+		int last = selections.rbegin()->first;
+		fraction = maxKeyframes > first ? std::min(1.0, (last - first) / double(maxKeyframes - first)) : 1.0;
+	}
+	result.set("progress", fraction);
+
+	result.set("minKeyframes", selections.empty() ? 0 : selections.begin()->first);
+	result.set("maxKeyframes", selections.empty() ? 0 : selections.rbegin()->first);
+	std::vector<JSONObject> newer;
+	for (std::map< int, std::vector<int> >::iterator it = selections.upper_bound(sinceKeyframes); it != selections.end(); ++it) {
+		JSONObject entry;
+		entry.set("keyframes", it->first);
+		entry.set("error", static_cast<double>(errors[it->first]));
+		entry.setRaw("selection", JSONObject::array(it->second));
+		newer.push_back(entry);
+	}
+	result.setRaw("selections", JSONObject::array(newer));
+	result.set("cache", cacheStats.toJSON());
+	if (!message.empty()) {
+		result.set("message", message);
+	}
+
+	// The worker is done with the profiler once the status has changed
+	if (status != "running" && profiler.isEnabled()) {
+		result.set("profile", profiler.report());
+	}
+	if (!details.empty()) {
+		result.set("details", details);
+	}
+	return result;
+}
+
+void SelectionJob::record(const std::vector<int>& selection, float error) {
+	std::lock_guard<std::mutex> lock(mutex);
+	int n = selection.size();
+	selections[n] = selection;
+	errors[n] = error;
+}
+
+void SelectionJob::finish(std::string finalStatus, std::string failure) {
+	std::lock_guard<std::mutex> lock(mutex);
+	status = finalStatus;
+	message = failure;
+}
+
+void SelectionJob::run() {
+	try {
+		Profiler* p = profiler.isEnabled() ? &profiler : NULL;
+		SelectionManager manager(errorType, anim, fixedKeyframes, maxSpan, cache, nThreads, p, &progress);
+		if (manager.wasCancelled()) {
+			finish("cancelled");
+			return;
+		}
+		{
+			std::lock_guard<std::mutex> lock(mutex);
+			cacheStats = manager.getCacheStats();
+			stage = "selecting";
+		}
+
+		// Add keyframes one at a time (as incrementUntilNKeyframes would), handing each
+		// selection over as soon as it is made
+		std::vector<int> selection = manager.getCombinedSelection();
+		record(selection, manager.getMaxErrorAcrossSegments());
+		int n = selection.size();
+		int nSteps = 0;
+		profiler.begin("select");
+		while (n <= maxKeyframes && !progress.cancelled && manager.addKeyframe()) {
+			record(manager.getCombinedSelection(), manager.getMaxErrorAcrossSegments());
+			n += 1;
+			nSteps += 1;
+		}
+		JSONObject selectDetails;
+		selectDetails.set("requestedKeyframes", maxKeyframes);
+		selectDetails.set("steps", nSteps);
+		profiler.end(selectDetails);
+
+		if (profiler.isEnabled()) {
+			profiler.note("errorType", errorType);
+			profiler.note("maxKeyframes", maxKeyframes);
+			profiler.note("fixedKeyframes", static_cast<int>(fixedKeyframes.size()));
+			profiler.note("threads", OS::threadsFor(nThreads));
+			manager.addSegmentsTo(profiler);
+		}
+		finish(progress.cancelled ? "cancelled" : "finished");
+	} catch (const std::bad_alloc&) {
+		finish("failed", "ran out of memory");
+	} catch (const std::exception& e) {
+		finish("failed", e.what());
+	}
+}
@@ -0,0 +1,68 @@
+#pragma once
+
+#include <map>
+#include <memory>
+#include <mutex>
+#include <string>
+#include <thread>
+#include <vector>
+
+#include "AnimationProxy.hpp"
+#include "ErrorTableCache.hpp"
+#include "Profiler.hpp"
+#include "common.hpp"
+
+// Runs a selection on a worker thread, so the caller (and its interface) is not held up
+// while the error tables are computed.
+//
+// Selections are kept as they are made: the fewest keyframes first, once the error tables
+// are done, then one more for each keyframe added. Polling with the largest count already
+// seen returns only the newer selections, so a caller can offer the smaller selections
+// while the larger ones are still being made. Cancelling stops the error tables at the
+// next tile and adds no more keyframes.
+//
+// Started jobs are kept by id until released, so the command that starts a job can
+// return straight away and later commands can poll or cancel it.
+class SelectionJob {
+public:
+	SelectionJob(std::string errorType, AnimationProxy anim, std::vector<int> fixedKeyframes, int maxKeyframes, int maxSpan = 0, ErrorTableCache* cache = NULL, int nThreads = 0, bool instrument = false);
+	~SelectionJob();
+
+	static int start(std::shared_ptr<SelectionJob> job);
+	static std::shared_ptr<SelectionJob> find(int id);
+	static void release(int id);
+	static void releaseAll();
+
+	void cancel() { progress.cancelled = true; }
+	void wait();
+	bool isRunning();
+	void setDetail(std::string key, const JSONObject& value);
+	JSONObject poll(int sinceKeyframes);
+
+private:
+	void run();
+	void record(const std::vector<int>& selection, float error);
+	void finish(std::string finalStatus, std::string failure = "");
+
+	std::string errorType;
+	AnimationProxy anim;
+	std::vector<int> fixedKeyframes;
+	int maxKeyframes;
+	int maxSpan;
+	ErrorTableCache* cache;
+	int nThreads;
+	Profiler profiler;
+
+	std::thread worker;
+	TaskProgress progress;
+
+	// Everything below is shared with the worker, behind the mutex
+	std::mutex mutex;
+	std::string status;
+	std::string stage;
+	std::string message;
+	std::map< int, std::vector<int> > selections;
+	std::map< int, float > errors;
+	CacheStats cacheStats;
+	JSONObject details;
+};
@@ -5,11 +5,14 @@
 //  Created by Richard Roberts on 25/09/18.
 //
 
+#include <algorithm>
+#include <string.h>
+
 #include "ErrorTable.hpp"
 #include "Selector.hpp"
 #include "SelectionManager.hpp"
 
-SelectionManager::SelectionManager(std::string errorType, AnimationProxy anim, std::vector<int> fixedKeyframes) {
+SelectionManager::SelectionManager(std::string errorType, AnimationProxy anim, std::vector<int> fixedKeyframes, int maxSpan, ErrorTableCache* cache, int nThreads, Profiler* profiler, TaskProgress* progress) : cancelled(false), nThresholdPasses(0), profiler(profiler) {
 	
 	if (fixedKeyframes.size() == 0) {
 		fixedKeyframes.insert(fixedKeyframes.begin(), 0);
@@ -23,21 +26,75 @@ SelectionManager::SelectionManager(std::string errorType, AnimationProxy anim, s
 		}
 	}
 
+	if (errorType != "line" && errorType != "curve") {
+		std::cerr << "Invalid error type, this should not happen (as this arguments is parsed by main)" << std::endl;
+	}
+
+	std::vector<AnimationProxy> subAnims;
 	for (int i = 1; i < fixedKeyframes.size(); i++) {
 		int s = fixedKeyframes[i - 1];
 		int e = fixedKeyframes[i];
 		segmentStartFrames.push_back(s); 
-		keyframesToUseInEachSegment.push_back(2); 
-		AnimationProxy subAnim = anim.subAnimation(s, e);
-		ErrorTable table;
-		if (errorType == "line") {
-			table = ErrorTable::usingLineBasedError(subAnim);
-		} else if (errorType == "curve") {
-			table = ErrorTable::usingCurveBasedError(subAnim);
+		subAnims.push_back(anim.subAnimation(s, e));
+	}
+
+	// Reuse what tables the cache has, then compute the rest together so that every
+	// segment's work is shared between the threads
+	if (profiler != NULL) { profiler->begin("errorTables"); }
+	std::vector<ErrorTable> tables(subAnims.size());
+	std::vector<AnimationProxy> missingAnims;
+	std::vector<int> missingIndices;
+	for (int i = 0; i < subAnims.size(); i++) {
+		int diskHits = cacheStats.diskHits;
+		if (cache == NULL || !cache->find(subAnims[i], errorType, maxSpan, tables[i], cacheStats)) {
+			missingAnims.push_back(subAnims[i]);
+			missingIndices.push_back(i);
+			segmentTableSources.push_back("computed");
 		} else {
-			std::cerr << "Invalid error type, this should not happen (as this arguments is parsed by main)" << std::endl;
+			segmentTableSources.push_back(cacheStats.diskHits > diskHits ? "disk" : "memory");
 		}
-		selectors.push_back(Selector(subAnim, table));
+	}
+	std::vector<ErrorTable> computed = ErrorTable::computeAll(missingAnims, errorType, maxSpan, nThreads, progress);
+	if (progress != NULL && progress->cancelled) {
+		// The tables are incomplete, so nothing is cached or selected
+		cancelled = true;
+		if (profiler != NULL) { profiler->end(); }
+		return;
+	}
+	for (int m = 0; m < computed.size(); m++) {
+		tables[missingIndices[m]] = computed[m];
+		if (cache != NULL) {
+			cache->store(missingAnims[m], errorType, maxSpan, computed[m]);
+		}
+	}
+	if (profiler != NULL) {
+		size_t bytes = 0;
+		for (int i = 0; i < tables.size(); i++) { bytes += tables[i].memoryUsage(); }
+		JSONObject details;
+		details.set("errorType", errorType);
+		details.set("dims", static_cast<int>(anim.data.rows()));
+		details.set("maxSpan", maxSpan);
+		details.set("segments", static_cast<int>(tables.size()));
+		details.set("computed", static_cast<int>(computed.size()));
+		details.set("threads", OS::threadsFor(nThreads));
+		details.set("tableMB", bytes / (1024.0 * 1024.0));
+		details.set("cache", cacheStats.toJSON());
+		profiler->end(details);
+		profiler->begin("initialSelection");
+	}
+
+	segmentSelectSeconds.assign(subAnims.size(), 0.0);
+	for (int i = 0; i < subAnims.size(); i++) {
+		selectors.push_back(Selector(subAnims[i], tables[i]));
+
+		// Each segment starts with the fewest keyframes its error table can cover it with
+		keyframesToUseInEachSegment.push_back(selectors.back().minimumKeyframes());
+	}
+
+	segmentErrors.assign(selectors.size(), 0.0f);
+	segmentSelections.assign(selectors.size(), std::vector<int>());
+	for (int i = 0; i < selectors.size(); i++) {
+		updateSegment(i);
 	}
 
 	std::vector<int> selection = getCombinedSelection();
@@ -45,89 +102,196 @@ SelectionManager::SelectionManager(std::string errorType, AnimationProxy anim, s
 	int n = selection.size();
 	finalSelections[n] = selection;
 	finalErrors[n] = error;
+
+	if (profiler != NULL) {
+		JSONObject details;
+		details.set("keyframes", n);
+		profiler->end(details);
+	}
 }
 
 void SelectionManager::incrementUntilNKeyframes(int nKeyframes) {
 
 	int n = getCombinedSelection().size();
+	if (profiler != NULL) { profiler->begin("select"); }
+	int nSteps = 0;
 
-    while (n <= nKeyframes) {
-        
-		float maxErrorReduce = 0.0f;
-		int maxErrorReduceIx = -1;
+    while (n <= nKeyframes && addKeyframe()) {
+		n += 1;
+		nSteps += 1;
+    }
 
-		for (int i = 0; i < selectors.size(); i++) {
-			int nKeyframesCurrent = keyframesToUseInEachSegment[i];
-			if (nKeyframesCurrent == selectors[i].maximumKeyframes()) {
-				continue;
-			}
-			selectors[i].next();
-			float errorNow = selectors[i].getErrorByNKeyframes(nKeyframesCurrent);
-			float errorNext = selectors[i].getErrorByNKeyframes(nKeyframesCurrent + 1);
-			float errorReduce = errorNow - errorNext;
-
-			// Keep the highest reduction
-			if (errorReduce >= maxErrorReduce) {
-				maxErrorReduce = errorReduce;
-				maxErrorReduceIx = i;
+	if (profiler != NULL) {
+		JSONObject details;
+		details.set("requestedKeyframes", nKeyframes);
+		details.set("steps", nSteps);
+		profiler->end(details);
+	}
+}
+
+// Gives one more keyframe to the segment that gains the most from it, returning false
+// when every frame of every segment is already a keyframe
+bool SelectionManager::addKeyframe() {
+	if (reductions.empty()) {
+		return false;
+	}
+
+	int i = reductions.top().second;
+	reductions.pop();
+	keyframesToUseInEachSegment[i] = keyframesToUseInEachSegment[i] + 1;
+	updateSegment(i);
+
+	std::vector<int> selection = getCombinedSelection();
+	float error = getMaxErrorAcrossSegments();
+	int n = selection.size();
+	finalSelections[n] = selection;
+	finalErrors[n] = error;
+	return true;
+}
+
+// Non-negative floats are ordered as their bit patterns are, so bisecting the bits reaches
+// an exact error in at most 32 steps
+static unsigned int floatBits(float value) {
+	unsigned int bits;
+	memcpy(&bits, &value, sizeof(bits));
+	return bits;
+}
+
+static float bitsFloat(unsigned int bits) {
+	float value;
+	memcpy(&value, &bits, sizeof(value));
+	return value;
+}
+
+// The fewest keyframes across every segment whose spans' errors are all at most the
+// threshold, and (when asked for) the combined selection
+int SelectionManager::keyframesWithin(float threshold, std::vector<int>* selection) {
+	nThresholdPasses += 1;
+	if (selection != NULL) { selection->clear(); }
+	int n = 1;
+	std::vector<int> selForSegment;
+	for (int i = 0; i < selectors.size(); i++) {
+		int nSegment = selectors[i].keyframesWithin(threshold, selection != NULL ? &selForSegment : NULL);
+		n += nSegment - 1;
+		if (selection != NULL) {
+			size_t nToCopy = i < selectors.size() - 1 ? selForSegment.size() - 1 : selForSegment.size();
+			for (size_t j = 0; j < nToCopy; j++) {
+				selection->push_back(segmentStartFrames[i] + selForSegment[j]);
 			}
 		}
+	}
+	return n;
+}
 
-		if (maxErrorReduceIx == -1) {
-			std::cerr << "No reduction in error found at all - why did this happen?" << std::endl;
+// The smallest threshold in [low, high] that needs no more than nKeyframes, given that high
+// does. The errors only change the count where they equal a span's error, so the result is
+// the error of the best selection with that many keyframes.
+float SelectionManager::smallestThresholdFor(int nKeyframes, float low, float high) {
+	unsigned int lo = floatBits(low);
+	unsigned int hi = floatBits(high);
+	while (lo < hi) {
+		unsigned int mid = lo + (hi - lo) / 2;
+		if (keyframesWithin(bitsFloat(mid)) <= nKeyframes) {
+			hi = mid;
+		} else {
+			lo = mid + 1;
 		}
+	}
+	return bitsFloat(hi);
+}
 
-		keyframesToUseInEachSegment[maxErrorReduceIx] = keyframesToUseInEachSegment[maxErrorReduceIx] + 1;
+SelectionProxy SelectionManager::selectWithinTolerance(float tolerance, int spread) {
+	if (profiler != NULL) { profiler->begin("tolerance"); }
+	nThresholdPasses = 0;
+	float infinity = std::numeric_limits<float>::infinity();
+	tolerance = std::max(tolerance, 0.0f);
+	int fewest = keyframesWithin(infinity);
+	int most = keyframesWithin(0.0f);
+	int target = keyframesWithin(tolerance);
 
-		std::vector<int> selection = getCombinedSelection();
-		float error = getMaxErrorAcrossSegments();
-		int n2 = selection.size();
-		finalSelections[n2] = selection;
-		finalErrors[n2] = error;
-		
-		n += 1;
-    }
+	// The best selection with the fewest keyframes that meet the tolerance, and the best
+	// with a few more or fewer (which bracket the search by the tolerance)
+	std::map< int, std::vector<int> > selections;
+	std::map< int, float > errors;
+	std::vector<int> selection;
+	int first = std::max(fewest, target - spread);
+	int last = std::min(most, target + spread);
+	for (int n = first; n <= last; n++) {
+		float threshold = n >= target ? smallestThresholdFor(n, 0.0f, tolerance) : smallestThresholdFor(n, tolerance, infinity);
+		int found = keyframesWithin(threshold, &selection);
+		selections[found] = selection;
+		errors[found] = threshold;
+	}
+
+	if (profiler != NULL) {
+		JSONObject details;
+		details.set("tolerance", static_cast<double>(tolerance));
+		details.set("keyframes", target);
+		details.set("selections", static_cast<int>(selections.size()));
+		details.set("passes", nThresholdPasses);
+		profiler->end(details);
+	}
+	return SelectionProxy(selections, errors);
+}
+
+void SelectionManager::updateSegment(int i) {
+	Profiler::Clock::time_point started;
+	if (profiler != NULL) { started = Profiler::Clock::now(); }
+
+	int s = segmentStartFrames[i];
+	int nKeyframes = keyframesToUseInEachSegment[i];
+	std::vector<int> selForSegment = selectors[i].getSelectionByNKeyframes(nKeyframes);
+	segmentErrors[i] = selectors[i].getErrorByNKeyframes(nKeyframes);
+
+	// Skip the last keyframe (unless this is the last segment), as it's duplicated by the
+	// next segment's first keyframe
+	size_t nToCopy = i < selectors.size() - 1 ? selForSegment.size() - 1 : selForSegment.size();
+	std::vector<int> piece(nToCopy);
+	for (size_t j = 0; j < nToCopy; j++) {
+		piece[j] = s + selForSegment[j];
+	}
+
+	// Swap the segment's old keyframes for its new ones in the combined selection
+	size_t begin = 0;
+	for (int k = 0; k < i; k++) {
+		begin += segmentSelections[k].size();
+	}
+	combinedSelection.erase(combinedSelection.begin() + begin, combinedSelection.begin() + begin + segmentSelections[i].size());
+	combinedSelection.insert(combinedSelection.begin() + begin, piece.begin(), piece.end());
+	segmentSelections[i].swap(piece);
+
+	// Queue the reduction another keyframe would bring (asking for the next level computes it)
+	if (nKeyframes < selectors[i].maximumKeyframes()) {
+		float errorNext = selectors[i].getErrorByNKeyframes(nKeyframes + 1);
+		reductions.push(std::make_pair(segmentErrors[i] - errorNext, i));
+	}
+
+	if (profiler != NULL) { segmentSelectSeconds[i] += Profiler::secondsSince(started); }
+}
+
+void SelectionManager::addSegmentsTo(Profiler& profiler) {
+	for (int i = 0; i < selectors.size(); i++) {
+		JSONObject segment;
+		segment.set("startFrame", segmentStartFrames[i]);
+		segment.set("frames", selectors[i].maximumKeyframes());
+		segment.set("table", segmentTableSources[i]);
+		segment.set("keyframes", keyframesToUseInEachSegment[i]);
+		segment.set("error", static_cast<double>(segmentErrors[i]));
+		segment.set("selectSeconds", segmentSelectSeconds[i]);
+		profiler.addSegment(segment);
+	}
 }
 
 float SelectionManager::getMaxErrorAcrossSegments() {
     float errorMaxTotal = 0;
-    
-    int n = selectors.size();
-    for (int i = 0; i < n; i++) {
-		int nKeyframes = keyframesToUseInEachSegment[i];
-        float errorForSegment = selectors[i].getErrorByNKeyframes(nKeyframes);
-        if (errorForSegment > errorMaxTotal) {
-            errorMaxTotal = errorForSegment;
+    for (size_t i = 0; i < segmentErrors.size(); i++) {
+        if (segmentErrors[i] > errorMaxTotal) {
+            errorMaxTotal = segmentErrors[i];
         }
     }
-    
     return errorMaxTotal;
 }
 
 std::vector<int> SelectionManager::getCombinedSelection() {
-
-	std::vector<int> ret;
-
-	// Copy in selection from each segement
-	int n = selectors.size();
-	for (int i = 0; i < n; i++) {
-		int s = segmentStartFrames[i];
-
-		int nKeyframes = keyframesToUseInEachSegment[i];
-		std::vector<int> selForSegment = selectors[i].getSelectionByNKeyframes(nKeyframes);
-
-		if (i < n - 1) {
-			// Skip the last keyframe, as it's duplicated by the next segment's first keyframe
-			for (int j = 0; j < selForSegment.size() - 1; j++) {
-				ret.push_back(s + selForSegment[j]);
-			}
-		} else {
-			// Copy in all keyframes, as there is no next segment
-			for (int j = 0; j < selForSegment.size(); j++) {
-				ret.push_back(s + selForSegment[j]);
-			}
-		}
-	}
-
-	return ret;
+	return combinedSelection;
 }
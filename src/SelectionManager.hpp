@@ -1,24 +1,78 @@
 #pragma once
 
 #include <map>
+#include <queue>
+#include <utility>
 
 #include "AnimationProxy.hpp"
+#include "ErrorTableCache.hpp"
+#include "Profiler.hpp"
 #include "SelectionProxy.hpp"
+#include "Selector.hpp"
 
+// Splits an animation at its fixed keyframes and shares keyframes between the segments.
+//
+// Each added keyframe goes to the segment whose error it would reduce the most. The
+// reduction each segment would get from one more keyframe is kept in a max-heap, so only
+// the winning segment's selector is advanced and re-queued, and only its part of the
+// combined selection is rebuilt.
+//
+// When given a profiler, the error tables, the initial selection and each call to
+// incrementUntilNKeyframes are timed as phases, and the time spent selecting within each
+// segment is kept for addSegmentsTo.
+//
+// When given a TaskProgress that is cancelled while the error tables are computed, the
+// manager is left without segments and wasCancelled() returns true.
+//
+// selectWithinTolerance skips the keyframe-by-keyframe search: it finds the fewest
+// keyframes whose error keeps within a tolerance, and the best selection with that many,
+// by bisecting the error and asking each segment's selector how many keyframes it needs
+// (one pass over its table). With fixed keyframes, the keyframes are shared between the
+// segments by the error itself, so the error may be smaller than that of the selection
+// with as many keyframes from incrementUntilNKeyframes.
 class SelectionManager {
     
 public:
-	SelectionManager(std::string errorType, AnimationProxy, std::vector<int> fixedKeyframes);
+	SelectionManager(std::string errorType, AnimationProxy, std::vector<int> fixedKeyframes, int maxSpan = 0, ErrorTableCache* cache = NULL, int nThreads = 0, Profiler* profiler = NULL, TaskProgress* progress = NULL);
     void incrementUntilNKeyframes(int);
+	bool addKeyframe();
+	SelectionProxy selectWithinTolerance(float tolerance, int spread = 0);
+	bool wasCancelled() const { return cancelled; }
     float getMaxErrorAcrossSegments();
     std::vector<int> getCombinedSelection();
 	SelectionProxy getFinalSelectionProxy() { return SelectionProxy(finalSelections, finalErrors); }
+	CacheStats getCacheStats() { return cacheStats; }
+	void addSegmentsTo(Profiler& profiler);
     
 private:
+	void updateSegment(int i);
+	int keyframesWithin(float threshold, std::vector<int>* selection = NULL);
+	float smallestThresholdFor(int nKeyframes, float low, float high);
+
 	int maxKeyframes;
+	bool cancelled;
 	std::vector<int> segmentStartFrames;
 	std::vector<int> keyframesToUseInEachSegment;
     std::vector<Selector> selectors;
+
+	// Each unfinished segment's error reduction from one more keyframe, with ties going to
+	// the later segment
+	std::priority_queue< std::pair<float, int> > reductions;
+
+	// Each segment's current error and keyframes (as frames of the whole animation, leaving
+	// out the last keyframe of all but the last segment), and their concatenation
+	std::vector<float> segmentErrors;
+	std::vector< std::vector<int> > segmentSelections;
+	std::vector<int> combinedSelection;
+
 	std::map< int, std::vector<int> > finalSelections;
 	std::map< int, float > finalErrors;
+	CacheStats cacheStats;
+	int nThresholdPasses;
+
+	// Where each segment's error table came from, and (when profiling) how long its
+	// selector has run
+	Profiler* profiler;
+	std::vector<std::string> segmentTableSources;
+	std::vector<double> segmentSelectSeconds;
 };
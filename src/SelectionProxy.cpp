@@ -9,6 +9,7 @@
 #include <iostream>
 #include <string>
 #include <sstream>
+#include <stdint.h>
 
 #include "common.hpp"
 #include "SelectionProxy.hpp"
@@ -48,3 +49,34 @@ int SelectionProxy::save(std::string path) {
     }
     return File::writeStringToFile(path, content);
 }
+
+
+int SelectionProxy::saveBinary(std::string path) {
+
+    // Layout (native-endian int32/float32):
+    //   count, keyframe counts[count], errors[count], offsets[count + 1], keyframes[offsets[count]]
+    // where the selection for counts[i] is keyframes[offsets[i]] up to keyframes[offsets[i + 1]].
+    std::vector<int32_t> counts;
+    std::vector<float> errorValues;
+    std::vector<int32_t> offsets(1, 0);
+    std::vector<int32_t> keyframes;
+    for (std::map< int, std::vector<int> >::iterator iter = selections.begin(); iter != selections.end(); ++iter) {
+        counts.push_back(iter->first);
+        errorValues.push_back(errors[iter->first]);
+        keyframes.insert(keyframes.end(), iter->second.begin(), iter->second.end());
+        offsets.push_back(static_cast<int32_t>(keyframes.size()));
+    }
+
+    int32_t count = static_cast<int32_t>(counts.size());
+    std::string content;
+    content.append(reinterpret_cast<const char*>(&count), sizeof(int32_t));
+    content.append(reinterpret_cast<const char*>(counts.data()), counts.size() * sizeof(int32_t));
+    content.append(reinterpret_cast<const char*>(errorValues.data()), errorValues.size() * sizeof(float));
+    content.append(reinterpret_cast<const char*>(offsets.data()), offsets.size() * sizeof(int32_t));
+    content.append(reinterpret_cast<const char*>(keyframes.data()), keyframes.size() * sizeof(int32_t));
+
+    if (VERBOSE > 0) {
+        std::cout << " Saving binary selection table to " << path << std::endl;
+    }
+    return File::writeBytesToFile(path, content.data(), content.size());
+}
\ No newline at end of file
@@ -33,6 +33,7 @@ public:
 	}
 
     int save(std::string path);
+    int saveBinary(std::string path);
  
 private:
     std::map< int, std::vector <int> > selections;
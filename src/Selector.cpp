@@ -8,63 +8,54 @@
 #include <stdio.h>
 #include <iostream>
 #include <sstream>
-#include <limits.h>
+#include <limits>
 #include <algorithm>
 
 #include "common.hpp"
 #include "Selector.hpp"
 
 
-float errorForSelection(const ErrorTable& table, std::vector<int> sel) {
-	float maxError = 0;
-	for (int i = 1; i < sel.size(); i++) {
-		float e = table.errorValue(sel[i - 1], sel[i]);
-		if (e > maxError) {
-			maxError = e;
-		}
-	}
-	return maxError;
-}
-
-SelectionRow::SelectionRow(int nFrames, const ErrorTable& table) :
-	nFrames(nFrames), table(table) {
-        
-    for (int j = 1; j < nFrames; j++) {
-		errors[j] = table.errorValue(0, j);
-        std::vector<int> sel(2, -1);
-        sel[0] = 0;
-        sel[1] = j;
-        selections[j] = sel;
-    }
-}
-
 Selector::Selector(const AnimationProxy anim, const ErrorTable errorTable) :
 	anim(anim), table(errorTable) {
 
-	int nFrames = anim.getNFrames();
-
-	// Make the first guy
-	std::vector<int> firstSelection;
-	firstSelection.push_back(0);
-	firstSelection.push_back(nFrames - 1);
-	float firstError = errorTable.errorValue(0, nFrames - 1);
-	rows.push_back(SelectionRow(nFrames, errorTable));
+	nFrames = anim.getNFrames();
 	nKeyframes = 2;
-	selections[2] = firstSelection;
-	errors[2] = firstError;
-	lastSelection = firstSelection;
-	lastError = firstError;
-	
+
+	// With two keyframes, the only choice for each end frame is to start at the first frame
+	currentErrors.assign(std::max(nFrames, 1), 0.0f);
+	for (int e = 1; e < nFrames; e++) {
+		currentErrors[e] = table.errorValue(0, e);
+	}
+	previousErrors.assign(currentErrors.size(), 0.0f);
+
+	errors.assign(3, 0.0f);
+	errors[2] = nFrames > 1 ? currentErrors[nFrames - 1] : 0.0f;
+	levelOffsets.assign(3, 0);
+
+	// Fewer keyframes cannot cover the clip without a span longer than the table allows
+	while (nKeyframes < minimumKeyframes()) { next(); }
+}
+
+int Selector::minimumKeyframes() const {
+	if (nFrames < 2) { return 2; }
+	int maxSpan = table.getMaxSpan();
+	return std::max(2, (nFrames - 1 + maxSpan - 1) / maxSpan + 1);
 }
 
 void Selector::next() {
 
-	nKeyframes = nKeyframes + 1;
+	// Every frame is already a keyframe
+	if (nKeyframes >= nFrames) {
+		return;
+	}
 
-	int nFrames = anim.getNFrames();
+	nKeyframes = nKeyframes + 1;
+	currentErrors.swap(previousErrors);
 
-	SelectionRow previous = rows.at(rows.size() - 1);
-	SelectionRow next = SelectionRow(nFrames, table);
+	size_t offset = backPointers.size();
+	backPointers.resize(offset + nFrames - nKeyframes + 1);
+	levelOffsets.push_back(offset);
+	int* back = &backPointers[offset];
 
 	int kOptimal;
 	float bestValue, value, akValue, keValue;
@@ -73,10 +64,12 @@ void Selector::next() {
 		kOptimal = -1;
 		bestValue = std::numeric_limits<float>::infinity();
 
-		for (int k = nKeyframes - 2; k < e; ++k) {
+		// Only keyframes within the table's band of e can precede it
+		int kFirst = std::max(nKeyframes - 2, table.firstInColumn(e));
+		for (int k = kFirst; k < e; ++k) {
 
 			// Get current value
-			akValue = previous.getErrorValue(k);
+			akValue = previousErrors[k];
 			keValue = table.errorValue(k, e);
 
 			if (akValue > keValue) {
@@ -93,21 +86,82 @@ void Selector::next() {
 			}
 		}
 
-		// Update values and selections in next table
-		std::vector<int> next_sel = previous.getSelection(kOptimal);
-		next_sel.push_back(e);
-		next.setErrorValue(e, bestValue);
-		next.setSelection(e, next_sel);
+		currentErrors[e] = bestValue;
+		back[e - (nKeyframes - 1)] = kOptimal;
 	}
 
-	rows.push_back(next);
-	SelectionRow lastRow = rows.at(rows.size() - 1);
-	std::vector<int> finalSelection = lastRow.getSelection(nFrames - 1);
-	float finalError = errorForSelection(table, finalSelection);
+	errors.push_back(currentErrors[nFrames - 1]);
+}
 
-	int n = finalSelection.size();
-	selections[n] = finalSelection;
-	errors[n] = finalError;
-	lastSelection = finalSelection;
-	lastError = finalError;
+float Selector::getErrorByNKeyframes(int n) {
+	while (nKeyframes < n && nKeyframes < nFrames) { next(); }
+	if (n < 2 || n > nKeyframes) {
+		return 0.0f;
+	}
+	return errors[n];
+}
+
+std::vector<int> Selector::getSelectionByNKeyframes(int n) {
+	while (nKeyframes < n && nKeyframes < nFrames) { next(); }
+	if (n < minimumKeyframes() || n > nKeyframes) {
+		return std::vector<int>();
+	}
+
+	// Walk the back-pointers from the last frame to the first
+	std::vector<int> selection(n);
+	int e = nFrames - 1;
+	selection[n - 1] = e;
+	for (int level = n; level > 2; level--) {
+		e = backPointers[levelOffsets[level] + e - (level - 1)];
+		selection[level - 2] = e;
+	}
+	selection[0] = 0;
+	return selection;
+}
+
+// A shortest path from the first frame to the last through the spans whose error is at
+// most the threshold, taking the earliest keyframe among equally short paths. Spans of
+// one frame have no error, so any threshold of at least zero can be met; a threshold that
+// cannot be met gives more keyframes than there are frames.
+int Selector::keyframesWithin(float threshold, std::vector<int>* selection) const {
+	if (nFrames < 2) {
+		if (selection != NULL) { selection->assign(nFrames, 0); }
+		return nFrames;
+	}
+
+	std::vector<int> hops(nFrames, nFrames);
+	std::vector<int> previous(nFrames, -1);
+	hops[0] = 0;
+	for (int e = 1; e < nFrames; e++) {
+		int kFirst = table.firstInColumn(e);
+		const float* column = table.columnValues(e);
+		for (int k = kFirst; k < e; k++) {
+			if (hops[k] + 1 < hops[e] && column[k - kFirst] <= threshold) {
+				hops[e] = hops[k] + 1;
+				previous[e] = k;
+			}
+		}
+	}
+
+	int n = hops[nFrames - 1] + 1;
+	if (selection != NULL) {
+		selection->clear();
+		if (n <= nFrames) {
+			selection->resize(n);
+			for (int m = n - 1, e = nFrames - 1; m >= 0; m--, e = previous[e]) {
+				(*selection)[m] = e;
+			}
+		}
+	}
+	return n;
+}
+
+SelectionProxy Selector::getProxy() {
+	std::map< int, std::vector<int> > selections;
+	std::map< int, float > errorsByN;
+	for (int n = minimumKeyframes(); n <= nKeyframes; n++) {
+		selections[n] = getSelectionByNKeyframes(n);
+		errorsByN[n] = errors[n];
+	}
+	return SelectionProxy(selections, errorsByN);
 }
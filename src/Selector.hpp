@@ -1,44 +1,53 @@
 #pragma once
 
 #include <map>
+#include <vector>
 
 #include "ErrorTable.hpp"
 #include "SelectionProxy.hpp"
 
-
-class SelectionRow {
-public:
-    SelectionRow(int nFrames, const ErrorTable& errorTable);
-    float getErrorValue(int e) { return errors[e]; }
-    void setErrorValue(int e, float value) { errors[e] = value; }
-    std::vector<int> getSelection(int e) { return selections[e]; }
-    void setSelection(int e, std::vector<int> selection) {  selections[e] = selection; }
-private:
-    int nFrames;
-    const ErrorTable& table;
-    std::map< int, float > errors;
-    std::map< int, std::vector<int> > selections;
-};
-
+// Finds the selection of n keyframes with the smallest maximum error, for increasing n.
+//
+// The dynamic programme keeps only flat arrays: the best error for every end frame at the
+// current level (and the level before it), and, for every level, a back-pointer to the
+// keyframe preceding each end frame. Selections are rebuilt from the back-pointers when
+// they are asked for, so memory grows as O(frames x levels) ints rather than as a full
+// copy of a selection for every end frame at every level.
+//
+// When the error table is banded, transitions longer than its maximum span are never
+// considered, and selections start at the fewest keyframes that can cover the clip.
+//
+// keyframesWithin answers the question the other way round: given an error, it finds the
+// fewest keyframes whose spans all keep within it, in a single pass over the table.
 class Selector {
 public:
 	Selector(const AnimationProxy anim, const ErrorTable errorTable);
 	void next();
-	SelectionProxy getProxy() { return SelectionProxy(selections, errors); }
-	void upToN(int maxKeyframes) { while (nKeyframes <= maxKeyframes) { next(); nKeyframes += 1; } }
+	SelectionProxy getProxy();
+	void upToN(int maxKeyframes) { while (nKeyframes < maxKeyframes && nKeyframes < maximumKeyframes()) { next(); } }
 	int countKeyframes() { return nKeyframes; }
-	std::vector<int> getLastSelection() { return lastSelection; }
-	int getLastError() { return lastError; }
-	float getErrorByNKeyframes(int n) { return errors[n]; }
-	std::vector<int> getSelectionByNKeyframes(int n) { return selections[n]; }
-	int maximumKeyframes() { return anim.getNFrames(); }
+	std::vector<int> getLastSelection() { return getSelectionByNKeyframes(nKeyframes); }
+	float getLastError() { return getErrorByNKeyframes(nKeyframes); }
+	float getErrorByNKeyframes(int n);
+	std::vector<int> getSelectionByNKeyframes(int n);
+	int minimumKeyframes() const;
+	int keyframesWithin(float threshold, std::vector<int>* selection = NULL) const;
+	int maximumKeyframes() { return nFrames; }
 private:
 	AnimationProxy anim;
 	ErrorTable table;
-	std::vector<SelectionRow> rows;
-	std::map< int, std::vector<int> > selections;
-	std::map< int, float > errors;
-	int nKeyframes;	
-	std::vector<int> lastSelection;
-	float lastError;
+	int nFrames;
+	int nKeyframes;
+
+	// Best error for each end frame, using the current and the previous number of keyframes
+	std::vector<float> currentErrors;
+	std::vector<float> previousErrors;
+
+	// Back-pointers for levels 3 and up, one block per level, each starting at the level's
+	// first possible end frame (the level with n keyframes covers end frames n-1 to nFrames-1)
+	std::vector<int> backPointers;
+	std::vector<size_t> levelOffsets;
+
+	// Error of the best selection for each number of keyframes (indexed by n)
+	std::vector<float> errors;
 };
@@ -1,120 +1,37 @@
 #include <stdio.h>
 #include <iostream>
 #include <fstream>
+#include <sstream>
+#include <limits>
+#include <errno.h>
+#include <math.h>
+
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+#ifdef _WIN32
+#define NOMINMAX
+#include <windows.h>
+#include <direct.h>
+#include <psapi.h>
+#else
+#include <dirent.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/resource.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
 
 #include "common.hpp"
+#include "CubicFitter.hpp"
 
 #define VERBOSE 0
 
-#define FITTING_ITERATIONS 4
-#define SAMPLES_PER_CURVE 10
-#define FITTING_RESOLUTION 100
-
 HighDimCubic HighDimCubic::fitToCurve(const Curve& curve, int from, int to) {
-
-	std::vector<float> samples;
-	float denom = SAMPLES_PER_CURVE - 1;
-	for (int i = 0; i < SAMPLES_PER_CURVE; i++) {
-		samples.push_back(i / denom);
-	}
-
-	int nDims = curve.data.rows();
-
-	Eigen::Matrix<float, SAMPLES_PER_CURVE, 2> R14;
-	Eigen::Matrix<float, SAMPLES_PER_CURVE, 2> R23;
-	Eigen::Matrix<float, 1, 4> r;
-	Eigen::Matrix<float, 1, 4> rm;
-	
-	Eigen::Matrix4f M;
-	M(0, 0) = -1.0; M(0, 1) = 3.0; M(0, 2) = -3.0; M(0, 3) = 1.0;
-	M(1, 0) = 3.0; M(1, 1) = -6.0; M(1, 2) = 3.0; M(1, 3) = 0.0;
-	M(2, 0) = -3.0; M(2, 1) = 3.0; M(2, 2) = 0.0; M(2, 3) = 0.0;
-	M(3, 0) = 1.0; M(3, 1) = 0.0; M(3, 2) = 0.0; M(3, 3) = 0.0;
-
-	Eigen::VectorXf p1;
-	Eigen::VectorXf p2;
-	Eigen::VectorXf p3;
-	Eigen::VectorXf p4;
-
-	Eigen::MatrixXf A = Eigen::MatrixXf(SAMPLES_PER_CURVE, nDims);
-	Eigen::MatrixXf C14 = Eigen::MatrixXf(2, nDims);
-	Eigen::MatrixXf C23 = Eigen::MatrixXf(2, nDims);
-	Eigen::MatrixXf b;
-	Eigen::VectorXf p;
-	Eigen::VectorXf interp;
-
-	for (int i = 0; i < FITTING_ITERATIONS; i++) {
-		for (int j = 0; j < SAMPLES_PER_CURVE; j++) {
-
-			float u = samples[j];
-
-			// Set sampling parameter into row
-			r(0, 0) = pow(u, 3);
-			r(0, 1) = pow(u, 2);
-			r(0, 2) = u;
-			r(0, 3) = 1;
-
-			// Dot row with coeffecient matrix
-			rm = r * M;
-
-			// Set matrix R using (sampling . coeffecient)
-			R14(j, 0) = rm(0, 0);
-			R23(j, 0) = rm(0, 1);
-			R23(j, 1) = rm(0, 2);
-			R14(j, 1) = rm(0, 3);
-
-			// Set curve data into matrix A
-			float x = from + (to - from) * u;
-			curve.sampleAt(interp, x);
-			A.row(j) = interp;
-
-			// Set C14 (only first and last frame)
-			if (j == 0) { 
-				C14.row(0) = A.row(j);
-			} else if (j == SAMPLES_PER_CURVE - 1) {
-				C14.row(1) = A.row(j);
-			}
-		}
-
-		// Create b
-		b = A - R14 * C14;
-
-		// Solve linear system
-		C23 = R23.colPivHouseholderQr().solve(b);
-		p1 = C14.row(0);
-		p2 = C23.row(0);
-		p3 = C23.row(1);
-		p4 = C14.row(1);
-
-		for (int j = 0; j < SAMPLES_PER_CURVE; j++) {
-			float x = from + (to - from) * (j / denom);
-			float best_u = -1;
-			float min_dist = 999.0f;
-			for (int k = 0; k < FITTING_RESOLUTION; k++) {
-				float u = k / float(FITTING_RESOLUTION - 1);
-				float oneSubU = 1 - u;
-				float p1c = pow(oneSubU, 3);
-				float p2c = 3 * pow(oneSubU, 2) * u;
-				float p3c = 3 * oneSubU * pow(u, 2);
-				float p4c = pow(u, 3);
-				p = p1 * p1c;
-				p += p2 * p2c;
-				p += p3 * p3c;
-				p += p4 * p4c;
-				curve.sampleAt(interp, x);
-				float dist = (p - interp).norm();
-				if (dist < min_dist) {
-					min_dist = dist;
-					best_u = u;
-				}
-			}
-
-			samples[j] = best_u;
-		}
-	}
-
-	// Extract solved "control points" and use them to make a new cubic
-	return HighDimCubic(C14.row(0), C23.row(0), C23.row(1), C14.row(1));
+	CubicFitter fitter(static_cast<int>(curve.data.rows()));
+	return fitter.fit(curve.data, from, to);
 }
 
 std::vector<std::string> divideLineIntoParts(char line[], const char* delimiter) {
@@ -154,6 +71,21 @@ int File::writeStringToFile(std::string filepath, std::string content) {
     return 0;
 }
 
+int File::writeBytesToFile(std::string filepath, const char* bytes, size_t nBytes) {
+    std::ofstream handle;
+    handle.open(filepath, std::ios::out | std::ios::binary);
+    if (!handle.good()) { return 1; }
+    handle.write(bytes, nBytes);
+    handle.close();
+    return 0;
+}
+
+long File::sizeOf(std::string filepath) {
+    std::ifstream handle(filepath, std::ios::in | std::ios::binary | std::ios::ate);
+    if (!handle.good()) { return -1; }
+    return static_cast<long>(handle.tellg());
+}
+
 std::string File::getDirectory() {
     size_t found;
     found = path.find_last_of("/\\");
@@ -168,3 +100,222 @@ bool OS::doesFileExist(std::string path) {
     std::ifstream infile(path);
 	return infile.good();
 }
+
+bool OS::isDirectory(std::string path) {
+#ifdef _WIN32
+    DWORD attributes = GetFileAttributesA(path.c_str());
+    return attributes != INVALID_FILE_ATTRIBUTES && (attributes & FILE_ATTRIBUTE_DIRECTORY);
+#else
+    struct stat info;
+    return stat(path.c_str(), &info) == 0 && S_ISDIR(info.st_mode);
+#endif
+}
+
+bool OS::makeDirectory(std::string path) {
+#ifdef _WIN32
+    return _mkdir(path.c_str()) == 0 || errno == EEXIST;
+#else
+    return mkdir(path.c_str(), 0755) == 0 || errno == EEXIST;
+#endif
+}
+
+// The most memory the process has held at once (its peak resident set)
+size_t OS::peakMemoryBytes() {
+#ifdef _WIN32
+    PROCESS_MEMORY_COUNTERS counters;
+    if (!GetProcessMemoryInfo(GetCurrentProcess(), &counters, sizeof(counters))) { return 0; }
+    return counters.PeakWorkingSetSize;
+#else
+    struct rusage usage;
+    if (getrusage(RUSAGE_SELF, &usage) != 0) { return 0; }
+#ifdef __APPLE__
+    return static_cast<size_t>(usage.ru_maxrss);
+#else
+    return static_cast<size_t>(usage.ru_maxrss) * 1024;
+#endif
+#endif
+}
+
+double OS::cpuSeconds() {
+#ifdef _WIN32
+    FILETIME creation, exit, kernel, user;
+    if (!GetProcessTimes(GetCurrentProcess(), &creation, &exit, &kernel, &user)) { return 0.0; }
+    ULARGE_INTEGER k, u;
+    k.LowPart = kernel.dwLowDateTime; k.HighPart = kernel.dwHighDateTime;
+    u.LowPart = user.dwLowDateTime; u.HighPart = user.dwHighDateTime;
+    return (k.QuadPart + u.QuadPart) * 1e-7;
+#else
+    struct rusage usage;
+    if (getrusage(RUSAGE_SELF, &usage) != 0) { return 0.0; }
+    return usage.ru_utime.tv_sec + usage.ru_stime.tv_sec + (usage.ru_utime.tv_usec + usage.ru_stime.tv_usec) * 1e-6;
+#endif
+}
+
+// The names of the regular files in a directory, in no particular order
+int OS::threadsFor(int nThreads) {
+#ifdef _OPENMP
+    return nThreads > 0 ? nThreads : omp_get_max_threads();
+#else
+    return 1;
+#endif
+}
+
+std::vector<std::string> OS::listDirectory(std::string path) {
+    std::vector<std::string> names;
+#ifdef _WIN32
+    WIN32_FIND_DATAA found;
+    HANDLE handle = FindFirstFileA((path + "\\*").c_str(), &found);
+    if (handle == INVALID_HANDLE_VALUE) { return names; }
+    do {
+        if (!(found.dwFileAttributes & FILE_ATTRIBUTE_DIRECTORY)) { names.push_back(found.cFileName); }
+    } while (FindNextFileA(handle, &found));
+    FindClose(handle);
+#else
+    DIR* dir = opendir(path.c_str());
+    if (dir == NULL) { return names; }
+    struct dirent* entry;
+    while ((entry = readdir(dir)) != NULL) {
+        struct stat info;
+        std::string full = path + "/" + entry->d_name;
+        if (stat(full.c_str(), &info) == 0 && S_ISREG(info.st_mode)) { names.push_back(entry->d_name); }
+    }
+    closedir(dir);
+#endif
+    return names;
+}
+
+#ifdef _WIN32
+
+MappedFile::MappedFile(std::string path) : bytes(NULL), nBytes(0), fileHandle(NULL), mappingHandle(NULL) {
+    HANDLE file = CreateFileA(path.c_str(), GENERIC_READ, FILE_SHARE_READ, NULL, OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL, NULL);
+    if (file == INVALID_HANDLE_VALUE) { return; }
+    fileHandle = file;
+
+    LARGE_INTEGER size;
+    if (!GetFileSizeEx(file, &size) || size.QuadPart == 0) { return; }
+    HANDLE mapping = CreateFileMappingA(file, NULL, PAGE_READONLY, 0, 0, NULL);
+    if (mapping == NULL) { return; }
+    mappingHandle = mapping;
+
+    bytes = static_cast<const char*>(MapViewOfFile(mapping, FILE_MAP_READ, 0, 0, 0));
+    if (bytes != NULL) { nBytes = static_cast<size_t>(size.QuadPart); }
+}
+
+MappedFile::~MappedFile() {
+    if (bytes != NULL) { UnmapViewOfFile(bytes); }
+    if (mappingHandle != NULL) { CloseHandle(mappingHandle); }
+    if (fileHandle != NULL) { CloseHandle(fileHandle); }
+}
+
+#else
+
+MappedFile::MappedFile(std::string path) : bytes(NULL), nBytes(0) {
+    int fd = open(path.c_str(), O_RDONLY);
+    if (fd < 0) { return; }
+
+    struct stat info;
+    if (fstat(fd, &info) == 0 && info.st_size > 0) {
+        void* mapped = mmap(NULL, static_cast<size_t>(info.st_size), PROT_READ, MAP_PRIVATE, fd, 0);
+        if (mapped != MAP_FAILED) {
+            bytes = static_cast<const char*>(mapped);
+            nBytes = static_cast<size_t>(info.st_size);
+        }
+    }
+
+    // The mapping stays valid after the descriptor is closed
+    ::close(fd);
+}
+
+MappedFile::~MappedFile() {
+    if (bytes != NULL) { munmap(const_cast<char*>(bytes), nBytes); }
+}
+
+#endif
+
+
+JSONObject& JSONObject::set(std::string key, int value) {
+	std::ostringstream os; os << value;
+	return setRaw(key, os.str());
+}
+
+JSONObject& JSONObject::set(std::string key, long long value) {
+	std::ostringstream os; os << value;
+	return setRaw(key, os.str());
+}
+
+JSONObject& JSONObject::set(std::string key, double value) {
+	if (value != value || value == std::numeric_limits<double>::infinity() || value == -std::numeric_limits<double>::infinity()) {
+		return setRaw(key, "null");
+	}
+	std::ostringstream os;
+	os.precision(std::numeric_limits<double>::digits10);
+	os << value;
+	return setRaw(key, os.str());
+}
+
+JSONObject& JSONObject::setRaw(std::string key, std::string json) {
+	fields.push_back(std::make_pair(key, json));
+	return *this;
+}
+
+std::string JSONObject::str() const {
+	std::ostringstream os;
+	os << "{";
+	for (size_t i = 0; i < fields.size(); i++) {
+		if (i > 0) { os << ","; }
+		os << quote(fields[i].first) << ":" << fields[i].second;
+	}
+	os << "}";
+	return os.str();
+}
+
+std::string JSONObject::quote(std::string value) {
+	std::ostringstream os;
+	os << "\"";
+	for (size_t i = 0; i < value.size(); i++) {
+		char c = value[i];
+		if (c == '"' || c == '\\') { os << '\\' << c; }
+		else if (c == '\n') { os << "\\n"; }
+		else if (c == '\t') { os << "\\t"; }
+		else if (static_cast<unsigned char>(c) < 0x20) { os << " "; }
+		else { os << c; }
+	}
+	os << "\"";
+	return os.str();
+}
+
+std::string JSONObject::array(const std::vector<int>& values) {
+	std::ostringstream os;
+	os << "[";
+	for (size_t i = 0; i < values.size(); i++) {
+		if (i > 0) { os << ","; }
+		os << values[i];
+	}
+	os << "]";
+	return os.str();
+}
+
+// Floats are written with enough digits to read back exactly, and non-finite values as null
+std::string JSONObject::array(const std::vector<float>& values) {
+	std::ostringstream os;
+	os.precision(std::numeric_limits<float>::max_digits10);
+	os << "[";
+	for (size_t i = 0; i < values.size(); i++) {
+		if (i > 0) { os << ","; }
+		if (values[i] != values[i] || fabs(values[i]) == std::numeric_limits<float>::infinity()) { os << "null"; }
+		else { os << values[i]; }
+	}
+	os << "]";
+	return os.str();
+}
+
+std::string JSONObject::array(const std::vector<JSONObject>& values) {
+	std::ostringstream os;
+	os << "[";
+	for (size_t i = 0; i < values.size(); i++) {
+		if (i > 0) { os << ","; }
+		os << values[i].str();
+	}
+	os << "]";
+	return os.str();
+}
@@ -1,6 +1,7 @@
 #pragma once
 
 #include <stdio.h>
+#include <atomic>
 #include <string>
 #include <vector>
 #include <string.h>
@@ -69,13 +70,73 @@ public:
     std::vector< std::vector<std::string> > divideByLineAndDelimiter(std::string delimiter);
     void close();
     static int writeStringToFile(std::string filepath, std::string content);
+    static int writeBytesToFile(std::string filepath, const char* bytes, size_t nBytes);
+    static long sizeOf(std::string filepath);
     std::string getDirectory();
 private:
     FILE *file;
     std::string path;
 };
 
+// Lets a long computation on another thread report how far it has got, and be cancelled
+class TaskProgress {
+public:
+	TaskProgress() : cancelled(false), done(0), total(0) {}
+	std::atomic<bool> cancelled;
+	std::atomic<long long> done;
+	std::atomic<long long> total;
+};
+
 class OS {
 public:
     static bool doesFileExist(std::string path);
+    static bool isDirectory(std::string path);
+    static bool makeDirectory(std::string path);
+    static size_t peakMemoryBytes();
+    static double cpuSeconds();
+    static std::vector<std::string> listDirectory(std::string path);
+
+    // The threads a parallel loop asked for nThreads runs on: every core for 0 or less,
+    // and one without OpenMP
+    static int threadsFor(int nThreads);
+};
+
+// A read-only memory mapping of a whole file, unmapped when it goes out of scope
+class MappedFile {
+public:
+    MappedFile(std::string path);
+    ~MappedFile();
+    bool isOpen() const { return bytes != NULL; }
+    const char* data() const { return bytes; }
+    size_t size() const { return nBytes; }
+private:
+    MappedFile(const MappedFile&);
+    MappedFile& operator=(const MappedFile&);
+    const char* bytes;
+    size_t nBytes;
+#ifdef _WIN32
+    void* fileHandle;
+    void* mappingHandle;
+#endif
+};
+
+// Builds a flat JSON object, used where structured results are handed back to the caller
+class JSONObject {
+public:
+	JSONObject& set(std::string key, std::string value) { return setRaw(key, quote(value)); }
+	JSONObject& set(std::string key, const char* value) { return setRaw(key, quote(value)); }
+	JSONObject& set(std::string key, bool value) { return setRaw(key, value ? "true" : "false"); }
+	JSONObject& set(std::string key, int value);
+	JSONObject& set(std::string key, long long value);
+	JSONObject& set(std::string key, double value);
+	JSONObject& set(std::string key, const JSONObject& value) { return setRaw(key, value.str()); }
+	JSONObject& setRaw(std::string key, std::string json);
+	bool empty() const { return fields.empty(); }
+	std::string str() const;
+	static std::string quote(std::string value);
+	static std::string array(const std::vector<JSONObject>& values);
+	static std::string array(const std::vector<int>& values);
+	static std::string array(const std::vector<float>& values);
+private:
+	std::vector< std::pair<std::string, std::string> > fields;
 };
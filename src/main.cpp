@@ -3,14 +3,23 @@
 #include <sstream>
 #include <algorithm>
 #include <iterator>
+#include <map>
+#include <set>
 #include <chrono> 
 
 #include "common.hpp"
+#include "AnimationLoader.hpp"
 #include "AnimationProxy.hpp"
+#include "BatchRunner.hpp"
+#include "CompressedAnimation.hpp"
 #include "ErrorTable.hpp"
+#include "ErrorTableCache.hpp"
 #include "Selector.hpp"
+#include "MultiresolutionSelector.hpp"
 #include "SelectionManager.hpp"
 #include "Interpolator.hpp"
+#include "PoseProjection.hpp"
+#include "Profiler.hpp"
 
 std::vector<int> parseCSVString(std::string s) {
 	std::string delim = ",";
@@ -26,36 +35,146 @@ std::vector<int> parseCSVString(std::string s) {
 	return parts;
 }
 
+// Reduces every clip in a manifest or directory, writing one JSON line per clip
+int runBatch(std::map<std::string, std::string> options) {
+	if (!options.count("output")) {
+		std::cerr << "----------------------------------" << std::endl;
+		std::cerr << "Invalid arguments" << std::endl;
+		std::cerr << "-----------------" << std::endl;
+		std::cerr << "Batch mode needs --output:" << std::endl;
+		std::cerr << "    --batch (string): a directory of CSV files and " << CLIP_EXTENSION << " clips, or a manifest listing one clip per line" << std::endl;
+		std::cerr << "        (optionally followed by a tab and comma-separated fixed keyframes)" << std::endl;
+		std::cerr << "    --output (string): where to write the results, one JSON line per clip" << std::endl;
+		std::cerr << "Options:" << std::endl;
+		std::cerr << "    --error-type (string): `line` or `curve` (default `line`)" << std::endl;
+		std::cerr << "    --keyframes (int): keyframes to select in each clip (default a fifth of its frames)" << std::endl;
+		std::cerr << "    --max-span (int): only consider keyframe gaps up to this many frames (0 for no limit)" << std::endl;
+		std::cerr << "    --jobs (int): clips to process at once (0 for one per core)" << std::endl;
+		std::cerr << "    --threads (int): threads used within each clip (default 1)" << std::endl;
+		std::cerr << "    --memory-mb (int): hold back clips while the estimated memory of those running would exceed this (0 for no limit)" << std::endl;
+		std::cerr << "    --resume: skip the clips already in the output, redoing any that failed, were cut short or were reduced with other settings" << std::endl;
+		std::cerr << "    --export (string): also write every reduced clip to this compressed (" << COMPRESSED_EXTENSION << ") file" << std::endl;
+		std::cerr << "----------------------------------" << std::endl;
+		return 1;
+	}
+
+	BatchSettings settings;
+	settings.outputPath = options["output"];
+	settings.errorType = options.count("error-type") ? options["error-type"] : "line";
+	settings.nKeyframes = options.count("keyframes") ? std::stoi(options["keyframes"]) : 0;
+	settings.maxSpan = options.count("max-span") ? std::stoi(options["max-span"]) : 0;
+	settings.nJobs = options.count("jobs") ? std::stoi(options["jobs"]) : 0;
+	settings.nThreadsPerClip = options.count("threads") ? std::stoi(options["threads"]) : 1;
+	settings.memoryBudget = options.count("memory-mb") ? static_cast<size_t>(std::stoll(options["memory-mb"])) * 1024 * 1024 : 0;
+	settings.resume = options.count("resume") > 0;
+	settings.exportPath = options.count("export") ? options["export"] : "";
+	if (settings.errorType != "line" && settings.errorType != "curve") {
+		std::cerr << "The error type `" << settings.errorType << "` is not understood, must be either `line` or `curve`" << std::endl;
+		return 1;
+	}
+	if (settings.resume && settings.exportPath.length() > 0) {
+		std::cerr << "A compressed file is written in one go, so --export cannot be resumed" << std::endl;
+		return 1;
+	}
+
+	std::vector<BatchClip> clips = BatchRunner::clipsFrom(options["batch"]);
+	if (clips.size() == 0) {
+		std::cerr << "No clips found in " << options["batch"] << std::endl;
+		return 1;
+	}
+	BatchRunner runner(settings);
+	return runner.run(clips);
+}
+
 int main (int argc, const char * argv[]) {    
 
-	if (argc != 5) {
+	// Options are given as `--name value` pairs after (or between) the positional arguments,
+	// apart from switches, which take no value
+	std::set<std::string> switches;
+	switches.insert("resume");
+	std::vector<std::string> positional;
+	std::map<std::string, std::string> options;
+	for (int i = 1; i < argc; i++) {
+		std::string arg = argv[i];
+		if (arg.compare(0, 2, "--") == 0 && switches.count(arg.substr(2))) {
+			options[arg.substr(2)] = "1";
+		} else if (arg.compare(0, 2, "--") == 0 && i + 1 < argc) {
+			options[arg.substr(2)] = argv[++i];
+		} else {
+			positional.push_back(arg);
+		}
+	}
+
+	if (options.count("batch")) {
+		return runBatch(options);
+	}
+
+	if (positional.size() != 4) {
 		std::cerr << "----------------------------------" << std::endl;
 		std::cerr << "Invalid arguments" << std::endl;
 		std::cerr << "-----------------" << std::endl;
 		std::cerr << "You must provide 4 args:" << std::endl;
-		std::cerr << "    1. filepath (string)" << std::endl;
+		std::cerr << "    1. filepath (string, a CSV file or a " << CLIP_EXTENSION << " clip)" << std::endl;
 		std::cerr << "    2. error type (string, can be `line` or `curve`)" << std::endl;
 		std::cerr << "    3. n keyframes (int)" << std::endl;
 		std::cerr << "    4. fixed keyframes (csv string, e.g. `12,30`, or use `x` for nothing)" << std::endl;
+		std::cerr << "Options:" << std::endl;
+		std::cerr << "    --max-span (int): only consider keyframe gaps up to this many frames (0 for no limit)" << std::endl;
+		std::cerr << "    --cache-dir (string): load and save error tables in this directory, reusing them across runs" << std::endl;
+		std::cerr << "    --threads (int): number of threads used to compute error tables (0 for all cores)" << std::endl;
+		std::cerr << "    --components (int): select using this many principal components of the poses (0 for the full poses)" << std::endl;
+		std::cerr << "    --variance (float): or use the fewest components that explain this fraction of the variance, e.g. 0.99" << std::endl;
+		std::cerr << "    --decimate (int): select on every nth frame, then refine the keyframes at full resolution (default 1, exact)" << std::endl;
+		std::cerr << "    --window (int): how many frames each keyframe may move when refined (default half the decimation)" << std::endl;
+		std::cerr << "    --tolerance (float): instead of n keyframes, select the fewest keyframes whose error is at most this" << std::endl;
+		std::cerr << "    --spread (int): with --tolerance, also select up to this many keyframes more and fewer (default 0)" << std::endl;
+		std::cerr << "    --save (string): also write the animation to this path, as a clip if it ends in " << CLIP_EXTENSION << " and as CSV otherwise" << std::endl;
+		std::cerr << "    --export (string): write the reduced animation (every curve, at n keyframes) to this compressed " << COMPRESSED_EXTENSION << " file" << std::endl;
+		std::cerr << "    --instrument (string): write the time, CPU time and peak memory of each phase as JSON to this file (`-` for stdout)" << std::endl;
+		std::cerr << "Or, to reduce many clips at once: --batch (manifest or directory) --output (results file); give --batch without --output to list its options" << std::endl;
 		std::cerr << "----------------------------------" << std::endl;
 		return 1;
 	}
 	
-	int argIx = 1;
-	std::string filepath = argv[argIx++];
-	std::string errorType = argv[argIx++];
-	int nKeyframes = std::stoi(argv[argIx++]);
-	std::string fixedKeyframesStr = argv[argIx++];
+	int argIx = 0;
+	std::string filepath = positional[argIx++];
+	std::string errorType = positional[argIx++];
+	int nKeyframes = std::stoi(positional[argIx++]);
+	std::string fixedKeyframesStr = positional[argIx++];
 	std::vector<int> fixedKeyframes;
 	if (strcmp(fixedKeyframesStr.c_str(), "x") != 0) {
 		fixedKeyframes = parseCSVString(fixedKeyframesStr);
 		std::sort(fixedKeyframes.begin(), fixedKeyframes.end());
 	}
+	int maxSpan = options.count("max-span") ? std::stoi(options["max-span"]) : 0;
+	std::string cacheDir = options.count("cache-dir") ? options["cache-dir"] : "";
+	int nThreads = options.count("threads") ? std::stoi(options["threads"]) : 0;
+	int decimate = options.count("decimate") ? std::stoi(options["decimate"]) : 1;
+	int refineWindow = options.count("window") ? std::stoi(options["window"]) : 0;
+	double tolerance = options.count("tolerance") ? std::stod(options["tolerance"]) : -1.0;
+	int spread = options.count("spread") ? std::stoi(options["spread"]) : 0;
+	if (tolerance >= 0.0 && decimate > 1) {
+		std::cerr << "A selection within a tolerance cannot also be made coarse to fine" << std::endl;
+		return 1;
+	}
+	std::string tracePath = options.count("instrument") ? options["instrument"] : "";
+	Profiler profiler(tracePath.length() > 0);
+	profiler.note("errorType", errorType);
+	profiler.note("maxKeyframes", nKeyframes);
+	profiler.note("fixedKeyframes", static_cast<int>(fixedKeyframes.size()));
+	profiler.note("threads", OS::threadsFor(nThreads));
+	if (tolerance >= 0.0) {
+		profiler.note("tolerance", tolerance);
+	}
 
 	std::cout << "----------------------------------" << std::endl;
 	std::cout << "Running on " << filepath << std::endl;
 	std::cout << "    using " << errorType << " based error function" << std::endl;
-	std::cout << "    find up to " << nKeyframes << " keyframes" << std::endl;
+	if (tolerance >= 0.0) {
+		std::cout << "    find the fewest keyframes with an error of at most " << tolerance << std::endl;
+	} else {
+		std::cout << "    find up to " << nKeyframes << " keyframes" << std::endl;
+	}
 	if (fixedKeyframes.size() == 0) {
 		std::cout << "    with no keyframes fixed" << std::endl;
 	} else {
@@ -63,12 +182,38 @@ int main (int argc, const char * argv[]) {
 		for (int i = 1; i < fixedKeyframes.size(); i++) { std::cout << ", " << fixedKeyframes[i]; }
 		std::cout << "] as fixed keyframes" << std::endl;
 	}
+	if (maxSpan > 0) {
+		std::cout << "    with keyframes at most " << maxSpan << " frames apart" << std::endl;
+	}
+	if (decimate > 1) {
+		std::cout << "    selecting on one frame in every " << decimate << ", then refining at full resolution" << std::endl;
+	}
 	std::cout << "----------------------------------" << std::endl;
 
 	
-	AnimationProxy anim = AnimationProxy::fromCSV(filepath);
+	profiler.begin("load");
+	AnimationProxy anim = AnimationProxy::load(filepath);
+	profiler.end();
+	if (anim.getNFrames() == 0) {
+		return 1;
+	}
+	if (options.count("save")) {
+		anim.save(options["save"]);
+	}
+
+	// The full poses are kept for the interpolation
+	AnimationProxy poses = anim;
+	int nComponents = options.count("components") ? std::stoi(options["components"]) : 0;
+	double variance = options.count("variance") ? std::stod(options["variance"]) : 0.0;
+	if (nComponents > 0 || variance > 0.0) {
+		profiler.begin("projection");
+		PoseProjection projection = PoseProjection::fit(anim.data, nComponents, variance);
+		anim = AnimationProxy(projection.project(anim.data));
+		profiler.end(projection.toJSON(errorType));
+		std::cout << "Selecting with the poses' principal components: " << projection.toJSON(errorType).str() << std::endl;
+	}
 	std::cout << "----------------------------------" << std::endl;
-	std::cout << "The animation has " << anim.getNFrames() << " frames and " << anim.getNDims() << " dimensions" << std::endl;
+	std::cout << "The animation has " << poses.getNFrames() << " frames and " << poses.getNDims() << " dimensions" << std::endl;
 	std::cout << "----------------------------------" << std::endl;
 
 	std::cout << "----------------------------------" << std::endl;
@@ -76,38 +221,85 @@ int main (int argc, const char * argv[]) {
 
 	std::cout << "    initializing manager... ";
 	auto start = std::chrono::high_resolution_clock::now();
-	SelectionManager manager(errorType, anim, fixedKeyframes);
-	auto end = std::chrono::high_resolution_clock::now();
-	double micros = std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count();
-	std::cout << " took " << micros << "ms" << std::endl;
-
-	std::cout << "    doing selection... ";
-	start = std::chrono::high_resolution_clock::now();
-	manager.incrementUntilNKeyframes(nKeyframes);
-	end = std::chrono::high_resolution_clock::now();
-	micros = std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count();
-	std::cout << " took " << micros << "ms" << std::endl;
-	
-	SelectionProxy proxy = manager.getFinalSelectionProxy();
+	ErrorTableCache* cache = NULL;
+	if (cacheDir.length() > 0) {
+		cache = &ErrorTableCache::shared();
+		cache->setDirectory(cacheDir);
+	}
+	SelectionProxy proxy;
+	if (decimate > 1) {
+		MultiresolutionSelector multiresolution(errorType, anim, fixedKeyframes, decimate, refineWindow, maxSpan, cache, nThreads, profiler.isEnabled() ? &profiler : NULL);
+		auto end = std::chrono::high_resolution_clock::now();
+		double micros = std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count();
+		std::cout << " took " << micros << "ms" << std::endl;
+
+		std::cout << "    doing selection coarse to fine... ";
+		start = std::chrono::high_resolution_clock::now();
+		proxy = multiresolution.select(nKeyframes);
+		end = std::chrono::high_resolution_clock::now();
+		micros = std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count();
+		std::cout << " took " << micros << "ms" << std::endl;
+		std::cout << "    " << multiresolution.toJSON().str() << std::endl;
+		if (cache != NULL) {
+			std::cout << "    error table cache: " << multiresolution.getCacheStats().toJSON().str() << std::endl;
+		}
+	} else {
+		SelectionManager manager(errorType, anim, fixedKeyframes, maxSpan, cache, nThreads, profiler.isEnabled() ? &profiler : NULL);
+		auto end = std::chrono::high_resolution_clock::now();
+		double micros = std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count();
+		std::cout << " took " << micros << "ms" << std::endl;
+		if (cache != NULL) {
+			std::cout << "    error table cache: " << manager.getCacheStats().toJSON().str() << std::endl;
+		}
+
+		std::cout << "    doing selection... ";
+		start = std::chrono::high_resolution_clock::now();
+		if (tolerance >= 0.0) {
+			proxy = manager.selectWithinTolerance(static_cast<float>(tolerance), spread);
+		} else {
+			manager.incrementUntilNKeyframes(nKeyframes);
+			proxy = manager.getFinalSelectionProxy();
+		}
+		end = std::chrono::high_resolution_clock::now();
+		micros = std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count();
+		std::cout << " took " << micros << "ms" << std::endl;
+
+		if (profiler.isEnabled()) {
+			manager.addSegmentsTo(profiler);
+		}
+	}
 	std::cout << "Final selections:" << std::endl;
 
-	for (int i = proxy.getMinKeyframes(); i < proxy.getMaxKeyframes(); i++) {
+	// Within a tolerance, every selection found is shown with its error (some counts may be
+	// missing, where a better selection needs fewer keyframes), and the fewest keyframes
+	// that meet the tolerance are the ones interpolated
+	int lastShown = tolerance >= 0.0 ? proxy.getMaxKeyframes() : proxy.getMaxKeyframes() - 1;
+	if (tolerance >= 0.0) { nKeyframes = proxy.getMaxKeyframes(); }
+	for (int i = proxy.getMinKeyframes(); i <= lastShown; i++) {
 		std::vector<int> keyframes = proxy.getSelectionByNKeyframes(i);
+		if (keyframes.empty()) { continue; }
 		std::cout << "    " << keyframes.size() << ": [" << keyframes[0];
 		for (int i = 1; i < keyframes.size(); i++) {
 			std::cout << ", " << keyframes[i];
 		}
-		std::cout << "]" << std::endl;
+		std::cout << "]";
+		if (tolerance >= 0.0) {
+			std::cout << " error " << proxy.getErrorByNKeyframes(i);
+			if (proxy.getErrorByNKeyframes(i) <= tolerance && nKeyframes > i) { nKeyframes = i; }
+		}
+		std::cout << std::endl;
 	}
 	std::cout << "----------------------------------" << std::endl;
 
 
 	std::cout << "----------------------------------" << std::endl;
 	std::cout << "Starting interpolation:" << std::endl;
-	std::vector<int> keyframes = proxy.getSelectionByNKeyframes(nKeyframes);
+	std::vector<int> keyframes = proxy.getSelectionByNKeyframes(std::max(nKeyframes, proxy.getMinKeyframes()));
 	int curveIx = 1;
-	Eigen::MatrixXf curve = anim.curveByIndex(curveIx);
+	Eigen::MatrixXf curve = poses.curveByIndex(curveIx);
+	profiler.begin("interpolate");
 	std::vector<HighDimCubic> cubics = Interpolate::optimal(curve, keyframes);
+	profiler.end();
 
 	std::ostringstream os2;
 	os2 << "Fitting: " << std::endl;
@@ -123,5 +315,56 @@ int main (int argc, const char * argv[]) {
 	
 	std::cout << os2.str() << std::endl;
 
+	// Every curve is fitted again for the export, and the result is read back to measure
+	// how far it is from the original poses at each frame
+	if (options.count("export")) {
+		std::string exportPath = options["export"];
+		profiler.begin("export");
+		CompressedAnimationWriter writer(exportPath);
+		if (writer.add(filepath, poses.data, keyframes, nThreads) != 0 || writer.close() != 0) {
+			std::cerr << "Failed to write the compressed animation to " << exportPath << std::endl;
+			return 1;
+		}
+		CompressedAnimation compressed(exportPath);
+		if (!compressed.isOpen()) {
+			return 1;
+		}
+		int nCurves = poses.getNDims() - 1;
+		std::vector<float> frames(poses.getNFrames());
+		for (int f = 0; f < poses.getNFrames(); f++) { frames[f] = poses.data(0, f); }
+		std::vector<float> values(frames.size() * nCurves);
+		CurveSampler::sample(compressed.clip(0), frames.data(), static_cast<int>(frames.size()), values.data());
+		double maxError = 0.0, sumSquared = 0.0;
+		for (int f = 0; f < poses.getNFrames(); f++) {
+			for (int c = 0; c < nCurves; c++) {
+				double error = fabs(values[static_cast<size_t>(f) * nCurves + c] - poses.data(c + 1, f));
+				maxError = std::max(maxError, error);
+				sumSquared += error * error;
+			}
+		}
+
+		JSONObject details;
+		details.set("path", exportPath);
+		details.set("bytes", static_cast<long long>(compressed.size()));
+		details.set("sourceBytes", static_cast<long long>(poses.data.size() * sizeof(float)));
+		details.set("ratio", poses.data.size() * sizeof(float) / double(compressed.size()));
+		details.set("keyframes", compressed.clip(0).nKeyframes);
+		details.set("maxError", maxError);
+		details.set("rmsError", values.empty() ? 0.0 : sqrt(sumSquared / values.size()));
+		profiler.end(details);
+		std::cout << "----------------------------------" << std::endl;
+		std::cout << "Exported: " << details.str() << std::endl;
+		std::cout << "----------------------------------" << std::endl;
+	}
+
+	if (profiler.isEnabled()) {
+		if (tracePath == "-") {
+			std::cout << profiler.report().str() << std::endl;
+		} else if (profiler.writeTrace(tracePath) != 0) {
+			std::cerr << "Failed to write the profile to " << tracePath << std::endl;
+			return 1;
+		}
+	}
+
     return 0;
 }
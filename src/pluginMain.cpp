@@ -7,8 +7,14 @@
 #include <maya/MStatus.h>
 
 #include "SelectCommand.hpp"
+#include "SelectJobCommand.hpp"
 #include "ReduceCommand.hpp"
+#include "ReduceBatchCommand.hpp"
+#include "ApplyReductionCommand.hpp"
+#include "SampleCommand.hpp"
 #include "MayaUtils.hpp"
+#include "ErrorTableCache.hpp"
+#include "SelectionJob.hpp"
 
 MStatus initializePlugin(MObject obj) {
     MStatus status;
@@ -17,8 +23,20 @@ MStatus initializePlugin(MObject obj) {
 	status = plugin.registerCommand(SelectCommand::kName, SelectCommand::creator);
     if (status != MS::kSuccess) { Log::error(std::string(SelectCommand::kName) + " failed to register"); }
 
+    status = plugin.registerCommand(SelectJobCommand::kName, SelectJobCommand::creator);
+    if (status != MS::kSuccess) { Log::error(std::string(SelectJobCommand::kName) + " failed to register"); }
+
     status = plugin.registerCommand(ReduceCommand::kName, ReduceCommand::creator);
     if (status != MS::kSuccess) { Log::error(std::string(ReduceCommand::kName) + " failed to register"); }
+
+    status = plugin.registerCommand(SampleCommand::kName, SampleCommand::creator);
+    if (status != MS::kSuccess) { Log::error(std::string(SampleCommand::kName) + " failed to register"); }
+
+    status = plugin.registerCommand(ReduceBatchCommand::kName, ReduceBatchCommand::creator);
+    if (status != MS::kSuccess) { Log::error(std::string(ReduceBatchCommand::kName) + " failed to register"); }
+
+    status = plugin.registerCommand(ApplyReductionCommand::kName, ApplyReductionCommand::creator);
+    if (status != MS::kSuccess) { Log::error(std::string(ApplyReductionCommand::kName) + " failed to register"); }
     
     return status;
 }
@@ -26,12 +44,29 @@ MStatus initializePlugin(MObject obj) {
 MStatus uninitializePlugin(MObject obj) {
     MStatus status;
     MFnPlugin plugin(obj);
+
+    // Stop any selections still running in the background, then release the error tables
+    // kept between selections
+    SelectionJob::releaseAll();
+    ErrorTableCache::shared().clear();
     
 	status = plugin.deregisterCommand(SelectCommand::kName);
     if (status != MS::kSuccess) { Log::error(std::string(SelectCommand::kName) + " failed to deregister"); }
 
+    status = plugin.deregisterCommand(SelectJobCommand::kName);
+    if (status != MS::kSuccess) { Log::error(std::string(SelectJobCommand::kName) + " failed to deregister"); }
+
     status = plugin.deregisterCommand(ReduceCommand::kName);
     if (status != MS::kSuccess) { Log::error(std::string(ReduceCommand::kName) + " failed to deregister"); }
+
+    status = plugin.deregisterCommand(SampleCommand::kName);
+    if (status != MS::kSuccess) { Log::error(std::string(SampleCommand::kName) + " failed to deregister"); }
+
+    status = plugin.deregisterCommand(ReduceBatchCommand::kName);
+    if (status != MS::kSuccess) { Log::error(std::string(ReduceBatchCommand::kName) + " failed to deregister"); }
+
+    status = plugin.deregisterCommand(ApplyReductionCommand::kName);
+    if (status != MS::kSuccess) { Log::error(std::string(ApplyReductionCommand::kName) + " failed to deregister"); }
     
     return status;
 }
@@ -0,0 +1,126 @@
+// Regression test for CurveErrorEngine:
+//   - a row's errors must not depend on where a run of spans starts. For every row of a
+//     few synthetic clips, computeRow is called from start frames inside and at the edges
+//     of warm-start chains, and must give exactly the errors in the ErrorTable, whose
+//     tiles cover each row from its first span.
+//   - the errors must stay close to the reference fit's (CubicFitter::fit, which
+//     HighDimCubic::fitToCurve uses) on a smooth clip and on rough random walks, for
+//     every span including those far longer than a warm-start chain.
+//
+// Usage: curveErrorEngineTest (exits non-zero on a mismatch)
+
+#include <math.h>
+#include <algorithm>
+#include <iostream>
+#include <random>
+#include <vector>
+
+#include "../bench/SyntheticMotion.hpp"
+#include "../src/AnimationProxy.hpp"
+#include "../src/CubicFitter.hpp"
+#include "../src/CurveErrorEngine.hpp"
+#include "../src/ErrorTable.hpp"
+
+// Errors below this fraction of the clip's largest span error are compared to it instead,
+// as relative differences between near-zero errors are just rounding
+#define REFERENCE_FLOOR 1e-4f
+
+// A random walk led by the frame number, as the plug-in samples poses
+static Eigen::MatrixXf randomWalk(int nFrames, int nDims, float stepSize, unsigned int seed) {
+	std::mt19937 rng(seed);
+	std::normal_distribution<float> step(0.0f, stepSize);
+	Eigen::MatrixXf data(nDims, nFrames);
+	for (int f = 0; f < nFrames; f++) {
+		data(0, f) = static_cast<float>(f);
+		for (int d = 1; d < nDims; d++) {
+			data(d, f) = (f > 0 ? data(d, f - 1) : 0.0f) + step(rng);
+		}
+	}
+	return data;
+}
+
+static int check(const Eigen::MatrixXf& data, int maxSpan) {
+	AnimationProxy anim(data);
+	ErrorTable table = ErrorTable::usingCurveBasedError(anim, maxSpan);
+	CurveErrorEngine engine(anim.data);
+	CubicFitter fitter(static_cast<int>(data.rows()));
+	std::vector<float> row(data.cols());
+
+	// Runs start at every length up to just past the second chain restart, and end at
+	// the table's band
+	int nFrames = anim.getNFrames();
+	int nFailures = 0;
+	for (int i = 0; i < nFrames - 1; i++) {
+		int jTo = std::min(nFrames - 1, i + table.getMaxSpan());
+		for (int length = 1; length <= std::min(jTo - i, 2 * CURVE_WARM_START_SPANS + 3); length++) {
+			int jFrom = i + length;
+			engine.computeRow(i, jFrom, jTo, row.data(), fitter);
+			for (int j = jFrom; j <= jTo; j++) {
+				if (row[j - jFrom] != table.errorValue(i, j)) {
+					if (nFailures < 10) {
+						std::cerr << "  span (" << i << ", " << j << ") from " << jFrom << ": " << row[j - jFrom] << " but the table has " << table.errorValue(i, j) << std::endl;
+					}
+					nFailures++;
+				}
+			}
+		}
+	}
+	return nFailures;
+}
+
+// Compares every span of the table with the reference fit: the excess over the reference
+// must be within p99Tolerance for 99% of spans and within maxTolerance for all of them
+static bool checkAgainstReference(const Eigen::MatrixXf& data, float p99Tolerance, float maxTolerance) {
+	AnimationProxy anim(data);
+	ErrorTable table = ErrorTable::usingCurveBasedError(anim);
+	CubicFitter fitter(static_cast<int>(data.rows()));
+
+	int nFrames = anim.getNFrames();
+	std::vector<float> references;
+	std::vector<float> values;
+	for (int i = 0; i < nFrames; i++) {
+		for (int j = i + 4; j < nFrames; j++) {
+			fitter.fit(anim.data, i, j);
+			references.push_back(fitter.spanError(i, j).second);
+			values.push_back(table.errorValue(i, j));
+		}
+	}
+
+	float floor = REFERENCE_FLOOR * *std::max_element(references.begin(), references.end());
+	std::vector<float> excess(references.size());
+	for (size_t s = 0; s < references.size(); s++) {
+		excess[s] = (values[s] - references[s]) / std::max(references[s], floor);
+	}
+	std::sort(excess.begin(), excess.end());
+	float p99 = excess[excess.size() * 99 / 100];
+	float max = excess.back();
+
+	bool ok = p99 <= p99Tolerance && max <= maxTolerance;
+	std::cout << (ok ? "ok     " : "FAILED ") << nFrames << " frames, " << data.rows() << " dims against the reference fit: ";
+	std::cout << "p99 " << 100.0f * p99 << "%, max " << 100.0f * max << "%" << std::endl;
+	return ok;
+}
+
+int main() {
+	int cases[][4] = {
+		// nFrames, nDims, maxSpan, seed
+		{ 5, 4, 0, 1 },
+		{ 40, 7, 0, 2 },
+		{ 110, 5, 0, 3 },
+		{ 150, 13, 70, 4 },
+	};
+
+	int nFailed = 0;
+	for (int c = 0; c < static_cast<int>(sizeof(cases) / sizeof(cases[0])); c++) {
+		int nFailures = check(SyntheticMotion::generate(cases[c][0], cases[c][1], cases[c][3]), cases[c][2]);
+		std::cout << (nFailures == 0 ? "ok     " : "FAILED ") << cases[c][0] << " frames, " << cases[c][1] << " dims, maxSpan " << cases[c][2];
+		if (nFailures > 0) { std::cout << ": " << nFailures << " spans differ"; }
+		std::cout << std::endl;
+		if (nFailures > 0) { nFailed++; }
+	}
+
+	if (!checkAgainstReference(SyntheticMotion::generate(240, 12, 5), 0.01f, 0.025f)) { nFailed++; }
+	if (!checkAgainstReference(randomWalk(240, 9, 1.0f, 6), 0.05f, 0.3f)) { nFailed++; }
+	if (!checkAgainstReference(randomWalk(240, 5, 10.0f, 7), 0.25f, 1.5f)) { nFailed++; }
+	return nFailed == 0 ? 0 : 1;
+}
@@ -0,0 +1,121 @@
+// Regression test for LineErrorEngine: every span of a few random clips, with and without
+// a maximum span, must have the same error index and value as the per-pair computation
+// that usingLineBasedError used before the engine (indexAndErrorViaMaxPerpDistToLine).
+//
+// Usage: lineErrorEngineTest (exits non-zero on a mismatch)
+
+#include <math.h>
+#include <algorithm>
+#include <iostream>
+#include <random>
+#include <utility>
+#include <vector>
+
+#include "../src/AnimationProxy.hpp"
+#include "../src/ErrorTable.hpp"
+#include "../src/LineErrorEngine.hpp"
+
+// Values are compared with this relative tolerance, as the engine sums in a different order.
+// Indices must match, except where the two poses' distances are the same to this tolerance.
+#define VALUE_TOLERANCE 1e-4f
+
+// The reference: the distance of pose k from the line joining poses i and j
+static float referenceDistance(AnimationProxy& anim, int i, int j, int k) {
+	Eigen::VectorXf a = anim.poseByIndex(i);
+	Eigen::VectorXf b = anim.poseByIndex(j);
+	float distEnd2End = (a - b).norm();
+	Eigen::VectorXf vnEnd2End = (a - b) / distEnd2End;
+
+	Eigen::VectorXf c = anim.poseByIndex(k);
+	float dot = (c - a).dot(vnEnd2End);
+	Eigen::VectorXf p = a + dot * vnEnd2End;
+	return (p - c).norm();
+}
+
+// The reference: the pose between i and j furthest from the line joining them
+static std::pair<int, float> referenceIndexAndError(AnimationProxy& anim, int i, int j) {
+	float maxDist = 0.0f;
+	int maxIndex = -1;
+	for (int k = i + 1; k < j; k++) {
+		float dist = referenceDistance(anim, i, j, k);
+		if (dist > maxDist) {
+			maxDist = dist;
+			maxIndex = k;
+		}
+	}
+	return std::make_pair(maxIndex, maxDist);
+}
+
+// A random walk led by the frame number, as the plug-in samples poses
+static Eigen::MatrixXf randomClip(int nFrames, int nDims, unsigned int seed) {
+	std::mt19937 rng(seed);
+	std::normal_distribution<float> step(0.0f, 1.0f);
+	Eigen::MatrixXf data(nDims, nFrames);
+	for (int f = 0; f < nFrames; f++) {
+		data(0, f) = static_cast<float>(f);
+		for (int d = 1; d < nDims; d++) {
+			data(d, f) = (f > 0 ? data(d, f - 1) : 0.0f) + step(rng);
+		}
+	}
+	return data;
+}
+
+static bool sameValue(float expected, float actual) {
+	return fabs(expected - actual) <= VALUE_TOLERANCE * std::max(1.0f, fabs(expected));
+}
+
+// Compares every span in the table's band, and each row as computeRow gives it
+static int check(const Eigen::MatrixXf& data, int maxSpan) {
+	AnimationProxy anim(data);
+	ErrorTable table = ErrorTable::usingLineBasedError(anim, maxSpan);
+	LineErrorEngine engine(anim.data);
+	LineErrorEngine::Workspace workspace(static_cast<int>(data.rows()), static_cast<int>(data.cols()));
+	std::vector<float> row(data.cols());
+
+	int nFrames = anim.getNFrames();
+	int nFailures = 0;
+	for (int i = 0; i < nFrames - 1; i++) {
+		int jTo = std::min(nFrames - 1, i + table.getMaxSpan());
+		engine.computeRow(i, i + 1, jTo, row.data(), workspace);
+
+		for (int j = i + 1; j <= jTo; j++) {
+			std::pair<int, float> expected = referenceIndexAndError(anim, i, j);
+			int index = table.errorIndex(i, j);
+			float value = table.errorValue(i, j);
+			// Where two poses are equally far from the line (to rounding), either may be chosen
+			bool sameIndex = index == expected.first || (index > i && index < j && sameValue(expected.second, referenceDistance(anim, i, j, index)));
+			if (!sameIndex || !sameValue(expected.second, value) || !sameValue(expected.second, row[j - i - 1])) {
+				if (nFailures < 10) {
+					std::cerr << "  span (" << i << ", " << j << "): expected " << expected.first << ", " << expected.second;
+					std::cerr << " but the table has " << index << ", " << value << " and the row " << row[j - i - 1] << std::endl;
+				}
+				nFailures++;
+			}
+		}
+	}
+	return nFailures;
+}
+
+int main() {
+	int cases[][4] = {
+		// nFrames, nDims, maxSpan, seed
+		{ 2, 3, 0, 1 },
+		{ 3, 3, 0, 2 },
+		{ 4, 7, 0, 3 },
+		{ 60, 4, 0, 4 },
+		{ 150, 13, 0, 5 },
+		{ 300, 25, 40, 6 },
+		{ 400, 8, 3, 7 },
+		{ 700, 6, 300, 8 },
+	};
+
+	int nFailed = 0;
+	for (int c = 0; c < static_cast<int>(sizeof(cases) / sizeof(cases[0])); c++) {
+		int nFailures = check(randomClip(cases[c][0], cases[c][1], cases[c][3]), cases[c][2]);
+		std::cout << (nFailures == 0 ? "ok     " : "FAILED ") << cases[c][0] << " frames, " << cases[c][1] << " dims, maxSpan " << cases[c][2];
+		if (nFailures > 0) { std::cout << ": " << nFailures << " spans differ"; }
+		std::cout << std::endl;
+		if (nFailures > 0) { nFailed++; }
+	}
+	return nFailed == 0 ? 0 : 1;
+}